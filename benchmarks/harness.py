@@ -0,0 +1,364 @@
+"""
+Synthetic data and request timings for performance work.
+
+Kept out of the staff app: nothing here is loaded by the site itself, only
+by the benchmark commands and the tests.
+
+seed_staff()/seed_verification_logs() fill a database with realistic
+volumes of benchmark rows (staff IDs start with SEED_PREFIX so they can be
+told apart and removed). run_benchmarks() times the main pages in-process
+with the test client and reports latency percentiles and query counts;
+compare_results() flags regressions against an earlier run's JSON.
+"""
+import math
+import platform
+import random
+import time
+from datetime import date, datetime, time as day_time, timedelta
+from itertools import cycle, islice
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from staff.analytics import rebuild_hourly_counts
+from staff.log_storage import ensure_partitions, is_partitioned, rebuild_daily_counts
+from staff.models import RevocationEvent, Staff, VerificationDailyCount, VerificationLog
+from staff.offline import record_status_changes
+
+SEED_PREFIX = 'BM'
+BENCHMARK_USERNAME = 'benchmark'
+PERCENTILES = (50, 90, 95, 99)
+
+FIRST_NAMES = (
+    'Abubakar', 'Aisha', 'Amina', 'Bala', 'Blessing', 'Chidi', 'Chioma', 'Emeka', 'Fatima', 'Garba',
+    'Halima', 'Ibrahim', 'Ifeoma', 'Kabiru', 'Kemi', 'Musa', 'Ngozi', 'Nura', 'Olumide', 'Sadiq',
+    'Safiya', 'Tunde', 'Umar', 'Yetunde', 'Zainab',
+)
+LAST_NAMES = (
+    'Abdullahi', 'Adamu', 'Adeyemi', 'Aliyu', 'Bello', 'Danjuma', 'Eze', 'Garba', 'Hassan', 'Ibrahim',
+    'Lawal', 'Mohammed', 'Musa', 'Nwosu', 'Obi', 'Okafor', 'Okeke', 'Sani', 'Suleiman', 'Usman',
+    'Yakubu', 'Yusuf',
+)
+POSITIONS = {
+    'medical': ('Consultant', 'Senior Registrar', 'Registrar', 'House Officer'),
+    'nursing': ('Chief Nursing Officer', 'Nursing Officer I', 'Nursing Officer II', 'Staff Nurse'),
+    'admin': ('Principal Executive Officer', 'Executive Officer', 'Clerical Officer'),
+    'lab': ('Medical Laboratory Scientist', 'Laboratory Technician'),
+    'pharmacy': ('Chief Pharmacist', 'Pharmacist', 'Pharmacy Technician'),
+    'radiology': ('Senior Radiographer', 'Radiographer', 'Sonographer'),
+    'support': ('Porter', 'Driver', 'Security Officer', 'Cleaner'),
+}
+# Most of the workforce is clinical; support and admin are smaller
+DEPARTMENT_WEIGHTS = {'medical': 20, 'nursing': 35, 'admin': 10, 'lab': 8, 'pharmacy': 6, 'radiology': 5,
+                      'support': 16}
+STATUS_WEIGHTS = {'active': 90, 'suspended': 3, 'expired': 7}
+USER_AGENTS = (
+    'Mozilla/5.0 (Linux; Android 13; SM-A145F) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 Version/17.1 Mobile Safari/604.1',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+    'StaffID-Scanner/2.1 (Android)',
+)
+# Verifications are skewed towards a minority of staff (gate and ward scans)
+LOG_SKEW = 3
+
+
+def seeded_staff():
+    return Staff.objects.filter(staff_id__startswith=f"{SEED_PREFIX}-")
+
+
+def _staff_rows(count, start, rng):
+    today = date.today()
+    departments, department_weights = zip(*DEPARTMENT_WEIGHTS.items())
+    statuses, status_weights = zip(*STATUS_WEIGHTS.items())
+    for number in range(start, start + count):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        department = rng.choices(departments, department_weights)[0]
+        date_joined = today - timedelta(days=rng.randint(0, 25 * 365))
+        yield Staff(
+            staff_id=f"{SEED_PREFIX}-{number:07d}",
+            first_name=first_name,
+            last_name=last_name,
+            email=f"{first_name}.{last_name}.{number}@example.com".lower(),
+            phone=f"080{rng.randint(0, 99999999):08d}",
+            department=department,
+            position=rng.choice(POSITIONS[department]),
+            date_joined=date_joined,
+            date_expiry=today + timedelta(days=rng.randint(-180, 4 * 365)),
+            status=rng.choices(statuses, status_weights)[0],
+        )
+
+
+def seed_staff(count, batch_size=5000, seed=None):
+    """Add `count` benchmark staff; returns how many were created"""
+    rng = random.Random(seed)
+    start = seeded_staff().count() + 1
+    rows = _staff_rows(count, start, rng)
+    created = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        with transaction.atomic():
+            Staff.objects.bulk_create(batch)
+            record_status_changes(batch)
+            # created_at is auto_now_add; spread it over the joining dates so keyset pages look real
+            for staff in batch:
+                staff.created_at = timezone.make_aware(datetime.combine(staff.date_joined, day_time.min))
+            Staff.objects.bulk_update(batch, ['created_at'], batch_size=1000)
+        created += len(batch)
+    return created
+
+
+def _log_window(days):
+    end = timezone.now()
+    return end - timedelta(days=days), end
+
+
+def _seed_logs_postgresql(count, days, batch_size, seed):
+    table = connection.ops.quote_name(VerificationLog._meta.db_table)
+    staff_table = connection.ops.quote_name(Staff._meta.db_table)
+    # Generated server-side: nothing is sent over the wire but the batch size
+    sql = (
+        f"WITH pool AS (SELECT array_agg(id ORDER BY id) AS ids FROM {staff_table} WHERE staff_id LIKE %s) "
+        f"INSERT INTO {table} (staff_id, verified_by_id, ip_address, user_agent, verified_at) "
+        f"SELECT ids[1 + floor(power(random(), %s) * cardinality(ids))::int], NULL, "
+        f"('10.' || floor(random() * 256)::int || '.' || floor(random() * 256)::int || '.' "
+        f"|| floor(random() * 256)::int)::inet, "
+        f"(%s::text[])[1 + floor(random() * %s)::int], "
+        f"%s - random() * make_interval(days => %s) "
+        f"FROM pool, generate_series(1, %s)"
+    )
+    _, end = _log_window(days)
+    with connection.cursor() as cursor:
+        if seed is not None:
+            cursor.execute("SELECT setseed(%s)", [(seed % 1000) / 1000])
+        remaining = count
+        while remaining > 0:
+            size = min(batch_size, remaining)
+            with transaction.atomic():
+                cursor.execute(sql, [f"{SEED_PREFIX}-%", LOG_SKEW, list(USER_AGENTS), len(USER_AGENTS),
+                                     end, days, size])
+            remaining -= size
+
+
+def _seed_logs_python(count, days, batch_size, seed):
+    rng = random.Random(seed)
+    ids = list(seeded_staff().order_by('id').values_list('id', flat=True))
+    start, _ = _log_window(days)
+    window = days * 86400
+    remaining = count
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        VerificationLog.objects.bulk_create([
+            VerificationLog(
+                staff_id=ids[int(rng.random() ** LOG_SKEW * len(ids))],
+                ip_address=f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+                user_agent=rng.choice(USER_AGENTS),
+                verified_at=start + timedelta(seconds=rng.random() * window),
+            )
+            for _ in range(size)
+        ])
+        remaining -= size
+
+
+def seed_verification_logs(count, days=365, batch_size=100000, seed=None):
+    """
+    Add `count` verification log rows for the benchmark staff over the last `days` days.
+
+    Scans are skewed towards a minority of staff. The daily rollup and the
+    hourly analytics counts are rebuilt for the window afterwards, since the
+    rows bypass the log writer.
+    """
+    if not seeded_staff().exists():
+        raise ValueError("Seed benchmark staff before verification logs")
+    if is_partitioned():
+        ensure_partitions(since=_log_window(days)[0])
+
+    if connection.vendor == 'postgresql':
+        _seed_logs_postgresql(count, days, batch_size, seed)
+    else:
+        _seed_logs_python(count, days, min(batch_size, 10000), seed)
+    rebuild_daily_counts(since=timezone.localdate(_log_window(days)[0]))
+    rebuild_hourly_counts(since=timezone.localdate(_log_window(days)[0]))
+    return count
+
+
+def clear_seeded_data():
+    """Remove benchmark staff with their logs, rollup rows and revocation events, then recount the hourly analytics"""
+    staff = seeded_staff()
+    VerificationLog.objects.filter(staff__in=staff).delete()
+    VerificationDailyCount.objects.filter(staff__in=staff).delete()
+    RevocationEvent.objects.filter(staff_uuid__in=staff.values('uuid')).delete()
+    deleted, _ = staff.delete()
+    rebuild_hourly_counts()
+    return deleted
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarise(timings, query_counts):
+    timings = sorted(timings)
+    summary = {
+        'requests': len(timings),
+        'min_ms': round(timings[0], 2),
+        'mean_ms': round(sum(timings) / len(timings), 2),
+        'max_ms': round(timings[-1], 2),
+    }
+    summary.update({f"p{percent}_ms": round(percentile(timings, percent), 2) for percent in PERCENTILES})
+    summary['queries_mean'] = round(sum(query_counts) / len(query_counts), 2)
+    summary['queries_max'] = max(query_counts)
+    return summary
+
+
+def _sample_staff(size, seed):
+    """Random staff, benchmark rows first; primary keys are sampled so no full-table ORDER BY random()"""
+    queryset = seeded_staff() if seeded_staff().exists() else Staff.objects.all()
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    rng = random.Random(seed)
+    low, high = bounds['low'], bounds['high']
+    picks = {rng.randint(low, high) for _ in range(size * 2)}
+    sample = list(queryset.filter(id__in=picks)[:size])
+    if len(sample) < size:
+        sample += list(queryset.exclude(id__in=picks)[:size - len(sample)])
+    rng.shuffle(sample)
+    return sample
+
+
+def scenarios(sample):
+    """
+    (name, url, cold) for every request to time.
+
+    Each staff-specific scenario visits a different staff member per
+    request. Cold scenarios drop the staff member's cached PDFs and verify
+    record first; the matching *_cached scenario then hits the warm cache.
+    """
+    urls = {}
+    departments = cycle(DEPARTMENT_WEIGHTS)
+    list_url = reverse('staff:staff_list')
+    dashboard_url = reverse('staff:verification_dashboard')
+    for staff in sample:
+        urls.setdefault('verify_staff', []).append((reverse('staff:verify', args=[staff.uuid]), True))
+        urls.setdefault('verify_staff_cached', []).append((reverse('staff:verify', args=[staff.uuid]), False))
+        urls.setdefault('staff_list', []).append((list_url, False))
+        urls.setdefault('staff_list_department', []).append((f"{list_url}?department={next(departments)}", False))
+        urls.setdefault('staff_list_status', []).append((f"{list_url}?status=suspended", False))
+        urls.setdefault('staff_list_search_name', []).append((f"{list_url}?q={staff.last_name}", False))
+        urls.setdefault('staff_list_search_id', []).append((f"{list_url}?q={staff.staff_id[:-2]}", False))
+        urls.setdefault('staff_detail', []).append((reverse('staff:staff_detail', args=[staff.uuid]), False))
+        urls.setdefault('verification_dashboard', []).append((f"{dashboard_url}?days=90", False))
+        for name in ('download_card_pdf', 'download_qr_sticker'):
+            url = reverse(f'staff:{name}', args=[staff.uuid])
+            urls.setdefault(name, []).append((url, True))
+            urls.setdefault(f"{name}_cached", []).append((url, False))
+    return urls
+
+
+def _get(client, url):
+    response = client.get(url)
+    if response.streaming:
+        # PDFs stream from the cache, so reading the body is part of the cost;
+        # the test client closes the response once it is consumed
+        b''.join(response.streaming_content)
+    return response
+
+
+def _time_request(client, url):
+    with CaptureQueriesContext(connections['default']) as queries:
+        start = time.perf_counter()
+        response = _get(client, url)
+        elapsed = (time.perf_counter() - start) * 1000
+    return response.status_code, elapsed, len(queries)
+
+
+def run_benchmarks(requests=50, warmup=3, only=None, seed=None):
+    """Time each scenario `requests` times and return the results as a JSON-ready dict"""
+    from staff.log_writer import log_writer
+    from staff.utils import regenerate_qr_codes
+
+    sample = _sample_staff(requests, seed)
+    if not sample:
+        raise ValueError("There are no staff to benchmark; run seed_benchmark_data first")
+    # Benchmark rows are bulk-created without QR codes, which the cards embed
+    regenerate_qr_codes(sample, workers=1)
+
+    user, created = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+    if created:
+        user.set_unusable_password()
+        user.save(update_fields=['password'])
+    client = Client()
+    client.force_login(user)
+
+    results = {}
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for name, urls in scenarios(sample).items():
+            if only and name not in only:
+                continue
+            for url, _cold in urls[:warmup]:
+                _get(client, url)
+            # Each request visits a different staff member, so one pass leaves every cold one uncached
+            Staff.bulk_invalidate_caches(staff.uuid for (url, cold), staff in zip(urls, sample) if cold)
+
+            timings, query_counts = [], []
+            for url, cold in urls:
+                status, elapsed, query_count = _time_request(client, url)
+                if status != 200:
+                    raise RuntimeError(f"{name}: GET {url} returned {status}")
+                timings.append(elapsed)
+                query_counts.append(query_count)
+            results[name] = summarise(timings, query_counts)
+    log_writer.flush()
+
+    return {
+        'run_at': timezone.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'card_pdf_engine': getattr(settings, 'CARD_PDF_ENGINE', 'html'),
+        },
+        'data': {
+            'staff': Staff.objects.count(),
+            'verification_logs': VerificationLog.objects.count(),
+        },
+        'requests': requests,
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, threshold=0.2):
+    """
+    Regressions of `current` against `baseline`, as readable messages.
+
+    A scenario regresses when its p95 latency grows by more than
+    `threshold` (a fraction) or it makes more queries per request.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(
+                f"{name}: p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms "
+                f"(+{(result['p95_ms'] / before['p95_ms'] - 1) * 100:.0f}%)"
+            )
+        if result['queries_mean'] > before['queries_mean']:
+            regressions.append(
+                f"{name}: queries per request {before['queries_mean']} -> {result['queries_mean']}"
+            )
+    return regressions
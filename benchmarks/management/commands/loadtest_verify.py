@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from benchmarks.harness import percentile
+from staff.models import Staff
+
+
+def _cpu_seconds(pids):
+    """User + system CPU time of processes and their reaped children (Linux /proc)"""
+    ticks = os.sysconf('SC_CLK_TCK')
+    total = 0
+    for pid in pids:
+        with open(f'/proc/{pid}/stat') as fileobj:
+            # Fields after the parenthesised command name; utime, stime, cutime, cstime are 14-17
+            fields = fileobj.read().rsplit(')', 1)[1].split()
+        total += sum(int(value) for value in fields[11:15])
+    return total / ticks
+
+
+async def _read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def _client(host, port, host_header, paths, deadline, latencies, failures):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            path = random.choice(paths)
+            start = time.perf_counter()
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: {host_header}\r\nUser-Agent: StaffID-LoadTest\r\n\r\n".encode()
+            )
+            status, keep_alive = await _read_response(reader)
+            elapsed = (time.perf_counter() - start) * 1000
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                failures.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            failures.append('connection')
+            if writer is not None:
+                writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _run(base_url, paths, concurrency, duration):
+    parts = urlsplit(base_url)
+    port = parts.port or 80
+    latencies, failures = [], []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(
+        _client(parts.hostname, port, parts.netloc, paths, deadline, latencies, failures)
+        for _ in range(concurrency)
+    ))
+    return latencies, failures
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the verify page of a running server with concurrent keep-alive scanners, "
+        "e.g. to compare WSGI (gunicorn) and ASGI (uvicorn) deployments"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the server under test")
+        parser.add_argument('--concurrency', type=int, default=64, help="Simultaneous scanner connections")
+        parser.add_argument('--duration', type=float, default=20, help="Seconds to run")
+        parser.add_argument('--staff', type=int, default=1000, help="Distinct staff members to verify")
+        parser.add_argument('--server-pid', type=int, action='append', default=[], dest='server_pids',
+                            help="Server process id (repeatable) to report requests per CPU-second")
+        parser.add_argument('--output', help="Also write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        uuids = list(Staff.objects.order_by('?').values_list('uuid', flat=True)[:options['staff']])
+        if not uuids:
+            raise CommandError("There are no staff to verify; run seed_benchmark_data first")
+        paths = [reverse('staff:verify', args=[uuid]) for uuid in uuids]
+
+        cpu_before = _cpu_seconds(options['server_pids']) if options['server_pids'] else None
+        started = time.monotonic()
+        latencies, failures = asyncio.run(
+            _run(options['url'], paths, options['concurrency'], options['duration'])
+        )
+        elapsed = time.monotonic() - started
+
+        latencies.sort()
+        report = {
+            'url': options['url'],
+            'concurrency': options['concurrency'],
+            'duration_s': round(elapsed, 2),
+            'requests': len(latencies),
+            'failures': len(failures),
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            **{f"p{percent}_ms": round(percentile(latencies, percent) or 0, 2) for percent in (50, 95, 99)},
+        }
+        if cpu_before is not None:
+            cpu = _cpu_seconds(options['server_pids']) - cpu_before
+            report['server_cpu_s'] = round(cpu, 2)
+            report['requests_per_cpu_second'] = round(len(latencies) / cpu, 1) if cpu else None
+
+        for key, value in report.items():
+            self.stdout.write(f"{key:<26}{value}")
+        if failures:
+            self.stderr.write(f"Failures: {sorted(set(map(str, failures)))}")
+        if options['output']:
+            with open(options['output'], 'w') as fileobj:
+                json.dump(report, fileobj, indent=2)
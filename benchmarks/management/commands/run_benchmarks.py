@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from benchmarks.harness import compare_results, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the verify, staff list, detail and PDF pages in-process and write latency percentiles "
+        "and query counts to JSON; with --baseline, fail on regressions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help="Timed requests per scenario")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed requests per scenario first")
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO', help="Only run these scenarios")
+        parser.add_argument('--seed', type=int, help="Random seed for choosing staff")
+        parser.add_argument('--output', help="Results file (defaults to benchmark-<timestamp>.json)")
+        parser.add_argument('--baseline', help="Earlier results file to compare against")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Allowed p95 slowdown against the baseline, as a fraction")
+
+    def handle(self, *args, **options):
+        try:
+            report = run_benchmarks(options['requests'], options['warmup'], options['only'], options['seed'])
+        except (ValueError, RuntimeError) as exc:
+            raise CommandError(str(exc))
+
+        output = options['output'] or f"benchmark-{timezone.now():%Y%m%d-%H%M%S}.json"
+        with open(output, 'w') as fileobj:
+            json.dump(report, fileobj, indent=2)
+
+        self.stdout.write(f"{'scenario':<28}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}")
+        for name, result in report['results'].items():
+            self.stdout.write(f"{name:<28}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+                              f"{result['p99_ms']:>9.1f}{result['queries_mean']:>9.1f}")
+        self.stdout.write(f"Results written to {output}")
+
+        if options['baseline']:
+            with open(options['baseline']) as fileobj:
+                regressions = compare_results(json.load(fileobj), report, options['threshold'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.harness import SEED_PREFIX, clear_seeded_data, seed_staff, seed_verification_logs
+
+
+class Command(BaseCommand):
+    help = (
+        f"Fill the database with synthetic staff (IDs starting {SEED_PREFIX}-) and verification logs "
+        "for benchmarking. Never run against production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--staff', type=int, default=100000, help="Staff rows to add")
+        parser.add_argument('--logs', type=int, default=10000000, help="Verification log rows to add")
+        parser.add_argument('--days', type=int, default=365, help="Spread the logs over this many past days")
+        parser.add_argument('--seed', type=int, help="Random seed, for repeatable data")
+        parser.add_argument('--clear', action='store_true', help="Remove earlier benchmark data first")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = clear_seeded_data()
+            self.stdout.write(f"Removed {deleted} benchmark row(s)")
+
+        if options['staff']:
+            created = seed_staff(options['staff'], seed=options['seed'])
+            self.stdout.write(f"Added {created} staff")
+
+        if options['logs']:
+            try:
+                seed_verification_logs(options['logs'], days=options['days'], seed=options['seed'])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(f"Added {options['logs']} verification log(s) over {options['days']} day(s)")
+
+        self.stdout.write(self.style.SUCCESS("Benchmark data is ready"))
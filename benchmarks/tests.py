@@ -0,0 +1,40 @@
+import json
+
+from django.test import TestCase
+from django.utils import timezone
+
+from staff.models import VerificationDailyCount, VerificationLog
+from staff.tests import TempMediaMixin
+
+from .harness import compare_results, run_benchmarks, seed_staff, seed_verification_logs, seeded_staff
+
+
+class BenchmarkSuiteTest(TempMediaMixin, TestCase):
+    """Seeding and the benchmark runner work end to end on a small data set"""
+
+    def test_seed(self):
+        self.assertEqual(seed_staff(40, batch_size=15, seed=1), 40)
+        seed_verification_logs(500, days=30, seed=1)
+        self.assertEqual(seeded_staff().count(), 40)
+        staff = seeded_staff().first()
+        self.assertEqual(timezone.localtime(staff.created_at).date(), staff.date_joined)
+        self.assertEqual(VerificationLog.objects.count(), 500)
+        self.assertEqual(sum(VerificationDailyCount.objects.values_list('count', flat=True)), 500)
+
+    def test_run_and_compare(self):
+        seed_staff(10, seed=2)
+        seed_verification_logs(100, days=7, seed=2)
+        report = run_benchmarks(requests=3, warmup=1, seed=2)
+
+        for name in ('verify_staff', 'staff_list_search_name', 'staff_detail', 'download_card_pdf',
+                     'download_qr_sticker_cached'):
+            self.assertEqual(report['results'][name]['requests'], 3)
+            self.assertGreater(report['results'][name]['queries_max'], 0)
+        self.assertEqual(compare_results(report, report), [])
+
+        slower = json.loads(json.dumps(report))
+        slower['results']['staff_detail']['p95_ms'] = report['results']['staff_detail']['p95_ms'] * 2 + 1
+        slower['results']['staff_detail']['queries_mean'] += 1
+        regressions = compare_results(report, slower)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(message.startswith('staff_detail:') for message in regressions))
@@ -0,0 +1,16 @@
+"""
+gunicorn hooks, read automatically when gunicorn starts from the project root.
+
+Run the pool that serves the card, sticker and bulk PDF routes with
+PDF_WARM_UP=True so each of its workers loads and primes the PDF and QR
+engines before taking requests; the other pools stay lean (see
+staff.renderers).
+"""
+
+
+def post_worker_init(worker):
+    from django.conf import settings
+
+    if getattr(settings, 'PDF_WARM_UP', False):
+        from staff.renderers import warm_up
+        warm_up()
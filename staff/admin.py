@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import Staff, VerificationLog
+from django.utils import timezone
+from .models import Job, Staff, VerificationLog, VerificationDailyCount, VerificationHourlyCount, RevocationEvent
+from .search import search_staff
+from .offline import record_deletions
 
 @admin.register(Staff)
 class StaffAdmin(admin.ModelAdmin):
@@ -9,6 +12,17 @@ class StaffAdmin(admin.ModelAdmin):
     list_filter = ['status', 'department', 'date_joined']
     search_fields = ['staff_id', 'first_name', 'last_name', 'email']
     readonly_fields = ['uuid', 'created_at', 'updated_at', 'qr_code_preview']
+    actions = ['warm_pdf_cache']
+    
+    def get_search_results(self, request, queryset, search_term):
+        return search_staff(queryset, search_term), False
+    
+    def delete_queryset(self, request, queryset):
+        # Bulk deletes skip Staff.delete, so revoke and drop caches here
+        staff_members = list(queryset.only('id', 'uuid'))
+        record_deletions(staff_members)
+        super().delete_queryset(request, queryset)
+        Staff.bulk_invalidate_caches(staff.uuid for staff in staff_members)
     
     fieldsets = (
         ('Personal Information', {
@@ -37,6 +51,12 @@ class StaffAdmin(admin.ModelAdmin):
         url = reverse('staff:verify', kwargs={'uuid': obj.uuid})
         return format_html('<img src="https://api.qrserver.com/v1/create-qr-code/?size=200x200&data={}" />', url)
     qr_code_preview.short_description = 'QR Code Preview'
+    
+    @admin.action(description='Pre-render ID cards and QR stickers')
+    def warm_pdf_cache(self, request, queryset):
+        from .pdf import warm_pdf_cache
+        rendered = warm_pdf_cache(queryset)
+        self.message_user(request, f'{rendered} PDF(s) rendered into the cache.')
 
 @admin.register(VerificationLog)
 class VerificationLogAdmin(admin.ModelAdmin):
@@ -46,4 +66,51 @@ class VerificationLogAdmin(admin.ModelAdmin):
     readonly_fields = ['staff', 'ip_address', 'user_agent', 'verified_at','verified_by',]
     
     def has_add_permission(self, request):
-        return False
\ No newline at end of file
+        return False
+
+@admin.register(VerificationDailyCount)
+class VerificationDailyCountAdmin(admin.ModelAdmin):
+    list_display = ['day', 'staff', 'department', 'count']
+    list_filter = ['day', 'department']
+    search_fields = ['staff__staff_id', 'staff__first_name', 'staff__last_name']
+    readonly_fields = ['staff', 'department', 'day', 'count']
+    date_hierarchy = 'day'
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(VerificationHourlyCount)
+class VerificationHourlyCountAdmin(admin.ModelAdmin):
+    list_display = ['hour', 'department', 'gate', 'count']
+    list_filter = ['department', 'gate']
+    readonly_fields = ['hour', 'department', 'gate', 'count']
+    date_hierarchy = 'hour'
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(RevocationEvent)
+class RevocationEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'staff_uuid', 'revoked', 'created_at']
+    list_filter = ['revoked', 'created_at']
+    search_fields = ['staff_uuid']
+    readonly_fields = ['staff_uuid', 'revoked', 'created_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'staff', 'status', 'attempts', 'run_after', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['staff__staff_id']
+    readonly_fields = ['kind', 'staff', 'attempts', 'last_error', 'created_at', 'started_at', 'finished_at']
+    actions = ['retry']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    @admin.action(description='Retry now')
+    def retry(self, request, queryset):
+        count = queryset.exclude(status='running').update(status='queued', attempts=0, run_after=timezone.now())
+        self.message_user(request, f'Queued {count} job(s) to run again.')
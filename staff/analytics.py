@@ -0,0 +1,282 @@
+"""
+Verification analytics from incrementally refreshed aggregates.
+
+VerificationHourlyCount holds scans per local hour, department and gate.
+refresh_hourly_counts() reads only the log rows between its watermark (an
+AggregateWatermark row on verified_at) and now minus ANALYTICS_LAG_SECONDS,
+adds them to the counts and moves the watermark in the same transaction,
+so each log row is counted once. The lag gives buffered log writes, which
+keep their request time, a chance to land first.
+
+The dashboard reads only the hourly counts and the daily per-staff rollup,
+so what it costs follows the window shown rather than the size of the
+log. The aggregates are kept when the retention window drops old logs.
+
+A gate is a kiosk address or network named in VERIFICATION_GATES; scans
+from anywhere else (phones on the public verify page) count as "Other".
+"""
+import ipaddress
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import AggregateWatermark, Staff, VerificationDailyCount, VerificationHourlyCount, VerificationLog
+
+WATERMARK = 'verification_hourly'
+OTHER_GATE = ''
+# Log time added per transaction, so a long backfill commits as it goes and can be resumed
+CHUNK = timedelta(days=1)
+WINDOWS = (1, 7, 30, 90)
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+@lru_cache(maxsize=4)
+def _gate_networks(gates):
+    networks = []
+    for entry in gates:
+        name, _, address = entry.partition('=')
+        try:
+            networks.append((ipaddress.ip_network(address.strip(), strict=False), name.strip()))
+        except ValueError:
+            raise ImproperlyConfigured(f"VERIFICATION_GATES entry {entry!r} is not name=address or name=network")
+    return networks
+
+
+def gate_for(address):
+    """The VERIFICATION_GATES name for a client address, or OTHER_GATE"""
+    networks = _gate_networks(tuple(getattr(settings, 'VERIFICATION_GATES', ())))
+    if networks:
+        address = ipaddress.ip_address(address)
+        for network, name in networks:
+            if address in network:
+                return name
+    return OTHER_GATE
+
+
+def gate_label(gate):
+    return gate or 'Other'
+
+
+def _horizon():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'ANALYTICS_LAG_SECONDS', 60))
+
+
+def _hour_start(value):
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def _oldest_log():
+    return VerificationLog.objects.order_by('verified_at').values_list('verified_at', flat=True).first()
+
+
+def _lock_watermark():
+    """The watermark row, locked until the transaction ends; None while another refresh holds it"""
+    AggregateWatermark.objects.get_or_create(
+        name=WATERMARK, defaults={'verified_at': _hour_start(_oldest_log() or _horizon())},
+    )
+    return AggregateWatermark.objects.select_for_update(skip_locked=True).filter(name=WATERMARK).first()
+
+
+def watermark():
+    """How far the hourly counts have read the log, or None before the first refresh"""
+    return AggregateWatermark.objects.filter(name=WATERMARK).values_list('verified_at', flat=True).first()
+
+
+def _count_logs(start, end):
+    rows = (
+        VerificationLog.objects.filter(verified_at__gte=start, verified_at__lt=end)
+        .annotate(hour=TruncHour('verified_at'))
+        .values_list('hour', 'staff__department', 'ip_address')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    counts = Counter()
+    for hour, department, address, total in rows.iterator():
+        counts[hour, department, gate_for(address)] += total
+    return counts
+
+
+def _add_counts(counts):
+    table = connection.ops.quote_name(VerificationHourlyCount._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} (hour, department, gate, count) VALUES (%s, %s, %s, %s) "
+        f"ON CONFLICT (hour, department, gate) DO UPDATE SET count = {table}.count + EXCLUDED.count"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(connection.ops.adapt_datetimefield_value(hour), department, gate, count)
+                                 for (hour, department, gate), count in counts.items()])
+
+
+def refresh_hourly_counts(until=None, max_span=None):
+    """
+    Add the log rows from the watermark up to `until` (default: now minus
+    ANALYTICS_LAG_SECONDS) to the hourly counts, reading at most max_span
+    of log time. Returns the new watermark, or None if another process is
+    refreshing.
+    """
+    until = until or _horizon()
+    limit = None
+    while True:
+        with transaction.atomic():
+            mark = _lock_watermark()
+            if mark is None:
+                return None
+            if limit is None:
+                limit = min(until, mark.verified_at + max_span) if max_span else until
+            if mark.verified_at >= limit:
+                return mark.verified_at
+            end = min(mark.verified_at + CHUNK, limit)
+            _add_counts(_count_logs(mark.verified_at, end))
+            mark.verified_at = end
+            mark.save(update_fields=['verified_at', 'refreshed_at'])
+
+
+def refresh_if_stale():
+    """Catch the hourly counts up when they are more than ANALYTICS_REFRESH_SECONDS behind, a day of log at most"""
+    interval = getattr(settings, 'ANALYTICS_REFRESH_SECONDS', 60)
+    if not interval:
+        return watermark()
+    mark = watermark()
+    if mark is not None and mark >= _horizon() - timedelta(seconds=interval):
+        return mark
+    return refresh_hourly_counts(max_span=CHUNK) or watermark()
+
+
+def rebuild_hourly_counts(since=None):
+    """Recount the hourly aggregates from the raw log, from the local date `since` onwards (or entirely)"""
+    with transaction.atomic():
+        AggregateWatermark.objects.get_or_create(name=WATERMARK, defaults={'verified_at': _horizon()})
+        mark = AggregateWatermark.objects.select_for_update().get(name=WATERMARK)
+        start = timezone.make_aware(datetime.combine(since, time.min)) if since else _oldest_log()
+        start = _hour_start(min(start or mark.verified_at, mark.verified_at))
+        VerificationHourlyCount.objects.filter(hour__gte=start).delete()
+        mark.verified_at = start
+        mark.save(update_fields=['verified_at', 'refreshed_at'])
+    return refresh_hourly_counts()
+
+
+def _heatmap(by_hour):
+    grid = [[0] * 24 for _ in WEEKDAYS]
+    zone = timezone.get_current_timezone()
+    for hour, total in by_hour.items():
+        local = hour.astimezone(zone)
+        grid[local.weekday()][local.hour] += total
+    peak = max(max(row) for row in grid) or 1
+    return [
+        {'day': day, 'cells': [{'hour': hour, 'count': count, 'alpha': round(count / peak, 2)}
+                               for hour, count in enumerate(row)]}
+        for day, row in zip(WEEKDAYS, grid)
+    ]
+
+
+def _top_staff(since, department, top):
+    rows = VerificationDailyCount.objects.filter(day__gte=since)
+    if department:
+        rows = rows.filter(department=department)
+    totals = list(rows.values_list('staff_id').annotate(total=Sum('count')).order_by('-total')[:top])
+    staff = Staff.objects.only('uuid', 'staff_id', 'first_name', 'last_name', 'department').in_bulk(
+        [staff_id for staff_id, _ in totals]
+    )
+    return [{'staff': staff[staff_id], 'count': total} for staff_id, total in totals if staff_id in staff]
+
+
+def volume_alerts(hours=24, department=None, now=None):
+    """
+    Complete hours among the last `hours` whose count for a department or
+    gate is ANALYTICS_ALERT_RATIO times above or below the mean for the same
+    weekday and hour over the previous ANALYTICS_ALERT_WEEKS weeks.
+    """
+    mark = watermark()
+    if mark is None:
+        return []
+    ratio = getattr(settings, 'ANALYTICS_ALERT_RATIO', 3.0)
+    min_count = getattr(settings, 'ANALYTICS_ALERT_MIN_COUNT', 20)
+    first = VerificationHourlyCount.objects.order_by('hour').values_list('hour', flat=True).first()
+    # In UTC, like the rows read back: fixed-offset datetimes hash much faster than zoneinfo ones
+    end = _hour_start(min(now or timezone.now(), mark)).astimezone(dt_timezone.utc)
+    start = end - timedelta(hours=hours)
+    # Only weeks the aggregates fully cover count towards the baseline
+    weeks = [week for week in range(1, getattr(settings, 'ANALYTICS_ALERT_WEEKS', 4) + 1)
+             if first is not None and start - timedelta(weeks=week) >= first]
+    if not weeks:
+        return []
+
+    windows = Q(hour__gte=start, hour__lt=end)
+    for week in weeks:
+        windows |= Q(hour__gte=start - timedelta(weeks=week), hour__lt=end - timedelta(weeks=week))
+    rows = VerificationHourlyCount.objects.filter(windows)
+    if department:
+        rows = rows.filter(department=department)
+    series = defaultdict(dict)
+    for dimension, field in (('Department', 'department'), ('Gate', 'gate')):
+        for hour, key, total in rows.values_list('hour', field).annotate(total=Sum('count')).order_by():
+            series[dimension, key][hour] = total
+
+    departments = dict(Staff.DEPARTMENT_CHOICES)
+    alerts = []
+    for (dimension, key), counts in series.items():
+        for offset in range(hours):
+            hour = start + timedelta(hours=offset)
+            count = counts.get(hour, 0)
+            expected = sum(counts.get(hour - timedelta(weeks=week), 0) for week in weeks) / len(weeks)
+            if count >= min_count and count >= expected * ratio:
+                direction = 'spike'
+            elif expected >= min_count and count * ratio <= expected:
+                direction = 'drop'
+            else:
+                continue
+            alerts.append({
+                'hour': hour,
+                'dimension': dimension,
+                'name': departments.get(key, key) if dimension == 'Department' else gate_label(key),
+                'count': count,
+                'expected': round(expected, 1),
+                'direction': direction,
+            })
+    alerts.sort(key=lambda alert: (alert['hour'], alert['count']), reverse=True)
+    return alerts
+
+
+def dashboard(days=7, department=None, top=10, now=None):
+    """Everything the analytics dashboard shows for the last `days` days, read from the aggregates"""
+    now = now or timezone.now()
+    start = _hour_start(now - timedelta(days=days))
+    counts = VerificationHourlyCount.objects.filter(hour__gte=start)
+    if department:
+        counts = counts.filter(department=department)
+
+    by_hour = dict(counts.values_list('hour').annotate(total=Sum('count')).order_by())
+    departments = dict(Staff.DEPARTMENT_CHOICES)
+    by_department = [
+        {'name': departments.get(key, key), 'department': key, 'count': total}
+        for key, total in counts.values_list('department').annotate(total=Sum('count')).order_by('-total')
+    ]
+    by_gate = [
+        {'name': gate_label(key), 'count': total}
+        for key, total in counts.values_list('gate').annotate(total=Sum('count')).order_by('-total')
+    ]
+    last_day = _hour_start(now) - timedelta(hours=23)
+    hourly = [{'hour': last_day + timedelta(hours=offset), 'count': by_hour.get(last_day + timedelta(hours=offset), 0)}
+              for offset in range(24)]
+    peak = max([row['count'] for row in hourly] + [1])
+    for row in hourly:
+        row['width'] = round(200 * row['count'] / peak)
+
+    return {
+        'days': days,
+        'total': sum(by_hour.values()),
+        'by_department': by_department,
+        'by_gate': by_gate,
+        'hourly': hourly,
+        'heatmap': _heatmap(by_hour),
+        'top_staff': _top_staff(timezone.localdate(start), department, top),
+        'alerts': volume_alerts(department=department, now=now),
+        'watermark': watermark(),
+    }
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class StaffConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'staff'
+
+    def ready(self):
+        from .timing import install_db_wrapper
+        # Request timing counts queries on every connection, including sync_to_async threads'
+        connection_created.connect(install_db_wrapper, dispatch_uid='staff_timing_db_wrapper')
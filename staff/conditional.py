@@ -0,0 +1,75 @@
+"""
+Conditional GET for pages and files rendered from a single Staff row.
+
+The ETag hashes everything such a response depends on: the staff uuid,
+updated_at, the QR fingerprint (qr_hash changes without touching
+updated_at), PDF_TEMPLATE_VERSION and a per-view variant such as the card
+engine or the requesting user. A print station or browser that already
+holds the current copy gets a 304 after one indexed lookup, without the
+page, PDF or QR code being rendered.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Staff
+
+
+def template_version():
+    return str(getattr(settings, 'PDF_TEMPLATE_VERSION', '1'))
+
+
+def staff_validators(staff, *variant):
+    """(ETag, Last-Modified timestamp) for a Staff instance or a dict with uuid, updated_at and qr_hash"""
+    if isinstance(staff, dict):
+        uuid, updated_at, qr_hash = staff['uuid'], staff['updated_at'], staff['qr_hash']
+    else:
+        uuid, updated_at, qr_hash = staff.uuid, staff.updated_at, staff.qr_hash
+    raw = '|'.join(map(str, (uuid, updated_at.isoformat(), qr_hash, template_version()) + variant))
+    return quote_etag(hashlib.sha1(raw.encode('utf-8')).hexdigest()), int(updated_at.timestamp())
+
+
+def set_validators(response, etag, last_modified):
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(last_modified))
+    return response
+
+
+def not_modified(request, staff, *variant):
+    """304 response (with validators) if the client's copy is current, else None"""
+    etag, last_modified = staff_validators(staff, *variant)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def staff_conditional(*variant):
+    """
+    View decorator: answer 304 before the view runs when the client's copy is
+    current, and add ETag/Last-Modified to the full response otherwise.
+
+    The view takes the staff uuid as its first URL argument. Items in variant
+    are strings, or callables taking the request, for whatever else the
+    response depends on.
+    """
+    def decorator(view):
+        @wraps(view)
+        def inner(request, uuid, *args, **kwargs):
+            row = Staff.objects.filter(uuid=uuid).values('uuid', 'updated_at', 'qr_hash').first()
+            if row is None:
+                # Let the view raise its usual 404
+                return view(request, uuid, *args, **kwargs)
+            parts = tuple(part(request) if callable(part) else part for part in variant)
+            response = not_modified(request, row, *parts)
+            if response is not None:
+                return response
+            response = view(request, uuid, *args, **kwargs)
+            if response.status_code == 200:
+                set_validators(response, *staff_validators(row, *parts))
+            return response
+        return inner
+    return decorator
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import RevocationEvent, Staff
+
+
+def expire_staff(today=None):
+    """
+    Flip active staff whose date_expiry has passed to 'expired'.
+
+    One UPDATE ... RETURNING over the staff_active_expiry_idx partial index,
+    so a sweep touches only the rows that change. Their offline tokens are
+    revoked, cached cards and verify records dropped, and QR codes that
+    encode the old status redrawn. Returns the expired staff uuids.
+    """
+    from .utils import regenerate_qr_codes
+
+    today = today or timezone.localdate()
+    table = connection.ops.quote_name(Staff._meta.db_table)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET status = %s, updated_at = %s "
+                f"WHERE status = %s AND date_expiry < %s RETURNING id, uuid",
+                ['expired', timezone.now(), 'active', today],
+            )
+            rows = cursor.fetchall()
+        uuids = [Staff._meta.get_field('uuid').to_python(uuid) for _, uuid in rows]
+        RevocationEvent.objects.bulk_create([RevocationEvent(staff_uuid=uuid, revoked=True) for uuid in uuids])
+
+    Staff.bulk_invalidate_caches(uuids)
+    # Only signed QR payloads carry the status; regenerate_qr_codes skips the rest
+    staff_members = Staff.objects.filter(pk__in=[pk for pk, _ in rows]).only(
+        'id', 'uuid', 'staff_id', 'status', 'date_expiry', 'qr_code', 'qr_hash'
+    )
+    regenerate_qr_codes(list(staff_members))
+    return uuids
+
+
+def expiring_staff(days, today=None):
+    """Active staff whose cards expire within `days` days, soonest first (served by staff_active_expiry_idx)"""
+    today = today or timezone.localdate()
+    return Staff.objects.filter(
+        status='active', date_expiry__gte=today, date_expiry__lte=today + timedelta(days=days),
+    ).order_by('date_expiry', 'id')
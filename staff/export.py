@@ -0,0 +1,125 @@
+import csv
+import tempfile
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Staff, VerificationLog
+
+EXPORT_CHUNK_SIZE = 2000
+
+DEPARTMENTS = dict(Staff.DEPARTMENT_CHOICES)
+STATUSES = dict(Staff.STATUS_CHOICES)
+
+STAFF_COLUMNS = [
+    ('Staff ID', 'staff_id'),
+    ('First Name', 'first_name'),
+    ('Last Name', 'last_name'),
+    ('Email', 'email'),
+    ('Phone', 'phone'),
+    ('Department', 'department'),
+    ('Position', 'position'),
+    ('Date Joined', 'date_joined'),
+    ('Date Expiry', 'date_expiry'),
+    ('Status', 'status'),
+    ('Created', 'created_at'),
+    ('Updated', 'updated_at'),
+]
+
+VERIFICATION_COLUMNS = [
+    ('Verified At', 'verified_at'),
+    ('Staff ID', 'staff__staff_id'),
+    ('First Name', 'staff__first_name'),
+    ('Last Name', 'staff__last_name'),
+    ('Department', 'staff__department'),
+    ('Verified By', 'verified_by__username'),
+    ('IP Address', 'ip_address'),
+    ('User Agent', 'user_agent'),
+]
+
+DISPLAY_VALUES = {
+    'department': DEPARTMENTS,
+    'staff__department': DEPARTMENTS,
+    'status': STATUSES,
+}
+
+
+class Echo:
+    """File-like object whose write() hands the line straight back to csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _local_day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_verifications(params, staff_queryset=None):
+    """
+    VerificationLog rows for the staff_list filters plus a date range.
+
+    date_from and date_to (YYYY-MM-DD, inclusive, local time) become a
+    half-open range on verified_at so the (verified_at) index and monthly
+    partitions can be pruned.
+    """
+    logs = VerificationLog.objects.all()
+    if staff_queryset is not None:
+        logs = logs.filter(staff__in=staff_queryset.values('pk'))
+
+    date_from = parse_date(params.get('date_from') or '')
+    date_to = parse_date(params.get('date_to') or '')
+    if date_from:
+        logs = logs.filter(verified_at__gte=_local_day_start(date_from))
+    if date_to:
+        logs = logs.filter(verified_at__lt=_local_day_start(date_to + timedelta(days=1)))
+    return logs.order_by('verified_at', 'id')
+
+
+def export_rows(queryset, columns):
+    """Yield one tuple of display values per row, fetched in chunks from a server-side cursor"""
+    fields = [field for _, field in columns]
+    lookups = [DISPLAY_VALUES.get(field) for field in fields]
+    for values in queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        row = []
+        for value, lookup in zip(values, lookups):
+            if lookup is not None:
+                value = lookup.get(value, value)
+            elif isinstance(value, datetime):
+                # Spreadsheets have no time zones: export local wall-clock time
+                value = timezone.localtime(value).replace(tzinfo=None)
+            row.append(value)
+        yield row
+
+
+def stream_csv(queryset, columns):
+    """Generate CSV lines for StreamingHttpResponse; memory use does not grow with the row count"""
+    writer = csv.writer(Echo())
+    yield writer.writerow([header for header, _ in columns])
+    for row in export_rows(queryset, columns):
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def build_xlsx(queryset, columns, title):
+    """
+    Write the rows into an XLSX spooled to a temporary file and return it rewound.
+
+    An XLSX is a ZIP whose directory comes last, so it cannot be streamed as
+    it is built; openpyxl's write-only mode keeps memory flat instead.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title)
+    worksheet.append([header for header, _ in columns])
+    for row in export_rows(queryset, columns):
+        # Control characters (e.g. in odd user agents) are not allowed in XLSX cells
+        worksheet.append([ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value
+                          for value in row])
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from .models import Staff
 
 class StaffForm(forms.ModelForm):
@@ -19,48 +20,26 @@ class StaffForm(forms.ModelForm):
             'date_expiry': forms.DateInput(attrs={'type': 'date', 'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent'}),
             'status': forms.Select(attrs={'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent'}),
         }
-import qrcode
-from io import BytesIO
-from django.core.files import File
-from django.conf import settings
-import os
 
-def generate_qr_code(staff, save_to_file=True):
-    """Generate QR code for staff verification URL"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    
-    # Full URL for QR code
-    site_domain = settings.SITE_DOMAIN if hasattr(settings, 'SITE_DOMAIN') else settings.ALLOWED_HOSTS[0]
-    verification_url = f"https://{site_domain}{staff.get_verification_url()}"
-    qr.add_data(verification_url)
-    qr.make(fit=True)
+class StaffImportForm(forms.ModelForm):
+    """Validates one row of a bulk import; staff_id uniqueness is handled by the upsert"""
+    class Meta:
+        model = Staff
+        fields = ['staff_id', 'first_name', 'last_name', 'email', 'phone',
+                  'department', 'position', 'date_joined', 'date_expiry', 'status']
     
-    img = qr.make_image(fill_color="black", back_color="white")
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in ('date_joined', 'date_expiry'):
+            self.fields[name].input_formats = [*settings.DATE_INPUT_FORMATS, '%d/%m/%Y', '%Y-%m-%d']
     
-    if save_to_file:
-        # Save to media directory
-        qr_dir = os.path.join(settings.MEDIA_ROOT, 'qr_codes')
-        os.makedirs(qr_dir, exist_ok=True)
-        qr_path = os.path.join(qr_dir, f'qr_{staff.uuid}.png')
-        img.save(qr_path)
-        return f'qr_codes/qr_{staff.uuid}.png'
-    else:
-        # Return as BytesIO for immediate use
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        return buffer
+    def validate_unique(self):
+        pass
 
-def get_client_ip(request):
-    """Get client IP address from request"""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
\ No newline at end of file
+
+class StaffUploadForm(forms.Form):
+    file = forms.FileField(
+        help_text='CSV or XLSX with a header row: staff_id, first_name, last_name, email, phone, '
+                  'department, position, date_joined, date_expiry, status',
+        widget=forms.FileInput(attrs={'accept': '.csv,.xlsx', 'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent'}),
+    )
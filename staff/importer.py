@@ -0,0 +1,165 @@
+import csv
+import io
+import os
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from .forms import StaffImportForm
+from .models import Staff
+from .offline import record_status_changes
+from .utils import regenerate_qr_codes
+
+IMPORT_FIELDS = StaffImportForm.Meta.fields
+UPDATE_FIELDS = [field for field in IMPORT_FIELDS if field != 'staff_id'] + ['updated_at']
+DEPARTMENTS = {key.lower(): code for code, name in Staff.DEPARTMENT_CHOICES for key in (code, name)}
+STATUSES = {key.lower(): code for code, name in Staff.STATUS_CHOICES for key in (code, name)}
+
+
+class StaffImportError(Exception):
+    pass
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.qr_generated = 0
+        self.errors = []
+
+    @property
+    def total(self):
+        return self.created + self.updated + self.unchanged + len(self.errors)
+
+
+def _normalise_header(name):
+    return str(name or '').strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def _csv_rows(fileobj):
+    # Uploaded files wrap the real binary file object
+    text = io.TextIOWrapper(getattr(fileobj, 'file', fileobj), encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    header = [_normalise_header(name) for name in next(reader, [])]
+    for values in reader:
+        yield dict(zip(header, values))
+
+
+def _xlsx_rows(fileobj):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise StaffImportError("Reading .xlsx files needs the openpyxl package")
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [_normalise_header(name) for name in next(rows, ())]
+        for values in rows:
+            if any(value not in (None, '') for value in values):
+                yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj, filename):
+    """Stream an HR export as dicts keyed by normalised column names"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        return _csv_rows(fileobj)
+    if extension in ('.xlsx', '.xlsm'):
+        return _xlsx_rows(fileobj)
+    raise StaffImportError(f"Unsupported file type '{extension}', expected .csv or .xlsx")
+
+
+def _clean_row(row):
+    data = {field: row.get(field) for field in IMPORT_FIELDS}
+    for field, value in data.items():
+        if value is None:
+            data[field] = ''
+        elif isinstance(value, str):
+            data[field] = value.strip()
+        elif hasattr(value, 'date'):
+            # openpyxl hands back datetimes for date cells
+            data[field] = value.date()
+    # Accept either the stored code or the display name, e.g. 'lab' or 'Laboratory'
+    data['department'] = DEPARTMENTS.get(str(data['department']).lower(), data['department'])
+    data['status'] = STATUSES.get(str(data['status']).lower(), data['status']) if data['status'] else 'active'
+    return data
+
+
+def _import_chunk(rows, first_row_number, result, dry_run):
+    valid = {}
+    for offset, row in enumerate(rows):
+        form = StaffImportForm(_clean_row(row))
+        if form.is_valid():
+            # A staff ID repeated in one chunk: the last row wins
+            valid[form.cleaned_data['staff_id']] = form.cleaned_data
+        else:
+            message = '; '.join(f"{field}: {' '.join(errors)}" for field, errors in form.errors.items())
+            result.errors.append((first_row_number + offset, message))
+
+    if not valid:
+        return []
+
+    existing = Staff.objects.in_bulk(list(valid), field_name='staff_id')
+    now = timezone.now()
+    to_create, to_update, unchanged = [], [], []
+    for staff_id, data in valid.items():
+        staff = existing.get(staff_id)
+        if staff is None:
+            to_create.append(Staff(**data))
+            continue
+        # Re-importing the same export leaves unchanged rows, their caches and ETags alone
+        if all(getattr(staff, field) == value for field, value in data.items()):
+            unchanged.append(staff)
+            continue
+        for field, value in data.items():
+            setattr(staff, field, value)
+        staff.updated_at = now
+        to_update.append(staff)
+
+    if not dry_run:
+        with transaction.atomic():
+            # bulk_create skips Staff.save, so QR codes come from the later batch stage
+            Staff.objects.bulk_create(to_create)
+            Staff.objects.bulk_update(to_update, UPDATE_FIELDS)
+            record_status_changes(to_create + to_update)
+        Staff.bulk_invalidate_caches(staff.uuid for staff in to_update)
+
+    result.created += len(to_create)
+    result.updated += len(to_update)
+    result.unchanged += len(unchanged)
+    # Unchanged rows still get a QR code if they are missing one
+    return to_create + to_update + unchanged
+
+
+def import_staff(fileobj, filename, chunk_size=500, workers=None, dry_run=False):
+    """
+    Upsert Staff rows from a CSV or XLSX file on staff_id.
+
+    The file is streamed and validated chunk_size rows at a time; each chunk
+    is written with one bulk_create and one bulk_update of the rows whose
+    values changed. Missing or stale
+    QR codes are generated afterwards in a process pool. Row numbers in
+    result.errors count the header as row 1.
+    """
+    result = ImportResult()
+    rows = read_rows(fileobj, filename)
+    imported = {}
+    row_number = 2
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        for staff in _import_chunk(chunk, row_number, result, dry_run):
+            imported[staff.staff_id] = staff
+        row_number += len(chunk)
+
+    if imported and not dry_run:
+        result.qr_generated = len(regenerate_qr_codes(imported.values(), workers))
+
+    return result
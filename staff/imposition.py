@@ -0,0 +1,275 @@
+"""
+Print-shop imposition: tile card or sticker PDFs N-up on paper sheets.
+
+Each source page is wrapped as a Form XObject and placed on the sheet with
+a translation, so no content stream is parsed or rewritten. Sheets are
+written out one at a time by StreamingPDFWriter, keeping memory flat for
+print runs of any size.
+"""
+from io import BytesIO
+from itertools import chain
+
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, IndirectObject, NameObject, NumberObject,
+    StreamObject,
+)
+from reportlab.lib.pagesizes import A3, A4, LETTER
+from reportlab.lib.units import mm
+
+PAPER_SIZES = {'A4': A4, 'A3': A3, 'LETTER': LETTER}
+SHEET_MARGIN = 10 * mm
+GUTTER = 6 * mm
+CROP_MARK_LENGTH = 4 * mm
+CROP_MARK_OFFSET = 1 * mm
+
+
+class StreamingPDFWriter:
+    """
+    Writes a PDF object by object so each page can leave memory once added.
+
+    add_page() copies a page and everything it references, renumbering the
+    objects, and returns the bytes to send; finish() returns the page tree,
+    catalog, cross-reference table and trailer.
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self):
+        self._offsets = [None, None]
+        self._position = 0
+        self._page_ids = []
+        self._copied = {}
+        self._pending = []
+
+    def _reserve(self):
+        self._offsets.append(None)
+        return len(self._offsets)
+
+    def _emit(self, obj_id, obj):
+        buffer = BytesIO()
+        buffer.write(f"{obj_id} 0 obj\n".encode('ascii'))
+        obj.write_to_stream(buffer)
+        buffer.write(b"\nendobj\n")
+        self._offsets[obj_id - 1] = self._position
+        self._position += buffer.tell()
+        return buffer.getvalue()
+
+    def _indirect(self, obj, key=None):
+        if key is None or key not in self._copied:
+            obj_id = self._reserve()
+            self._pending.append((obj_id, obj))
+            if key is None:
+                return IndirectObject(obj_id, 0, None)
+            self._copied[key] = obj_id
+        return IndirectObject(self._copied[key], 0, None)
+
+    def _copy(self, value):
+        if isinstance(value, IndirectObject):
+            return self._indirect(value, key=(id(value.pdf), value.idnum, value.generation))
+        if isinstance(value, StreamObject):
+            # Streams must be indirect objects
+            return self._indirect(value)
+        if isinstance(value, DictionaryObject):
+            return self._copy_dict(value, DictionaryObject())
+        if isinstance(value, ArrayObject):
+            return ArrayObject(self._copy(item) for item in value)
+        return value
+
+    def _copy_dict(self, source, target):
+        for key, item in source.items():
+            if key != '/Parent':
+                target[NameObject(key)] = self._copy(item)
+        return target
+
+    def _copy_object(self, obj):
+        if isinstance(obj, StreamObject):
+            stream = obj.__class__()
+            stream._data = obj._data
+            return self._copy_dict(obj, stream)
+        return self._copy(obj)
+
+    def header(self):
+        data = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+        self._position += len(data)
+        return data
+
+    def _add_page(self, page):
+        page_id = self._reserve()
+        copied = self._copy_dict(page, DictionaryObject())
+        copied[NameObject('/Parent')] = IndirectObject(self.PAGES_ID, 0, None)
+        chunks = [self._emit(page_id, copied)]
+        while self._pending:
+            obj_id, obj = self._pending.pop()
+            chunks.append(self._emit(obj_id, self._copy_object(obj.get_object())))
+        self._page_ids.append(page_id)
+        return b''.join(chunks)
+
+    def add_page(self, page):
+        chunk = self._add_page(page)
+        # Source documents are not shared between pages, so forget them
+        self._copied.clear()
+        return chunk
+
+    def add_pages(self, pages):
+        """Add the pages of one source document, writing objects they share (fonts, images) once"""
+        chunks = [self._add_page(page) for page in pages]
+        self._copied.clear()
+        return b''.join(chunks)
+
+    def finish(self):
+        pages = DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(IndirectObject(page_id, 0, None) for page_id in self._page_ids),
+            NameObject('/Count'): NumberObject(len(self._page_ids)),
+        })
+        catalog = DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(self.PAGES_ID, 0, None),
+        })
+        chunks = [self._emit(self.PAGES_ID, pages), self._emit(self.CATALOG_ID, catalog)]
+
+        xref = [f"xref\n0 {len(self._offsets) + 1}\n", "0000000000 65535 f \n"]
+        xref.extend(f"{offset:010d} 00000 n \n" for offset in self._offsets)
+        xref.append(f"trailer\n<< /Size {len(self._offsets) + 1} /Root {self.CATALOG_ID} 0 R >>\n")
+        xref.append(f"startxref\n{self._position}\n%%EOF\n")
+        chunks.append(''.join(xref).encode('ascii'))
+        return b''.join(chunks)
+
+
+class SheetLayout:
+    """Grid of equally sized items centred on a sheet, with the positions of their crop marks"""
+
+    def __init__(self, item_size, paper='A4', columns=None, rows=None):
+        self.sheet_width, self.sheet_height = PAPER_SIZES[paper.upper()]
+        self.item_width, self.item_height = item_size
+        # A requested grid is capped at what fits inside the margins
+        self.columns = min(columns or 10 ** 6, self._fit(self.sheet_width, self.item_width))
+        self.rows = min(rows or 10 ** 6, self._fit(self.sheet_height, self.item_height))
+        if self.columns < 1 or self.rows < 1:
+            raise ValueError(f"A {self.item_width:.0f}x{self.item_height:.0f}pt item does not fit on {paper}")
+
+        grid_width = self.columns * self.item_width + (self.columns - 1) * GUTTER
+        grid_height = self.rows * self.item_height + (self.rows - 1) * GUTTER
+        self.left = (self.sheet_width - grid_width) / 2
+        self.top = (self.sheet_height + grid_height) / 2
+
+    @staticmethod
+    def _fit(available, size):
+        return int((available - 2 * SHEET_MARGIN + GUTTER) // (size + GUTTER))
+
+    @property
+    def per_sheet(self):
+        return self.columns * self.rows
+
+    def position(self, index, mirrored=False):
+        """Lower-left corner of slot index; mirrored swaps columns for the back of a long-edge duplex sheet"""
+        row, column = divmod(index, self.columns)
+        if mirrored:
+            column = self.columns - 1 - column
+        x = self.left + column * (self.item_width + GUTTER)
+        y = self.top - (row + 1) * self.item_height - row * GUTTER
+        return x, y
+
+    def crop_marks(self):
+        """PDF drawing operators for hairline crop marks just outside every trim corner"""
+        ops = ["q 0.25 w 0 G"]
+        for index in range(self.per_sheet):
+            x, y = self.position(index)
+            for corner_x, direction_x in ((x, -1), (x + self.item_width, 1)):
+                for corner_y, direction_y in ((y, -1), (y + self.item_height, 1)):
+                    start_x = corner_x + direction_x * CROP_MARK_OFFSET
+                    start_y = corner_y + direction_y * CROP_MARK_OFFSET
+                    ops.append(f"{start_x:.2f} {corner_y:.2f} m "
+                               f"{start_x + direction_x * CROP_MARK_LENGTH:.2f} {corner_y:.2f} l S")
+                    ops.append(f"{corner_x:.2f} {start_y:.2f} m "
+                               f"{corner_x:.2f} {start_y + direction_y * CROP_MARK_LENGTH:.2f} l S")
+        ops.append("Q")
+        return "\n".join(ops)
+
+
+def _form_xobject(page):
+    """Wrap a page as a Form XObject that can be drawn anywhere on a sheet"""
+    box = page.mediabox
+    xobject = DecodedStreamObject()
+    contents = page.get_contents()
+    xobject.set_data(contents.get_data() if contents is not None else b'')
+    xobject.update({
+        NameObject('/Type'): NameObject('/XObject'),
+        NameObject('/Subtype'): NameObject('/Form'),
+        NameObject('/BBox'): ArrayObject(FloatObject(value) for value in (box.left, box.bottom, box.right, box.top)),
+        NameObject('/Resources'): page.get('/Resources', DictionaryObject()),
+    })
+    return xobject.flate_encode(), (box.left, box.bottom)
+
+
+def _sheet(layout, pages, mirrored, crop_marks):
+    xobjects = DictionaryObject()
+    ops = []
+    for index, page in enumerate(pages):
+        if page is None:
+            continue
+        xobject, (origin_x, origin_y) = _form_xobject(page)
+        name = NameObject(f'/Item{index}')
+        xobjects[name] = xobject
+        x, y = layout.position(index, mirrored)
+        ops.append(f"q 1 0 0 1 {x - origin_x:.2f} {y - origin_y:.2f} cm {name} Do Q")
+    if crop_marks:
+        ops.append(crop_marks)
+
+    content = DecodedStreamObject()
+    content.set_data("\n".join(ops).encode('ascii'))
+    return DictionaryObject({
+        NameObject('/Type'): NameObject('/Page'),
+        NameObject('/MediaBox'): ArrayObject(
+            FloatObject(value) for value in (0, 0, layout.sheet_width, layout.sheet_height)
+        ),
+        NameObject('/Resources'): DictionaryObject({NameObject('/XObject'): xobjects}),
+        NameObject('/Contents'): content.flate_encode(),
+    })
+
+
+def _imposed(readers, layout, duplex, crop_marks):
+    writer = StreamingPDFWriter()
+    marks = layout.crop_marks() if layout is not None and crop_marks else ''
+    fronts, backs = [], []
+
+    def flush():
+        chunks = [writer.add_page(_sheet(layout, fronts, False, marks))]
+        if duplex:
+            chunks.append(writer.add_page(_sheet(layout, backs, True, marks)))
+        fronts.clear()
+        backs.clear()
+        return b''.join(chunks)
+
+    yield writer.header()
+    for reader in readers:
+        fronts.append(reader.pages[0])
+        if duplex:
+            backs.append(reader.pages[1] if len(reader.pages) > 1 else None)
+        if len(fronts) == layout.per_sheet:
+            yield flush()
+    if fronts:
+        yield flush()
+    yield writer.finish()
+
+
+def impose(documents, paper='A4', columns=None, rows=None, duplex=False, crop_marks=True):
+    """
+    Return an iterator over an imposed PDF built from an iterable of single-item PDF documents (bytes).
+
+    The item size comes from the first document's first page. That document
+    is read before the iterator is returned, so an item too large for the
+    paper raises ValueError here rather than after the PDF header has been
+    sent. With duplex, each document's second page is placed on a following
+    back sheet with the columns mirrored, so fronts and backs line up after
+    a long-edge flip.
+    """
+    readers = (PdfReader(BytesIO(document)) for document in documents if document is not None)
+    first = next(readers, None)
+    if first is None:
+        return _imposed((), None, duplex, crop_marks)
+    front = first.pages[0]
+    layout = SheetLayout((float(front.mediabox.width), float(front.mediabox.height)), paper, columns, rows)
+    return _imposed(chain([first], readers), layout, duplex, crop_marks)
@@ -0,0 +1,190 @@
+"""
+Background jobs kept in the application database; no external broker.
+
+enqueue() adds a Job row (or returns the one already waiting for the same
+staff member and kind). The run_jobs command claims due rows with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers on any number
+of hosts can share the table without taking the same job twice. A
+failed job is retried after JOB_RETRY_DELAY * 2**(attempts - 1) seconds,
+capped at an hour, until JOB_MAX_ATTEMPTS is reached. After that it
+stays failed, with the error kept for the status endpoint.
+
+PDF jobs render into the worker's PDF_CACHE_DIR and the web servers look
+for the result in theirs, so workers on other hosts need PDF_CACHE_DIR on
+disk shared with the web servers. Without it the download still works,
+rendered again by the web server.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job, Staff
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRY_DELAY = 3600
+
+
+def _qr_code(staff):
+    from .utils import regenerate_qr_codes
+    # Cards drawn before the new code existed are cached under the same updated_at
+    if regenerate_qr_codes([staff], workers=1):
+        staff.invalidate_caches()
+
+
+def _card_pdf(staff):
+    from .pdf import cached_card_pdf
+    pdf_file = cached_card_pdf(staff)
+    if pdf_file is None:
+        raise RuntimeError("Card PDF rendering failed")
+    pdf_file.close()
+
+
+def _sticker_pdf(staff):
+    from .pdf import cached_sticker_pdf
+    pdf_file = cached_sticker_pdf(staff)
+    if pdf_file is None:
+        raise RuntimeError("Sticker PDF rendering failed")
+    pdf_file.close()
+
+
+def _photo_renditions(staff):
+    staff.refresh_photo_renditions()
+    staff.invalidate_caches()
+
+
+HANDLERS = {
+    'qr_code': _qr_code,
+    'card_pdf': _card_pdf,
+    'sticker_pdf': _sticker_pdf,
+    'photo_renditions': _photo_renditions,
+}
+
+
+def jobs_enabled():
+    """Whether Staff.save() hands QR codes and photo renditions to run_jobs instead of doing them inline"""
+    return getattr(settings, 'BACKGROUND_JOBS', False)
+
+
+def enqueue(kind, staff):
+    """
+    Queue a job for a staff member, reusing one of the same kind that has
+    not started yet, or that started after the staff row last changed
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    current = Q(status='queued') | Q(status='running', started_at__gte=staff.updated_at)
+    job = Job.objects.filter(current, staff=staff, kind=kind).order_by('id').first()
+    return job or Job.objects.create(staff=staff, kind=kind)
+
+
+def enqueue_on_commit(kind, staff):
+    """enqueue() once the surrounding transaction commits, so workers never see uncommitted staff"""
+    transaction.on_commit(lambda: enqueue(kind, staff))
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'JOB_RETRY_DELAY', 10)
+    return min(base * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY)
+
+
+def claim(limit=1):
+    """Mark up to limit due jobs running and return them; locked rows are skipped, not waited on"""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_after__lte=now)
+            .order_by('run_after', 'id')[:limit]
+        )
+        if jobs:
+            # Counted at claim time, so a job that kills its worker still runs out of attempts
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status='running', started_at=now, attempts=F('attempts') + 1,
+            )
+    for job in jobs:
+        job.status, job.started_at, job.attempts = 'running', now, job.attempts + 1
+    return jobs
+
+
+def run(job):
+    """Run a claimed job and record the outcome; returns True on success"""
+    try:
+        staff = Staff.objects.get(pk=job.staff_id)
+        HANDLERS[job.kind](staff)
+    except Exception as exc:
+        job.last_error = ''.join(traceback.format_exception_only(exc)).strip()
+        logger.warning("Job %s (%s) failed on attempt %d: %s", job.pk, job.kind, job.attempts, job.last_error,
+                       exc_info=True)
+        if job.attempts < getattr(settings, 'JOB_MAX_ATTEMPTS', 5):
+            job.status = 'queued'
+            job.run_after = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'last_error', 'run_after', 'finished_at'])
+        return False
+
+    job.status, job.finished_at, job.last_error = 'done', timezone.now(), ''
+    job.save(update_fields=['status', 'last_error', 'finished_at'])
+    return True
+
+
+def requeue_stale():
+    """Requeue jobs still running after JOB_TIMEOUT seconds (their worker died), or fail them if out of attempts"""
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, 'JOB_TIMEOUT', 600))
+    stale = Job.objects.filter(status='running', started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=getattr(settings, 'JOB_MAX_ATTEMPTS', 5)).update(
+        status='failed', finished_at=now, last_error='Worker stopped before the job finished',
+    )
+    return failed + stale.update(status='queued', run_after=now)
+
+
+def prune(days):
+    """Delete finished jobs older than days"""
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Job.objects.filter(status__in=['done', 'failed'], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def work(batch=1, poll_interval=None, once=False, max_jobs=None, stop=None):
+    """
+    Claim and run jobs until the stop Event is set (or, with once, until the
+    queue is drained). Returns the number of jobs run.
+    """
+    if poll_interval is None:
+        poll_interval = getattr(settings, 'JOB_POLL_INTERVAL', 1.0)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    done = 0
+    last_sweep = 0
+    stop = stop or threading.Event()
+    while not stop.is_set() and (max_jobs is None or done < max_jobs):
+        # Recycle dropped or expired connections between jobs, as a request would; not inside a caller's transaction
+        if not connection.in_atomic_block:
+            close_old_connections()
+        if time.monotonic() - last_sweep > 60:
+            if requeue_stale():
+                logger.warning("Worker %s requeued stale running jobs", worker)
+            last_sweep = time.monotonic()
+
+        jobs = claim(batch if max_jobs is None else min(batch, max_jobs - done))
+        if not jobs:
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+        for job in jobs:
+            # Claimed jobs are run even when stopping, so none is left marked running
+            run(job)
+            done += 1
+    return done
@@ -0,0 +1,247 @@
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Staff, VerificationLog, VerificationDailyCount
+
+PARTITION_SUFFIX = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def record_daily_counts(entries):
+    """Add a batch of new VerificationLog entries to the daily rollup"""
+    if not entries:
+        return
+    departments = dict(
+        Staff.objects.filter(pk__in={entry.staff_id for entry in entries}).values_list('pk', 'department')
+    )
+    counts = Counter(
+        (entry.staff_id, departments.get(entry.staff_id, ''), timezone.localdate(entry.verified_at))
+        for entry in entries
+    )
+
+    table = connection.ops.quote_name(VerificationDailyCount._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} (staff_id, department, day, count) VALUES (%s, %s, %s, %s) "
+        f"ON CONFLICT (staff_id, department, day) DO UPDATE SET count = {table}.count + EXCLUDED.count"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(staff_id, department, day, count)
+                                 for (staff_id, department, day), count in counts.items()])
+
+
+def rebuild_daily_counts(since=None):
+    """Recompute the rollup from the raw log, from the date `since` onwards (or entirely)"""
+    logs = VerificationLog.objects.all()
+    rollup = VerificationDailyCount.objects.all()
+    if since:
+        start = timezone.make_aware(datetime.combine(since, datetime.min.time()))
+        logs = logs.filter(verified_at__gte=start)
+        rollup = rollup.filter(day__gte=since)
+
+    rows = (
+        logs.annotate(day=TruncDate('verified_at'))
+        .values('staff_id', 'staff__department', 'day')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        rollup.delete()
+        VerificationDailyCount.objects.bulk_create(
+            (VerificationDailyCount(staff_id=row['staff_id'], department=row['staff__department'],
+                                    day=row['day'], count=row['total']) for row in rows.iterator()),
+            batch_size=1000,
+        )
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _next_month(value):
+    return _month_start(value + timedelta(days=32))
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)",
+                       [VerificationLog._meta.db_table])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def _create_partition(cursor, table, month):
+    """
+    Create the partition for one month. Rows for that month already in the
+    DEFAULT partition would make CREATE ... PARTITION OF fail, so when there
+    is a default partition the new one is built alongside, the month's rows
+    are moved into it with writes to the default partition locked out, and
+    it is then attached.
+    """
+    qn = connection.ops.quote_name
+    name = f"{table}_p{month:%Y%m}"
+    default = f"{table}_default"
+    bounds = [month.isoformat(), _next_month(month).isoformat()]
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL", [name, default])
+    exists, has_default = cursor.fetchone()
+    if exists:
+        return name
+    if not has_default:
+        cursor.execute(f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)", bounds)
+        return name
+
+    with transaction.atomic():
+        cursor.execute(f"LOCK TABLE {qn(default)} IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {qn(default)} WHERE verified_at >= %s AND verified_at < %s RETURNING *) "
+            f"INSERT INTO {qn(name)} SELECT * FROM moved",
+            bounds,
+        )
+        cursor.execute(f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)", bounds)
+    return name
+
+
+def ensure_partitions(months_ahead=3, since=None):
+    """
+    Create the monthly partitions from this month (or the month of `since`)
+    up to `months_ahead` months out, moving any of their rows out of the
+    DEFAULT partition.
+    """
+    table = VerificationLog._meta.db_table
+    month = _month_start(since or timezone.now())
+    last = _month_start(timezone.now())
+    for _ in range(months_ahead):
+        last = _next_month(last)
+    created = []
+    with connection.cursor() as cursor:
+        while month <= last:
+            created.append(_create_partition(cursor, table, month))
+            month = _next_month(month)
+    return created
+
+
+def convert_to_partitioned(months_ahead=3):
+    """
+    Rebuild the VerificationLog table as a table partitioned by month on verified_at.
+
+    Existing rows are copied into monthly partitions and the indexes and
+    foreign keys of the original table are recreated on the new parent. The
+    primary key becomes (id, verified_at), as Postgres requires the partition
+    key in every unique constraint. Runs in one transaction.
+    """
+    if connection.vendor != 'postgresql':
+        raise RuntimeError("Partitioned log storage needs PostgreSQL")
+    if is_partitioned():
+        return
+
+    table = VerificationLog._meta.db_table
+    old = f"{table}_unpartitioned"
+    qn = connection.ops.quote_name
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() "
+            "AND tablename = %s AND indexname NOT IN "
+            "(SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u'))",
+            [table, table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT is_identity = 'YES', pg_get_serial_sequence(%s, 'id') FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'id'",
+            [table, table],
+        )
+        is_identity, sequence = cursor.fetchone()
+        cursor.execute(f"SELECT MIN(verified_at) FROM {qn(table)}")
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(old)}")
+        for name, definition in indexes:
+            cursor.execute(f"DROP INDEX {qn(name)}")
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {qn(old)} DROP CONSTRAINT {qn(name)}")
+
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(old)} INCLUDING DEFAULTS INCLUDING IDENTITY) "
+            f"PARTITION BY RANGE (verified_at)"
+        )
+        cursor.execute(f"ALTER TABLE {qn(table)} ADD PRIMARY KEY (id, verified_at)")
+        if not is_identity and sequence:
+            # A serial column's sequence would otherwise be dropped with the old table
+            cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id")
+
+        month = _month_start(oldest or timezone.now())
+        last = _month_start(timezone.now())
+        for _ in range(months_ahead):
+            last = _next_month(last)
+        while month <= last:
+            _create_partition(cursor, table, month)
+            month = _next_month(month)
+        cursor.execute(f"CREATE TABLE {qn(table + '_default')} PARTITION OF {qn(table)} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {qn(table)} SELECT * FROM {qn(old)}")
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {qn(table)}), 0) + 1, false)",
+            [table],
+        )
+
+        for name, definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}")
+
+        cursor.execute(f"DROP TABLE {qn(old)}")
+
+
+def apply_retention(days):
+    """
+    Remove verification logs older than `days` days; the daily rollup is kept.
+
+    Partitioned storage drops every monthly partition that ends before the
+    cutoff. Unpartitioned storage deletes old rows in batches. Returns the
+    dropped partition names or the number of deleted rows.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+
+    if is_partitioned():
+        table = VerificationLog._meta.db_table
+        dropped = []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.oid = to_regclass(%s)",
+                [table],
+            )
+            for (name,) in cursor.fetchall():
+                match = PARTITION_SUFFIX.search(name)
+                if not match:
+                    continue
+                month = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)
+                if _next_month(month) <= cutoff:
+                    cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+                    dropped.append(name)
+        return dropped
+
+    deleted = 0
+    old_logs = VerificationLog.objects.filter(verified_at__lt=cutoff)
+    while True:
+        batch = list(old_logs.values_list('pk', flat=True)[:5000])
+        if not batch:
+            return deleted
+        deleted += VerificationLog.objects.filter(pk__in=batch).delete()[0]
@@ -0,0 +1,213 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils.functional import SimpleLazyObject
+
+from .utils import get_client_ip
+
+logger = logging.getLogger(__name__)
+
+
+class VerificationLogWriter:
+    """
+    In-process buffer that batches VerificationLog rows into bulk_create calls.
+
+    Entries are built with their verified_at already set, queued, and written
+    by a background thread once batch_size entries are waiting or
+    flush_interval seconds have passed. The queue holds at most max_queue
+    entries; when it is full the overflow policy either flushes in the
+    calling thread ('flush') or discards the new entry ('drop').
+    """
+
+    def __init__(self, batch_size=200, flush_interval=2.0, max_queue=10000, overflow='flush'):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        self._queue = deque()
+        self._thread = None
+        self._pid = os.getpid()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def _ensure_thread(self):
+        # A writer inherited through fork has no flush thread in the child
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='verification-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _offer(self, entry, force=False):
+        """Queue entry; False if the queue is full and must be flushed first (overflow 'flush')"""
+        with self._lock:
+            if not force and len(self._queue) >= self.max_queue:
+                if self.overflow == 'drop':
+                    self.dropped += 1
+                    return True
+                return False
+            self._queue.append(entry)
+            depth = len(self._queue)
+
+        if depth >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def log(self, **fields):
+        """Queue a VerificationLog and return the unsaved instance"""
+        from .models import VerificationLog
+
+        entry = VerificationLog(**fields)
+        self._ensure_thread()
+        if not self._offer(entry):
+            self.flush()
+            self._offer(entry, force=True)
+        return entry
+
+    async def alog(self, **fields):
+        """log() for async views: an overflow flush runs in a thread instead of on the event loop"""
+        from .models import VerificationLog
+
+        entry = VerificationLog(**fields)
+        self._ensure_thread()
+        if not self._offer(entry):
+            await sync_to_async(self.flush)()
+            self._offer(entry, force=True)
+        return entry
+
+    def flush(self):
+        """Write every queued entry; returns the number of rows inserted"""
+        from .models import VerificationLog
+        from .log_storage import record_daily_counts
+
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._queue)
+                self._queue.clear()
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            try:
+                # An overflow flush can run inside a request's transaction
+                if not connection.in_atomic_block:
+                    close_old_connections()
+                with transaction.atomic():
+                    VerificationLog.objects.bulk_create(batch, batch_size=self.batch_size)
+                    record_daily_counts(batch)
+            except Exception:
+                logger.exception("Dropped %d verification log entries after a failed flush", len(batch))
+                with self._lock:
+                    self.failed += len(batch)
+                return 0
+            elapsed = time.monotonic() - started
+
+            with self._lock:
+                self.written += len(batch)
+                self.flushes += 1
+                self.last_flush_seconds = elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            return len(batch)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': len(self._queue),
+                'max_queue': self.max_queue,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'flushes': self.flushes,
+                'last_flush_seconds': self.last_flush_seconds,
+                'max_flush_seconds': self.max_flush_seconds,
+            }
+
+
+def _build_writer():
+    writer = VerificationLogWriter(
+        batch_size=getattr(settings, 'VERIFICATION_LOG_BATCH_SIZE', 200),
+        flush_interval=getattr(settings, 'VERIFICATION_LOG_FLUSH_INTERVAL', 2.0),
+        max_queue=getattr(settings, 'VERIFICATION_LOG_MAX_QUEUE', 10000),
+        overflow=getattr(settings, 'VERIFICATION_LOG_OVERFLOW', 'flush'),
+    )
+    # Drain whatever is left when the worker shuts down
+    atexit.register(writer.flush)
+    return writer
+
+
+log_writer = SimpleLazyObject(_build_writer)
+
+
+def _verification_fields(request, staff_pk, user):
+    return {
+        'staff_id': staff_pk,
+        'verified_by': user if user.is_authenticated else None,
+        'ip_address': get_client_ip(request),
+        'user_agent': request.META.get('HTTP_USER_AGENT', '')[:500],
+    }
+
+
+def _write_logs(fields_list):
+    from .models import VerificationLog
+    from .log_storage import record_daily_counts
+    with transaction.atomic():
+        entries = VerificationLog.objects.bulk_create([VerificationLog(**fields) for fields in fields_list])
+        record_daily_counts(entries)
+    return entries
+
+
+def _write_log(fields):
+    return _write_logs([fields])[0]
+
+
+def log_verification(request, staff_pk):
+    """Record a verification attempt, buffered unless VERIFICATION_LOG_BUFFERED is off"""
+    fields = _verification_fields(request, staff_pk, request.user)
+    if getattr(settings, 'VERIFICATION_LOG_BUFFERED', True):
+        return log_writer.log(**fields)
+    return _write_log(fields)
+
+
+async def alog_verification(request, staff_pk):
+    """log_verification() for async views; only an unbuffered write or overflow flush leaves the event loop"""
+    fields = _verification_fields(request, staff_pk, await request.auser())
+    if getattr(settings, 'VERIFICATION_LOG_BUFFERED', True):
+        return await log_writer.alog(**fields)
+    return await sync_to_async(_write_log)(fields)
+
+
+def log_verifications(request, staff_pks, user=None):
+    """
+    Record one verification per staff pk (repeats included) for a batch
+    request, by `user` (default: request.user), as one bulk insert. A batch
+    is already the grouping the buffer would make, so it is written in the
+    request whether or not VERIFICATION_LOG_BUFFERED is on.
+    """
+    fields = _verification_fields(request, None, user or request.user)
+    fields_list = [{**fields, 'staff_id': staff_pk} for staff_pk in staff_pks]
+    if not fields_list:
+        return []
+    return _write_logs(fields_list)
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from staff.expiry import expire_staff, expiring_staff
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark active staff whose cards have passed date_expiry as expired, and list the cards "
+        "expiring soon. Schedule daily, shortly after midnight."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report-days', type=int,
+                            default=getattr(settings, 'EXPIRY_WARNING_DAYS', 30),
+                            help="List active staff expiring within this many days; 0 skips the report")
+
+    def handle(self, *args, **options):
+        expired = expire_staff()
+        self.stdout.write(self.style.SUCCESS(f"Marked {len(expired)} staff as expired"))
+
+        days = options['report_days']
+        if days:
+            expiring = expiring_staff(days).only('staff_id', 'first_name', 'last_name', 'department', 'date_expiry')
+            count = 0
+            for staff in expiring.iterator():
+                count += 1
+                self.stdout.write(f"{staff.date_expiry:%Y-%m-%d}  {staff.staff_id:<20} "
+                                  f"{staff.get_full_name()} ({staff.get_department_display()})")
+            self.stdout.write(f"{count} card(s) expire in the next {days} day(s)")
@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from staff.roster import InvalidCursor, build_snapshot, roster_changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the active roster snapshot (SQLite) for provisioning offline kiosks, "
+        "or with --since the JSON changes after a kiosk's cursor"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="File to write")
+        parser.add_argument('--since', metavar='CURSOR', help="Write the delta after this cursor instead")
+        parser.add_argument('--limit', type=int, help="Rows per delta (defaults to ROSTER_DELTA_LIMIT)")
+
+    def handle(self, *args, **options):
+        if options['since'] is None:
+            data = build_snapshot()
+            with open(options['output'], 'wb') as fileobj:
+                fileobj.write(data)
+            self.stdout.write(self.style.SUCCESS(f"Wrote roster snapshot ({len(data)} bytes) to {options['output']}"))
+            return
+
+        try:
+            delta = roster_changes(options['since'], limit=options['limit'])
+        except InvalidCursor as exc:
+            raise CommandError(exc)
+        with open(options['output'], 'w') as fileobj:
+            json.dump(delta, fileobj, separators=(',', ':'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(delta['changed'])} changed and {len(delta['removed'])} removed staff to "
+            f"{options['output']}; next cursor {delta['cursor']}{' (more pending)' if delta['has_more'] else ''}"
+        ))
@@ -0,0 +1,56 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from staff.models import Staff
+from staff.photos import delete_photo_renditions, try_build_photo_renditions
+from staff.utils import process_map
+
+
+class Command(BaseCommand):
+    help = "Build thumbnail, verify-page and card renditions for staff photos that lack them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild renditions that already exist")
+        parser.add_argument('--workers', type=int, help="Resize processes (defaults to BULK_PDF_WORKERS)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Photos per batch; each batch gets one process pool")
+
+    def handle(self, *args, **options):
+        staff_queryset = (
+            Staff.objects.exclude(photo='').exclude(photo__isnull=True)
+            .only('id', 'uuid', 'photo', 'photo_renditions').order_by('id')
+        )
+        if not options['force']:
+            staff_queryset = staff_queryset.filter(photo_renditions={})
+
+        rows = staff_queryset.iterator(chunk_size=options['batch_size'])
+        built = failed = 0
+        while True:
+            batch = list(islice(rows, options['batch_size']))
+            if not batch:
+                break
+            results = process_map(try_build_photo_renditions, [staff.photo.name for staff in batch],
+                                  options['workers'], chunksize=8)
+
+            updated = []
+            now = timezone.now()
+            for staff, renditions in zip(batch, results):
+                if renditions is None:
+                    failed += 1
+                    self.stderr.write(f"Could not read {staff.photo.name}")
+                    continue
+                # Same paths are overwritten; only stale extras need removing
+                delete_photo_renditions({
+                    name: path for name, path in staff.photo_renditions.items() if path not in renditions.values()
+                })
+                staff.photo_renditions = renditions
+                # Cards and ETags follow updated_at, so they pick up the new photos
+                staff.updated_at = now
+                updated.append(staff)
+            Staff.objects.bulk_update(updated, ['photo_renditions', 'updated_at'])
+            Staff.bulk_invalidate_caches(staff.uuid for staff in updated)
+            built += len(updated)
+
+        self.stdout.write(self.style.SUCCESS(f"Built renditions for {built} photo(s), {failed} failed"))
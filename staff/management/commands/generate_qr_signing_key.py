@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from staff.offline import generate_signing_key
+
+
+class Command(BaseCommand):
+    help = "Print a new Ed25519 key for QR_SIGNING_KEY; keep it secret and out of version control"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"QR_SIGNING_KEY={generate_signing_key()}")
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from staff.importer import StaffImportError, import_staff
+
+
+class Command(BaseCommand):
+    help = "Create or update staff from an HR export (.csv or .xlsx), matching rows on staff_id"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or XLSX file with a header row")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Rows validated and written per batch")
+        parser.add_argument('--workers', type=int, help="QR generation processes (defaults to BULK_PDF_WORKERS)")
+        parser.add_argument('--dry-run', action='store_true', help="Validate only, write nothing")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                result = import_staff(
+                    fileobj, options['path'],
+                    chunk_size=options['chunk_size'],
+                    workers=options['workers'],
+                    dry_run=options['dry_run'],
+                )
+        except (OSError, StaffImportError) as exc:
+            raise CommandError(str(exc))
+
+        for row_number, message in result.errors:
+            self.stderr.write(f"Row {row_number}: {message}")
+        prefix = "Dry run: would have " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}created {result.created}, updated {result.updated}, left {result.unchanged} unchanged, "
+            f"generated {result.qr_generated} QR code(s), {len(result.errors)} row(s) rejected"
+        ))
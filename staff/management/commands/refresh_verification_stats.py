@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from staff.analytics import rebuild_hourly_counts, refresh_hourly_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Add new verification logs to the hourly analytics counts, from where the last refresh stopped. "
+        "Schedule every few minutes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Recount from the raw log (e.g. after changing VERIFICATION_GATES)")
+        parser.add_argument('--since', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                            help="With --rebuild, only recount hours from this date")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            mark = rebuild_hourly_counts(options['since'])
+        else:
+            mark = refresh_hourly_counts()
+        if mark is None:
+            self.stdout.write("Another refresh is running")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Hourly counts are up to {timezone.localtime(mark):%Y-%m-%d %H:%M:%S %Z}"))
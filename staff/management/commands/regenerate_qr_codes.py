@@ -0,0 +1,39 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from staff.models import Staff
+from staff.utils import regenerate_qr_codes
+
+
+class Command(BaseCommand):
+    help = (
+        "Redraw QR codes that are missing or encode an outdated verification URL, "
+        "e.g. after SITE_DOMAIN changes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Redraw every code, changed or not")
+        parser.add_argument('--department', help="Only staff in this department")
+        parser.add_argument('--workers', type=int, help="QR generation processes (defaults to BULK_PDF_WORKERS)")
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help="Staff checked per batch; each stale batch gets one process pool")
+
+    def handle(self, *args, **options):
+        staff_queryset = Staff.objects.only('id', 'uuid', 'staff_id', 'status', 'date_expiry', 'qr_code', 'qr_hash').order_by('id')
+        if options['department']:
+            staff_queryset = staff_queryset.filter(department=options['department'])
+
+        rows = staff_queryset.iterator(chunk_size=options['batch_size'])
+        checked = regenerated = 0
+        while True:
+            batch = list(islice(rows, options['batch_size']))
+            if not batch:
+                break
+            checked += len(batch)
+            updated = regenerate_qr_codes(batch, workers=options['workers'], force=options['force'])
+            # Cached cards and stickers embed the old code
+            Staff.bulk_invalidate_caches(staff.uuid for staff in updated)
+            regenerated += len(updated)
+
+        self.stdout.write(self.style.SUCCESS(f"Regenerated {regenerated} of {checked} QR code(s)"))
@@ -0,0 +1,32 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from staff.jobs import prune, work
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs (QR codes, card and sticker PDFs, photo renditions) from the database queue. "
+        "Start as many as needed; they claim jobs with FOR UPDATE SKIP LOCKED"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=1, help="Jobs claimed per round trip")
+        parser.add_argument('--once', action='store_true', help="Exit when no job is due instead of polling")
+        parser.add_argument('--max-jobs', type=int, help="Exit after running this many jobs (e.g. to recycle memory)")
+        parser.add_argument('--prune-days', type=int,
+                            help="First delete finished jobs older than this many days")
+
+    def handle(self, *args, **options):
+        if options['prune_days'] is not None:
+            self.stdout.write(f"Pruned {prune(options['prune_days'])} finished job(s)")
+
+        # On SIGTERM/SIGINT finish the current job, then exit
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stopping.set())
+
+        ran = work(batch=options['batch'], once=options['once'], max_jobs=options['max_jobs'], stop=stopping)
+        self.stdout.write(self.style.SUCCESS(f"Ran {ran} job(s)"))
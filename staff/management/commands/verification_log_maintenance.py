@@ -0,0 +1,51 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from staff.log_storage import (
+    apply_retention, convert_to_partitioned, ensure_partitions, is_partitioned, rebuild_daily_counts,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain VerificationLog storage: create upcoming monthly partitions and apply the "
+        "retention window. Schedule daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help="One-off: rebuild the log table as monthly partitions (PostgreSQL only)")
+        parser.add_argument('--months-ahead', type=int,
+                            default=getattr(settings, 'VERIFICATION_LOG_PARTITION_MONTHS_AHEAD', 3))
+        parser.add_argument('--retention-days', type=int,
+                            default=getattr(settings, 'VERIFICATION_LOG_RETENTION_DAYS', 0),
+                            help="Drop logs older than this many days; 0 keeps everything")
+        parser.add_argument('--rebuild-rollup', action='store_true',
+                            help="Recompute the daily rollup from the raw log")
+        parser.add_argument('--since', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                            help="With --rebuild-rollup, only recompute days from this date")
+
+    def handle(self, *args, **options):
+        if options['convert']:
+            try:
+                convert_to_partitioned(options['months_ahead'])
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(self.style.SUCCESS("Verification logs are stored in monthly partitions"))
+
+        if is_partitioned():
+            created = ensure_partitions(options['months_ahead'])
+            self.stdout.write(f"Partitions up to {created[-1]} are in place")
+
+        if options['rebuild_rollup']:
+            rebuild_daily_counts(options['since'])
+            self.stdout.write("Daily rollup rebuilt")
+
+        if options['retention_days']:
+            removed = apply_retention(options['retention_days'])
+            if isinstance(removed, list):
+                self.stdout.write(f"Dropped {len(removed)} partition(s): {', '.join(removed) or '-'}")
+            else:
+                self.stdout.write(f"Deleted {removed} log row(s)")
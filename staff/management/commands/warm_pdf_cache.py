@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from staff.models import Staff
+from staff.pdf import warm_pdf_cache
+from staff.pdf_cache import pdf_cache
+
+
+class Command(BaseCommand):
+    help = "Pre-render ID card and QR sticker PDFs into the PDF cache, e.g. after bulk edits"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--department', help="Only staff in this department")
+        parser.add_argument('--status', help="Only staff with this status")
+        parser.add_argument('--since', type=int, metavar='MINUTES',
+                            help="Only staff updated in the last MINUTES minutes")
+        parser.add_argument('--workers', type=int, help="Card render processes (defaults to BULK_PDF_WORKERS)")
+        parser.add_argument('--clear', action='store_true', help="Empty the cache before warming")
+        parser.add_argument('--stats', action='store_true', help="Only print cache usage")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = pdf_cache.stats()
+            self.stdout.write(f"{stats['entries']} entries, {stats['size']} of {stats['max_size']} bytes")
+            return
+
+        if options['clear']:
+            pdf_cache.clear()
+
+        staff_queryset = Staff.objects.all()
+        if options['department']:
+            staff_queryset = staff_queryset.filter(department=options['department'])
+        if options['status']:
+            staff_queryset = staff_queryset.filter(status=options['status'])
+        if options['since']:
+            staff_queryset = staff_queryset.filter(
+                updated_at__gte=timezone.now() - timedelta(minutes=options['since'])
+            )
+
+        rendered = warm_pdf_cache(staff_queryset, workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f"Rendered {rendered} PDF(s) into the cache"))
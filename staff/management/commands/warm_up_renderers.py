@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from staff.renderers import ENGINES, rss_kb, loaded_engines, warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Load and prime the PDF and QR engines, reporting the time and memory each costs "
+        "(what a PDF_WARM_UP worker pays at start-up instead of on its first PDF request)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', action='append', choices=list(ENGINES), dest='engines',
+                            help="Only this engine (repeatable); defaults to all")
+
+    def handle(self, *args, **options):
+        before = rss_kb()
+        already = loaded_engines()
+        if already:
+            self.stdout.write(f"Already loaded at start-up: {', '.join(already)}")
+
+        results = warm_up(options['engines'])
+        for name, result in results.items():
+            memory = f"{result['rss_kb'] / 1024:+.1f} MB" if result['rss_kb'] is not None else "n/a"
+            self.stdout.write(f"{name:<12}{result['seconds'] * 1000:>8.0f} ms{memory:>12}")
+
+        total = sum(result['seconds'] for result in results.values())
+        after = rss_kb()
+        if before is not None and after is not None:
+            self.stdout.write(f"{'total':<12}{total * 1000:>8.0f} ms{(after - before) / 1024:>+9.1f} MB "
+                              f"(RSS {before / 1024:.1f} -> {after / 1024:.1f} MB)")
+        else:
+            self.stdout.write(f"{'total':<12}{total * 1000:>8.0f} ms")
@@ -0,0 +1,122 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .timing import SPANS, end_request, endpoint_stats, start_request
+
+logger = logging.getLogger('staff.timing')
+
+
+class ServerTimingMiddleware:
+    """
+    Time every request and report it three ways.
+
+    - A Server-Timing header with the db, template, pdf and qr spans plus the
+      total, visible in the browser's network panel. Only staff users get it,
+      or everyone while DEBUG is on, so it does not reveal timings publicly.
+    - A structured 'staff.timing' log line at DEBUG level.
+    - The rolling per-endpoint histograms behind the timing stats page.
+
+    Streaming responses are timed up to the point the body starts streaming.
+    Works in sync and async stacks, so async views stay on the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'SERVER_TIMING', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        timings, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        user = getattr(request, 'user', None)
+        self.report(request, response, timings, show_header=settings.DEBUG or bool(user and user.is_staff))
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        timings, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        show_header = settings.DEBUG
+        if not show_header and hasattr(request, 'auser'):
+            show_header = (await request.auser()).is_staff
+        self.report(request, response, timings, show_header=show_header)
+        return response
+
+    def report(self, request, response, timings, show_header=False):
+        total = timings.total()
+
+        if show_header:
+            metrics = [f'{name};dur={timings.spans[name]:.1f}' for name in SPANS if timings.spans[name]]
+            metrics.append(f'total;dur={total:.1f};desc="{timings.queries} queries"')
+            response['Server-Timing'] = ', '.join(metrics)
+
+        match = request.resolver_match
+        endpoint = match.view_name if match else None
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "%s %s %s total=%.1fms queries=%d %s",
+                request.method, endpoint or request.path, response.status_code, total, timings.queries,
+                ' '.join(f'{name}={timings.spans[name]:.1f}ms' for name in SPANS),
+                extra={
+                    'endpoint': endpoint, 'path': request.path, 'status': response.status_code,
+                    'total_ms': round(total, 1), 'queries': timings.queries,
+                    **{f'{name}_ms': round(timings.spans[name], 1) for name in SPANS},
+                },
+            )
+        if endpoint:
+            endpoint_stats.record(endpoint, total, timings)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that can also sit in an async (ASGI) stack.
+
+    WhiteNoise's own middleware is sync-only, which makes Django run every
+    view of an ASGI deployment through a thread. The lookup is an in-memory
+    dict (or a stat() with WHITENOISE_AUTOREFRESH in development), so it is
+    done inline either way.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    def _static_file(self, request):
+        if self.autorefresh:
+            return self.find_file(request.path_info)
+        return self.files.get(request.path_info)
+
+    async def __acall__(self, request):
+        static_file = self._static_file(request)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('staff', '0002_verificationlog_verified_by'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='verificationlog',
+            name='verified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('staff', '0003_verificationlog_verified_at_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VerificationDailyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department', models.CharField(choices=[('medical', 'Medical'), ('nursing', 'Nursing'), ('admin', 'Administration'), ('lab', 'Laboratory'), ('pharmacy', 'Pharmacy'), ('radiology', 'Radiology'), ('support', 'Support Services')], max_length=50)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='verificationlog',
+            index=models.Index(fields=['staff', '-verified_at'], name='staff_vlog_staff_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationlog',
+            index=models.Index(fields=['-verified_at'], name='staff_vlog_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='verificationdailycount',
+            name='staff',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_verification_counts', to='staff.staff'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationdailycount',
+            index=models.Index(fields=['day', 'department'], name='staff_vdaily_day_dept_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='verificationdailycount',
+            constraint=models.UniqueConstraint(fields=('staff', 'department', 'day'), name='staff_vdaily_unique'),
+        ),
+    ]
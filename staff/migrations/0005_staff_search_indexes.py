@@ -0,0 +1,43 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models.functions import Cast, Upper
+
+# PostgreSQL only; other databases keep the unindexed icontains search
+SEARCH_INDEXES = [
+    GinIndex(
+        SearchVector('staff_id', 'first_name', 'last_name', 'email', config='simple'),
+        name='staff_search_idx',
+    ),
+    models.Index(
+        OpClass(Upper(Cast('staff_id', output_field=models.TextField())), name='text_pattern_ops'),
+        name='staff_id_prefix_idx',
+    ),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Staff = apps.get_model('staff', 'Staff')
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(Staff, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Staff = apps.get_model('staff', 'Staff')
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(Staff, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('staff', '0004_verification_log_indexes_daily_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
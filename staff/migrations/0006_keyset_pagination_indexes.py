@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('staff', '0005_staff_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='verificationlog',
+            name='staff_vlog_staff_time_idx',
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(fields=['-created_at', '-id'], name='staff_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(fields=['department', '-created_at', '-id'], name='staff_dept_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='staff_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationlog',
+            index=models.Index(fields=['staff', '-verified_at', '-id'], name='staff_vlog_staff_time_idx'),
+        ),
+    ]
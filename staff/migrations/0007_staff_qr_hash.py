@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('staff', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staff',
+            name='qr_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_revocations(apps, schema_editor):
+    """Start the revocation list with everyone who is not active today"""
+    Staff = apps.get_model('staff', 'Staff')
+    RevocationEvent = apps.get_model('staff', 'RevocationEvent')
+    RevocationEvent.objects.bulk_create(
+        RevocationEvent(staff_uuid=staff_uuid, revoked=True)
+        for staff_uuid in Staff.objects.exclude(status='active').values_list('uuid', flat=True).iterator()
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('staff', '0007_staff_qr_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevocationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('staff_uuid', models.UUIDField(db_index=True)),
+                ('revoked', models.BooleanField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(seed_revocations, migrations.RunPython.noop),
+    ]
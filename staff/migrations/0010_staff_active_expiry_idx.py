@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('staff', '0009_staff_photo_renditions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['date_expiry', 'id'], name='staff_active_expiry_idx'),
+        ),
+    ]
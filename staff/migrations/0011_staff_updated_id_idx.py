@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('staff', '0010_staff_active_expiry_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(fields=['updated_at', 'id'], name='staff_updated_id_idx'),
+        ),
+    ]
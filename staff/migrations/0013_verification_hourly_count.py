@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('staff', '0012_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AggregateWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('verified_at', models.DateTimeField()),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VerificationHourlyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('department', models.CharField(choices=[('medical', 'Medical'), ('nursing', 'Nursing'), ('admin', 'Administration'), ('lab', 'Laboratory'), ('pharmacy', 'Pharmacy'), ('radiology', 'Radiology'), ('support', 'Support Services')], max_length=50)),
+                ('gate', models.CharField(blank=True, max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-hour'],
+                'constraints': [models.UniqueConstraint(fields=('hour', 'department', 'gate'), name='staff_vhourly_unique')],
+            },
+        ),
+    ]
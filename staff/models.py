@@ -31,9 +31,13 @@ class Staff(models.Model):
     email = models.EmailField(blank=True)
     phone = models.CharField(max_length=20, blank=True)
     photo = models.ImageField(upload_to='staff_photos/', blank=True, null=True)
+    # Resized copies of photo by rendition name (see photos.RENDITIONS)
+    photo_renditions = models.JSONField(default=dict, blank=True, editable=False)
     
     # QR Code
     qr_code = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
+    # Fingerprint of the URL encoded in qr_code (see utils.qr_content_hash)
+    qr_hash = models.CharField(max_length=40, blank=True, editable=False)
     
     # Employment Details
     department = models.CharField(max_length=50, choices=DEPARTMENT_CHOICES)
@@ -51,6 +55,17 @@ class Staff(models.Model):
     class Meta:
         verbose_name_plural = "Staff"
         ordering = ['-created_at']
+        # Keyset pagination seeks on (created_at, id), optionally within a filter
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='staff_created_id_idx'),
+            models.Index(fields=['department', '-created_at', '-id'], name='staff_dept_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='staff_status_created_idx'),
+            # Expiry sweep and "expiring soon" report only ever look at active staff
+            models.Index(fields=['date_expiry', 'id'], name='staff_active_expiry_idx',
+                         condition=models.Q(status='active')),
+            # Kiosk roster delta sync reads rows in (updated_at, id) order after a cursor
+            models.Index(fields=['updated_at', 'id'], name='staff_updated_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.staff_id} - {self.get_full_name()}"
@@ -67,20 +82,103 @@ class Staff(models.Model):
         return False
     
     def get_status_display_class(self):
+        # Checks the date too: a card expires at midnight, before the sweep updates its status
         if self.status == 'active' and not self.is_expired():
             return 'success'
         return 'danger'
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so saves can tell when a card is revoked
+        if 'status' in field_names:
+            instance._loaded_status = values[field_names.index('status')]
+        # ...and the stored photo, so renditions are only rebuilt for new uploads
+        if 'photo' in field_names:
+            instance._loaded_photo = values[field_names.index('photo')] or ''
+        return instance
+    
     def save(self, *args, **kwargs):
         """Generate QR code on save"""
+        from .offline import record_status_changes
         super().save(*args, **kwargs)
+        record_status_changes([self])
+        
+        # Generate QR code if it doesn't exist or encodes an outdated URL
+        from .jobs import enqueue_on_commit, jobs_enabled
+        from .utils import generate_qr_code, qr_content_hash
+        qr_hash = qr_content_hash(self)
+        if not self.qr_code or self.qr_hash != qr_hash:
+            if jobs_enabled():
+                # Drawn by the run_jobs worker instead of holding up the request
+                enqueue_on_commit('qr_code', self)
+            else:
+                qr_path = generate_qr_code(self, save_to_file=True)
+                self.qr_code = qr_path
+                self.qr_hash = qr_hash
+                super().save(update_fields=['qr_code', 'qr_hash', 'updated_at'])
+        
+        photo_name = self.photo.name if self.photo else ''
+        if photo_name != getattr(self, '_loaded_photo', '') or (photo_name and not self.photo_renditions):
+            if jobs_enabled():
+                # The original photo is shown until the worker has built the renditions
+                from .photos import delete_photo_renditions
+                delete_photo_renditions(self.photo_renditions)
+                self.photo_renditions = {}
+                self._loaded_photo = photo_name
+                super().save(update_fields=['photo_renditions', 'updated_at'])
+                enqueue_on_commit('photo_renditions', self)
+            else:
+                self.refresh_photo_renditions()
         
-        # Generate QR code if it doesn't exist
-        if not self.qr_code:
-            from .utils import generate_qr_code
-            qr_path = generate_qr_code(self, save_to_file=True)
-            self.qr_code = qr_path
-            super().save(update_fields=['qr_code'])
+        # Rendered cards, stickers and verify records for the old row are stale now
+        self.invalidate_caches()
+    
+    def refresh_photo_renditions(self):
+        """Replace the photo renditions with ones built from the current photo"""
+        from .photos import build_photo_renditions, delete_photo_renditions
+        delete_photo_renditions(self.photo_renditions)
+        self.photo_renditions = build_photo_renditions(self.photo.name) if self.photo else {}
+        self._loaded_photo = self.photo.name if self.photo else ''
+        super().save(update_fields=['photo_renditions', 'updated_at'])
+    
+    def photo_rendition_url(self, rendition):
+        """URL of a resized photo, falling back to the original until it has been built"""
+        path = self.photo_renditions.get(rendition)
+        if path:
+            return self.photo.storage.url(path)
+        return self.photo.url if self.photo else ''
+    
+    @property
+    def photo_thumb_url(self):
+        return self.photo_rendition_url('thumb')
+    
+    @property
+    def photo_verify_url(self):
+        return self.photo_rendition_url('verify')
+    
+    @property
+    def photo_card_url(self):
+        return self.photo_rendition_url('card')
+    
+    def delete(self, *args, **kwargs):
+        from .offline import record_deletions
+        record_deletions([self])
+        self.invalidate_caches()
+        return super().delete(*args, **kwargs)
+    
+    def invalidate_caches(self):
+        Staff.bulk_invalidate_caches([self.uuid])
+    
+    @staticmethod
+    def bulk_invalidate_caches(uuids):
+        """Drop the cached PDFs and verify records of many staff members at once"""
+        from .pdf_cache import pdf_cache
+        from .verify_cache import invalidate_verifications
+        uuids = list(uuids)
+        if uuids:
+            pdf_cache.invalidate_many(uuids)
+            invalidate_verifications(uuids)
 
 
 class VerificationLog(models.Model):
@@ -88,10 +186,124 @@ class VerificationLog(models.Model):
     verified_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     ip_address = models.GenericIPAddressField()
     user_agent = models.TextField(blank=True)
-    verified_at = models.DateTimeField(auto_now_add=True)
+    # Set when the entry is built so buffered writes keep the request time
+    verified_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-verified_at']
+        indexes = [
+            models.Index(fields=['staff', '-verified_at', '-id'], name='staff_vlog_staff_time_idx'),
+            models.Index(fields=['-verified_at'], name='staff_vlog_time_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.staff.staff_id} verified at {self.verified_at}"
+
+
+class VerificationDailyCount(models.Model):
+    """Verifications per staff member, department and local day, kept up to date as logs are written"""
+    staff = models.ForeignKey(Staff, on_delete=models.CASCADE, related_name='daily_verification_counts')
+    department = models.CharField(max_length=50, choices=Staff.DEPARTMENT_CHOICES)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['staff', 'department', 'day'], name='staff_vdaily_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'department'], name='staff_vdaily_day_dept_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.staff.staff_id} on {self.day}: {self.count}"
+
+
+class VerificationHourlyCount(models.Model):
+    """Verifications per local hour, department and gate, added incrementally from the log (see staff.analytics)"""
+    hour = models.DateTimeField()
+    department = models.CharField(max_length=50, choices=Staff.DEPARTMENT_CHOICES)
+    # A VERIFICATION_GATES name; blank for scans from anywhere else
+    gate = models.CharField(max_length=50, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-hour']
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'department', 'gate'], name='staff_vhourly_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} {self.department} {self.gate or 'other'}: {self.count}"
+
+
+class AggregateWatermark(models.Model):
+    """How far, in verified_at, an incrementally refreshed aggregate has read the verification log"""
+    name = models.CharField(max_length=50, unique=True)
+    verified_at = models.DateTimeField()
+    refreshed_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} up to {self.verified_at}"
+
+
+class RevocationEvent(models.Model):
+    """
+    A staff member's offline token became invalid (revoked) or valid again.
+
+    Appended whenever status crosses the active/non-active line or a staff
+    member is deleted; the event id doubles as the revocation list version.
+    """
+    staff_uuid = models.UUIDField(db_index=True)
+    revoked = models.BooleanField()
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.staff_uuid} {'revoked' if self.revoked else 'restored'} at {self.created_at}"
+
+
+class Job(models.Model):
+    """
+    A unit of background work (QR code, card or sticker PDF, photo renditions)
+    for the manage.py run_jobs worker, which claims queued rows with
+    SELECT ... FOR UPDATE SKIP LOCKED (see staff.jobs).
+    """
+    KIND_CHOICES = [
+        ('qr_code', 'QR code'),
+        ('card_pdf', 'Card PDF'),
+        ('sticker_pdf', 'Sticker PDF'),
+        ('photo_renditions', 'Photo renditions'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    staff = models.ForeignKey(Staff, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Not picked up before this time; pushed back exponentially after each failure
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Workers only ever scan the queued rows, oldest due first
+            models.Index(fields=['run_after', 'id'], name='staff_job_queued_idx',
+                         condition=models.Q(status='queued')),
+            models.Index(fields=['staff', 'kind', 'status'], name='staff_job_staff_kind_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.staff.staff_id} verified at {self.verified_at}"
\ No newline at end of file
+        return f"{self.get_kind_display()} for staff {self.staff_id} ({self.status})"
@@ -0,0 +1,156 @@
+"""
+Offline verification: Ed25519-signed QR tokens and the revocation list.
+
+With QR_PAYLOAD_MODE = 'signed' each QR code still points at the verify page
+but carries ?t=<token>, where token is
+
+    base64url(payload) "." base64url(signature)
+    payload = "1|<uuid hex>|<staff_id>|<status>|<expiry YYYYMMDD or empty>"
+
+A gate scanner holding the public key (/verify/key/) checks the signature,
+status and expiry itself, then looks the uuid up in its copy of the
+revocation list (/verify/revocations/?since=<version>), which it refreshes
+incrementally whenever it is online.
+
+The list version is a RevocationEvent id. Only events older than
+ROSTER_SYNC_LAG_SECONDS count towards it: ids are handed out at insert but
+rows become visible at commit, so a newer event can be seen while an older
+id is still uncommitted, and a scanner past that version would never get it.
+"""
+import base64
+from datetime import timedelta
+from functools import lru_cache
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signing import BadSignature
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import RevocationEvent
+
+TOKEN_VERSION = '1'
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def is_revoked(status):
+    return status != 'active'
+
+
+@lru_cache(maxsize=None)
+def _private_key(seed):
+    if not seed:
+        raise ImproperlyConfigured("QR_PAYLOAD_MODE = 'signed' needs QR_SIGNING_KEY (see generate_qr_signing_key)")
+    return Ed25519PrivateKey.from_private_bytes(_b64decode(seed))
+
+
+def private_key():
+    return _private_key(getattr(settings, 'QR_SIGNING_KEY', ''))
+
+
+def public_key_b64():
+    """Raw 32-byte public key, base64url encoded, for scanners"""
+    raw = private_key().public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return _b64encode(raw)
+
+
+def generate_signing_key():
+    """New base64url Ed25519 private key seed for QR_SIGNING_KEY"""
+    raw = Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption()
+    )
+    return _b64encode(raw)
+
+
+def sign_staff_token(staff):
+    """Signed token stating a staff member's identity, status and expiry"""
+    expiry = staff.date_expiry.strftime('%Y%m%d') if staff.date_expiry else ''
+    payload = '|'.join([TOKEN_VERSION, staff.uuid.hex, staff.staff_id, staff.status, expiry]).encode('utf-8')
+    return f"{_b64encode(payload)}.{_b64encode(private_key().sign(payload))}"
+
+
+def verify_staff_token(token, public_key=None):
+    """
+    Check a token's signature and return its claims as a dict.
+
+    Reference implementation of the scanner side; raises BadSignature for
+    anything malformed or forged. Status, expiry and revocation are left to
+    the caller.
+    """
+    if public_key is None:
+        public_key = public_key_b64()
+    try:
+        payload_b64, signature_b64 = token.split('.')
+        payload = _b64decode(payload_b64)
+        Ed25519PublicKey.from_public_bytes(_b64decode(public_key)).verify(_b64decode(signature_b64), payload)
+        version, uuid_hex, staff_id, status, expiry = payload.decode('utf-8').split('|')
+    except (ValueError, InvalidSignature):
+        raise BadSignature("Invalid staff token")
+    if version != TOKEN_VERSION:
+        raise BadSignature(f"Unsupported staff token version {version}")
+    return {'uuid': uuid_hex, 'staff_id': staff_id, 'status': status, 'date_expiry': expiry or None}
+
+
+def record_status_changes(staff_members):
+    """
+    Append revocation events for staff whose status crossed the active line.
+
+    Compares against the status the instance was loaded with (Staff.from_db);
+    new staff only produce an event when created non-active.
+    """
+    events = []
+    for staff in staff_members:
+        previous = getattr(staff, '_loaded_status', None)
+        revoked = is_revoked(staff.status)
+        if (revoked if previous is None else revoked != is_revoked(previous)):
+            events.append(RevocationEvent(staff_uuid=staff.uuid, revoked=revoked))
+        staff._loaded_status = staff.status
+    if events:
+        RevocationEvent.objects.bulk_create(events)
+
+
+def record_deletions(staff_members):
+    """Revoke deleted staff, whose already printed cards would otherwise stay valid offline"""
+    RevocationEvent.objects.bulk_create(
+        [RevocationEvent(staff_uuid=staff.uuid, revoked=True) for staff in staff_members]
+    )
+
+
+def revocation_version():
+    """The newest event id that every scanner can safely move past (see the module docstring)"""
+    horizon = timezone.now() - timedelta(seconds=getattr(settings, 'ROSTER_SYNC_LAG_SECONDS', 5))
+    return RevocationEvent.objects.filter(created_at__lte=horizon).aggregate(version=Max('id'))['version'] or 0
+
+
+def revocation_list(since=0):
+    """
+    Revoked and restored staff uuids since a list version.
+
+    since=0 returns the full list of currently revoked staff; otherwise only
+    staff whose state changed after that version, collapsed to their latest
+    state. The returned version is what the scanner passes next time; events
+    newer than ROSTER_SYNC_LAG_SECONDS wait for a later call.
+    """
+    events = RevocationEvent.objects.filter(id__gt=since, id__lte=revocation_version())
+    latest = events.values('staff_uuid').annotate(last_id=Max('id')).values('last_id')
+    revoked, restored = [], []
+    version = since
+    for event_id, staff_uuid, is_now_revoked in (
+        RevocationEvent.objects.filter(id__in=latest).order_by('id').values_list('id', 'staff_uuid', 'revoked')
+    ):
+        version = event_id
+        (revoked if is_now_revoked else restored).append(staff_uuid.hex)
+
+    if not since:
+        restored = []
+    return {'version': version, 'full': not since, 'revoked': revoked, 'restored': restored}
@@ -0,0 +1,112 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator, with opaque cursors for its neighbours"""
+
+    def __init__(self, paginator, object_list, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return ''
+        return self.paginator.encode_cursor('next', self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return ''
+        return self.paginator.encode_cursor('prev', self.object_list[0])
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination that seeks on a unique, descending key instead of OFFSET.
+
+    Pages are fetched with WHERE k1 <= v1 AND (k1 < v1 OR (k1 = v1 AND k2 < v2))
+    ORDER BY k1 DESC, k2 DESC. The OR alone cannot bound an index scan; the
+    redundant k1 <= v1 lets the (k1, k2) index seek to the cursor, so every
+    page costs the same range scan however deep it is, and no COUNT(*) is
+    issued. The last key must be unique (normally 'id').
+    """
+
+    def __init__(self, queryset, per_page, keys=('created_at', 'id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.keys = keys
+        self._fields = [queryset.model._meta.get_field(key) for key in keys]
+
+    def encode_cursor(self, direction, obj):
+        values = [getattr(obj, key) for key in self.keys]
+        # str() keeps full microsecond precision, unlike DjangoJSONEncoder
+        raw = json.dumps([direction, values], default=str)
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Return (direction, values); an invalid or missing cursor means the first page"""
+        if not cursor:
+            return 'next', None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(raw)
+            if direction not in ('next', 'prev') or len(values) != len(self.keys):
+                raise ValueError
+            values = [field.to_python(value) for field, value in zip(self._fields, values)]
+        except (ValueError, TypeError, binascii.Error, ValidationError):
+            return 'next', None
+        return direction, values
+
+    def _seek(self, values, before):
+        """Rows strictly after (before=False) or before (before=True) the position in descending order"""
+        lookup = 'gt' if before else 'lt'
+        # Redundant with the OR below, but it is what bounds the index scan
+        bound = Q(**{f"{self.keys[0]}__{'gte' if before else 'lte'}": values[0]})
+        condition = Q()
+        for index, key in enumerate(self.keys):
+            step = Q(**{f'{key}__{lookup}': values[index]})
+            for previous, value in zip(self.keys[:index], values[:index]):
+                step &= Q(**{previous: value})
+            condition |= step
+        return bound & condition
+
+    def page(self, cursor=None):
+        direction, values = self.decode_cursor(cursor)
+        descending = [f'-{key}' for key in self.keys]
+
+        if direction == 'prev':
+            rows = list(
+                self.queryset.filter(self._seek(values, before=True)).order_by(*self.keys)[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            return KeysetPage(self, rows[:self.per_page][::-1], has_next=True, has_previous=has_previous)
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, before=False))
+        rows = list(queryset.order_by(*descending)[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return KeysetPage(self, rows[:self.per_page], has_next=has_next, has_previous=values is not None)
@@ -0,0 +1,212 @@
+import multiprocessing
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.template.loader import get_template
+
+from . import renderers
+from .pdf_cache import pdf_cache
+from .pdf_resources import link_callback
+from .timing import timed
+from .utils import bulk_workers, init_django_worker
+
+CARD_TEMPLATE = 'staff/card_pdf_output.html'
+STICKER_TEMPLATE = 'staff/qr_sticker_pdf.html'
+
+
+def render_pdf_bytes(template_src, context_dict=None):
+    """Render a template to PDF bytes, or None if xhtml2pdf reports an error"""
+    template = get_template(template_src)
+    html = template.render(context_dict or {})
+    result = BytesIO()
+
+    with timed('pdf'):
+        pdf = renderers.pisa().pisaDocument(BytesIO(html.encode("UTF-8")), result, link_callback=link_callback)
+
+    if pdf.err:
+        return None
+    return result.getvalue()
+
+
+def card_engine():
+    """'html' (xhtml2pdf and card_pdf_output.html) or 'reportlab' (pdf_canvas), from CARD_PDF_ENGINE"""
+    return getattr(settings, 'CARD_PDF_ENGINE', 'html')
+
+
+def card_cache_key():
+    # Cached cards are kept per engine so switching engines never serves the other's output
+    return CARD_TEMPLATE if card_engine() == 'html' else f'{CARD_TEMPLATE}:{card_engine()}'
+
+
+def render_card_pdf(staff):
+    """Render the front and back ID card for one staff member"""
+    if card_engine() == 'reportlab':
+        with timed('pdf'):
+            return renderers.card_canvas()(staff)
+    return render_pdf_bytes(CARD_TEMPLATE, {
+        'staff': staff,
+        'settings': settings,
+    })
+
+
+def render_sticker_pdf(staff):
+    """Render the QR code sticker for one staff member"""
+    return render_pdf_bytes(STICKER_TEMPLATE, {'staff': staff})
+
+
+def cached_card_pdf(staff):
+    """Open file for the staff member's card PDF, served from the PDF cache when current"""
+    return pdf_cache.get_or_render(staff, card_cache_key(), lambda: render_card_pdf(staff))
+
+
+def cached_sticker_pdf(staff):
+    """Open file for the staff member's QR sticker PDF, served from the PDF cache when current"""
+    return pdf_cache.get_or_render(staff, STICKER_TEMPLATE, lambda: render_sticker_pdf(staff))
+
+
+def pdf_ready(staff, kind):
+    """Whether the current 'card_pdf' or 'sticker_pdf' for a staff member is already in the PDF cache"""
+    return pdf_cache.contains(staff, card_cache_key() if kind == 'card_pdf' else STICKER_TEMPLATE)
+
+
+def warm_pdf_cache(staff_members, workers=None):
+    """
+    Render and store any cards and stickers missing from the PDF cache.
+
+    Returns the number of documents rendered. Cards go through the bulk
+    render pool; stickers are small enough to render inline.
+    """
+    staff_members = list(staff_members)
+    rendered = 0
+
+    missing_cards = [staff for staff in staff_members if not pdf_cache.contains(staff, card_cache_key())]
+    for staff, pdf in iter_card_pdfs(missing_cards, workers):
+        if pdf is not None:
+            pdf_cache.put(staff, card_cache_key(), pdf)
+            rendered += 1
+
+    for staff in staff_members:
+        if pdf_cache.contains(staff, STICKER_TEMPLATE):
+            continue
+        pdf = render_sticker_pdf(staff)
+        if pdf is not None:
+            pdf_cache.put(staff, STICKER_TEMPLATE, pdf)
+            rendered += 1
+
+    return rendered
+
+
+def iter_card_pdfs(staff_members, workers=None):
+    """
+    Yield (staff, pdf_bytes) pairs in order, rendering cards in a process pool.
+
+    Only a bounded window of renders is in flight at any time, so the caller
+    can write each document out before the next ones are produced.
+    """
+    staff_members = list(staff_members)
+    workers = min(bulk_workers(workers), len(staff_members))
+
+    if workers <= 1:
+        for staff in staff_members:
+            yield staff, render_card_pdf(staff)
+        return
+
+    # Spawned workers never share the parent's database connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=init_django_worker) as executor:
+        pending = deque()
+        members = iter(staff_members)
+        try:
+            for staff in members:
+                pending.append((staff, executor.submit(render_card_pdf, staff)))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                staff, future = pending.popleft()
+                next_staff = next(members, None)
+                if next_staff is not None:
+                    pending.append((next_staff, executor.submit(render_card_pdf, next_staff)))
+                yield staff, future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class _ChunkBuffer:
+    """Write-only file object that hands written bytes back out in chunks"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_cards_zip(staff_members, workers=None):
+    """Yield a ZIP archive of per-staff card PDFs as it is being built"""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for staff, pdf in iter_card_pdfs(staff_members, workers):
+            if pdf is None:
+                continue
+            archive.writestr(f'ID_Card_{staff.staff_id}.pdf', pdf)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def merge_cards_pdf(staff_members, workers=None):
+    """
+    Merge every card into one PDF spooled to a temporary file.
+
+    Each card's pages are written to the file as soon as it is rendered
+    (imposition.StreamingPDFWriter), so only the document being copied is
+    held in memory. The returned file is positioned at the start and ready
+    for FileResponse.
+    """
+    PdfReader = renderers.pdf_reader()
+    writer = renderers.imposition().StreamingPDFWriter()
+    output = tempfile.TemporaryFile()
+    output.write(writer.header())
+    for staff, pdf in iter_card_pdfs(staff_members, workers):
+        if pdf is not None:
+            output.write(writer.add_pages(PdfReader(BytesIO(pdf)).pages))
+    output.write(writer.finish())
+    output.seek(0)
+    return output
+
+
+def imposition_paper():
+    return getattr(settings, 'IMPOSITION_PAPER', 'A4')
+
+
+def card_sheets(staff_members, paper=None, columns=None, rows=None, workers=None):
+    """Print-ready PDF of cards tiled N-up, each sheet of fronts followed by its mirrored backs, as an iterator"""
+    documents = (pdf for _, pdf in iter_card_pdfs(staff_members, workers))
+    return renderers.imposition().impose(documents, paper or imposition_paper(), columns, rows, duplex=True)
+
+
+def _cached_sticker_bytes(staff):
+    pdf_file = cached_sticker_pdf(staff)
+    if pdf_file is None:
+        return None
+    with pdf_file:
+        return pdf_file.read()
+
+
+def sticker_sheets(staff_members, paper=None, columns=None, rows=None):
+    """Print-ready PDF of QR stickers tiled N-up with crop marks, as an iterator"""
+    documents = (_cached_sticker_bytes(staff) for staff in staff_members)
+    return renderers.imposition().impose(documents, paper or imposition_paper(), columns, rows)
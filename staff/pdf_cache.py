@@ -0,0 +1,224 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject, empty
+
+logger = logging.getLogger(__name__)
+
+
+class PDFCache:
+    """
+    Bounded on-disk store of rendered card and sticker PDFs.
+
+    Entries are keyed on (staff uuid, template, updated_at, template version)
+    so an edited Staff row never matches an old file, and are kept in a
+    directory per staff member so one member's files can be removed without
+    scanning the store. Recency is tracked with the file mtime. Each process
+    keeps a running estimate of the store size; the directory is only
+    scanned when that estimate passes max_size, or every rescan_interval
+    seconds to pick up other workers' writes, and the least recently used
+    files are then evicted down to low_water of max_size.
+    """
+
+    def __init__(self, directory, max_size, version='1', rescan_interval=300, low_water=0.9):
+        self.directory = str(directory)
+        self.max_size = max_size
+        self.version = str(version)
+        self.rescan_interval = rescan_interval
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None
+        self._scanned_at = 0.0
+
+    def _staff_dir(self, uuid):
+        return os.path.join(self.directory, str(uuid))
+
+    def _path(self, staff, template):
+        raw = f"{template}:{staff.updated_at.isoformat()}:{self.version}"
+        digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        return os.path.join(self._staff_dir(staff.uuid), f'{digest}.pdf')
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _grow(self, delta):
+        with self._lock:
+            if self._size is not None:
+                self._size = max(self._size + delta, 0)
+
+    def get(self, staff, template):
+        """Return an open file for a cached PDF, or None on a miss"""
+        path = self._path(staff, template)
+        try:
+            handle = open(path, 'rb')
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count(hit=True)
+        return handle
+
+    def put(self, staff, template, data):
+        """Store PDF bytes atomically, evicting old entries once the store looks full"""
+        path = self._path(staff, template)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        except OSError:
+            logger.exception("Could not write PDF cache entry for %s", staff.uuid)
+            return
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception("Could not write PDF cache entry for %s", staff.uuid)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._grow(len(data))
+        self._maybe_evict()
+
+    def get_or_render(self, staff, template, render):
+        """Return an open file for the PDF, rendering and storing it on a miss"""
+        handle = self.get(staff, template)
+        if handle is not None:
+            return handle
+
+        data = render()
+        if data is None:
+            return None
+        self.put(staff, template, data)
+        return BytesIO(data)
+
+    def contains(self, staff, template):
+        return os.path.exists(self._path(staff, template))
+
+    def _files(self, directory):
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.name.endswith('.pdf'):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        yield entry.path, stat.st_size, stat.st_mtime
+        except (FileNotFoundError, NotADirectoryError):
+            return
+
+    def _entries(self):
+        # Top-level files are from the old flat layout; they age out through eviction
+        yield from self._files(self.directory)
+        try:
+            with os.scandir(self.directory) as it:
+                directories = [entry.path for entry in it if entry.is_dir()]
+        except FileNotFoundError:
+            return
+        for directory in directories:
+            yield from self._files(directory)
+
+    def invalidate(self, uuid):
+        """Remove every cached PDF for one staff member"""
+        self.invalidate_many([uuid])
+
+    def invalidate_many(self, uuids):
+        """Remove every cached PDF for a set of staff members, touching only their directories"""
+        removed = 0
+        for uuid in set(uuids):
+            directory = self._staff_dir(uuid)
+            for path, size, mtime in self._files(directory):
+                try:
+                    os.remove(path)
+                    removed += size
+                except FileNotFoundError:
+                    pass
+            try:
+                os.rmdir(directory)
+            except OSError:
+                # Missing, or a concurrent put has just added a file
+                pass
+        self._grow(-removed)
+
+    def _maybe_evict(self):
+        with self._lock:
+            due = (self._size is None or self._size > self.max_size
+                   or time.monotonic() - self._scanned_at > self.rescan_interval)
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Rescan the store and delete least recently used entries until it fits low_water of max_size"""
+        entries = list(self._entries())
+        total = sum(size for path, size, mtime in entries)
+        if total > self.max_size:
+            target = self.max_size * self.low_water
+            for path, size, mtime in sorted(entries, key=lambda entry: entry[2]):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= target:
+                    break
+        with self._lock:
+            self._size = total
+            self._scanned_at = time.monotonic()
+
+    def clear(self):
+        for path, size, mtime in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = 0
+
+    def stats(self):
+        entries = list(self._entries())
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': len(entries),
+            'size': sum(size for path, size, mtime in entries),
+            'max_size': self.max_size,
+        }
+
+
+def _build_cache():
+    return PDFCache(
+        directory=getattr(settings, 'PDF_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'pdf_cache')),
+        max_size=getattr(settings, 'PDF_CACHE_MAX_SIZE', 512 * 1024 * 1024),
+        version=getattr(settings, 'PDF_TEMPLATE_VERSION', '1'),
+    )
+
+
+pdf_cache = SimpleLazyObject(_build_cache)
+
+
+@receiver(setting_changed)
+def _reset_pdf_cache(setting, **kwargs):
+    # Rebuilt on next use, so override_settings() and test settings take effect
+    if setting in ('PDF_CACHE_DIR', 'PDF_CACHE_MAX_SIZE', 'PDF_TEMPLATE_VERSION', 'MEDIA_ROOT'):
+        pdf_cache._wrapped = empty
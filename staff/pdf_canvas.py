@@ -0,0 +1,169 @@
+"""
+ReportLab engine for the ID card: draws card_pdf_output.html's layout directly.
+
+Geometry is in points measured from the top of the card (1rem = 12pt, as
+xhtml2pdf renders the template); drawing converts to ReportLab's bottom-up
+coordinates. Keep it in step with staff/card_design.html.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from reportlab.lib.colors import HexColor, white
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+from .utils import get_verification_link, qr_image_bytes
+
+CARD_WIDTH = 2.125 * 72
+CARD_HEIGHT = 3.375 * 72
+PADDING = 9
+RADIUS = 6
+
+BLUE_50 = HexColor('#eff6ff')
+BLUE_400 = HexColor('#60a5fa')
+BLUE_600 = HexColor('#2563eb')
+BLUE_700 = HexColor('#1d4ed8')
+GRAY_200 = HexColor('#e5e7eb')
+GRAY_300 = HexColor('#d1d5db')
+GRAY_400 = HexColor('#9ca3af')
+GRAY_500 = HexColor('#6b7280')
+GRAY_700 = HexColor('#374151')
+GRAY_800 = HexColor('#1f2937')
+GRAY_900 = HexColor('#111827')
+RED_600 = HexColor('#dc2626')
+
+# Front: header band, 6rem x 7rem photo, then text baselines
+HEADER_HEIGHT = 32
+HEADER_BASELINES = (15, 25)
+PHOTO_SIZE = (72, 84)
+PHOTO_TOP = HEADER_HEIGHT + PADDING
+NAME_BASELINE = 142
+STAFF_ID_BASELINE = 153
+DEPARTMENT_BASELINE = 164
+POSITION_BASELINE = 173.5
+EXPIRY_BASELINE = 186
+FRONT_FOOTER_BASELINE = CARD_HEIGHT - 5
+
+# Back: vertically centred verification block, emergency footer
+QR_TITLE_BASELINE = 62
+QR_SIZE = 72
+QR_TOP = 70
+QR_PADDING = 3
+QR_CAPTION_BASELINE = 153
+EMERGENCY_RULE = 192
+EMERGENCY_BASELINES = (202, 212, 222)
+
+
+def _y(top):
+    return CARD_HEIGHT - top
+
+
+def _centred_text(pdf, text, baseline, font, size, color, max_width=CARD_WIDTH - 2 * PADDING):
+    """Draw centred text, shrinking it to fit max_width as the HTML layout wraps instead"""
+    width = stringWidth(text, font, size)
+    if width > max_width:
+        size = size * max_width / width
+    pdf.setFont(font, size)
+    pdf.setFillColor(color)
+    pdf.drawCentredString(CARD_WIDTH / 2, _y(baseline), text)
+
+
+def _card_outline(pdf):
+    path = pdf.beginPath()
+    path.roundRect(1, 1, CARD_WIDTH - 2, CARD_HEIGHT - 2, RADIUS)
+    return path
+
+
+def _photo_reader(staff):
+    name = staff.photo_renditions.get('card') or (staff.photo.name if staff.photo else '')
+    if not name:
+        return None
+    try:
+        with default_storage.open(name, 'rb') as fileobj:
+            return ImageReader(BytesIO(fileobj.read()))
+    except OSError:
+        return None
+
+
+def _draw_front(pdf, staff):
+    hospital_name = settings.HOSPITAL_NAME
+
+    pdf.saveState()
+    pdf.clipPath(_card_outline(pdf), stroke=0, fill=0)
+    pdf.linearGradient(0, CARD_HEIGHT, 0, 0, (BLUE_50, white), extend=True)
+    pdf.setFillColor(BLUE_600)
+    pdf.rect(0, _y(HEADER_HEIGHT), CARD_WIDTH, HEADER_HEIGHT, stroke=0, fill=1)
+    pdf.restoreState()
+
+    _centred_text(pdf, hospital_name.upper(), HEADER_BASELINES[0], 'Helvetica-Bold', 9, white)
+    _centred_text(pdf, 'STAFF IDENTIFICATION', HEADER_BASELINES[1], 'Helvetica', 7.2, white)
+
+    width, height = PHOTO_SIZE
+    x = (CARD_WIDTH - width) / 2
+    y = _y(PHOTO_TOP + height)
+    photo = _photo_reader(staff)
+    if photo is not None:
+        pdf.drawImage(photo, x, y, width, height)
+    else:
+        pdf.setFillColor(GRAY_200)
+        pdf.roundRect(x, y, width, height, 4.5, stroke=0, fill=1)
+    pdf.setStrokeColor(BLUE_400)
+    pdf.setLineWidth(2.25)
+    pdf.roundRect(x, y, width, height, 4.5, stroke=1, fill=0)
+
+    _centred_text(pdf, staff.get_full_name().upper(), NAME_BASELINE, 'Helvetica-Bold', 10.5, GRAY_900)
+    _centred_text(pdf, staff.staff_id, STAFF_ID_BASELINE, 'Helvetica-Bold', 9, BLUE_700)
+    _centred_text(pdf, staff.get_department_display(), DEPARTMENT_BASELINE, 'Helvetica', 7.8, GRAY_700)
+    _centred_text(pdf, staff.position, POSITION_BASELINE, 'Helvetica', 7.8, GRAY_700)
+    if staff.date_expiry:
+        _centred_text(pdf, f"Valid Thru: {staff.date_expiry:%m/%Y}", EXPIRY_BASELINE, 'Helvetica-Bold', 9, RED_600)
+    _centred_text(pdf, f"This ID is the property of {hospital_name}.", FRONT_FOOTER_BASELINE,
+                  'Helvetica', 6, GRAY_500)
+
+    pdf.setStrokeColor(BLUE_600)
+    pdf.setLineWidth(1.5)
+    pdf.drawPath(_card_outline(pdf), stroke=1, fill=0)
+
+
+def _draw_back(pdf, staff):
+    _centred_text(pdf, 'VERIFICATION CODE', QR_TITLE_BASELINE, 'Helvetica-Bold', 9, GRAY_700)
+
+    x = (CARD_WIDTH - QR_SIZE) / 2
+    y = _y(QR_TOP + QR_SIZE)
+    # Drawn from memory so the card always encodes the current verification link
+    qr = ImageReader(BytesIO(qr_image_bytes(get_verification_link(staff))))
+    inner = QR_SIZE - 2 * QR_PADDING
+    pdf.drawImage(qr, x + QR_PADDING, y + QR_PADDING, inner, inner)
+    pdf.setStrokeColor(GRAY_300)
+    pdf.setLineWidth(0.75)
+    pdf.roundRect(x, y, QR_SIZE, QR_SIZE, 3, stroke=1, fill=0)
+    _centred_text(pdf, 'Scan to verify authenticity.', QR_CAPTION_BASELINE, 'Helvetica-Bold', 6.6, BLUE_600)
+
+    pdf.setStrokeColor(GRAY_300)
+    pdf.line(PADDING, _y(EMERGENCY_RULE), CARD_WIDTH - PADDING, _y(EMERGENCY_RULE))
+    lines = [
+        ('IN CASE OF EMERGENCY', 'Helvetica-Bold', GRAY_800),
+        (f"Contact: {getattr(settings, 'HOSPITAL_CONTACT_PHONE', '')}", 'Helvetica', GRAY_900),
+        (getattr(settings, 'HOSPITAL_ADDRESS', ''), 'Helvetica', GRAY_900),
+    ]
+    for (text, font, color), baseline in zip(lines, EMERGENCY_BASELINES):
+        _centred_text(pdf, text, baseline, font, 7.2, color)
+
+    pdf.setStrokeColor(GRAY_400)
+    pdf.setLineWidth(1.5)
+    pdf.drawPath(_card_outline(pdf), stroke=1, fill=0)
+
+
+def render_card_canvas(staff):
+    """Render the front and back ID card for one staff member with ReportLab"""
+    output = BytesIO()
+    pdf = canvas.Canvas(output, pagesize=(CARD_WIDTH, CARD_HEIGHT), pageCompression=1)
+    pdf.setTitle(f"{staff.get_full_name()} ID Card")
+    _draw_front(pdf, staff)
+    pdf.showPage()
+    _draw_back(pdf, staff)
+    pdf.showPage()
+    pdf.save()
+    return output.getvalue()
@@ -0,0 +1,116 @@
+import base64
+import mimetypes
+import os
+import time
+from functools import lru_cache
+from urllib.parse import unquote, urlparse
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.utils._os import safe_join
+
+from .utils import get_site_url
+
+# Files from remote storages and CDNs (e.g. Cloudinary) are kept in memory this long
+REMOTE_CACHE_SECONDS = 300
+REMOTE_TIMEOUT = 10
+
+
+def _url_prefix(url):
+    return '/' + url.strip('/') + '/'
+
+
+def _local_file(root, name):
+    try:
+        path = safe_join(root, name)
+    except SuspiciousFileOperation:
+        return None
+    return path if os.path.isfile(path) else None
+
+
+@lru_cache(maxsize=1)
+def _own_hosts():
+    hosts = {urlparse(get_site_url()).hostname}
+    hosts.update(host for host in settings.ALLOWED_HOSTS if not host.startswith('.') and host != '*')
+    return hosts
+
+
+def _data_uri(data, name, mime=None):
+    mime = mime or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def _cache_period():
+    # Passed to the cached loaders so entries expire, e.g. after a QR redraw
+    return int(time.time() // REMOTE_CACHE_SECONDS)
+
+
+@lru_cache(maxsize=256)
+def _storage_data_uri(name, _period):
+    with default_storage.open(name, 'rb') as fileobj:
+        return _data_uri(fileobj.read(), name)
+
+
+@lru_cache(maxsize=256)
+def _url_data_uri(url, _period):
+    try:
+        with urlopen(url, timeout=REMOTE_TIMEOUT) as response:
+            return _data_uri(response.read(), urlparse(url).path, response.headers.get_content_type())
+    except (OSError, ValueError):
+        return None
+
+
+def resolve_media(name):
+    """Local path of a media file, or a data: URI for storages without one"""
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        return _storage_data_uri(name, _cache_period())
+    except SuspiciousFileOperation:
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def resolve_static(name):
+    """Collected static file if present, else whatever the staticfiles finders locate"""
+    if settings.STATIC_ROOT:
+        path = _local_file(settings.STATIC_ROOT, name)
+        if path:
+            return path
+    return finders.find(name)
+
+
+def link_callback(uri, rel=None):
+    """
+    xhtml2pdf link_callback: read our own static and media files directly.
+
+    Relative and same-host absolute /static/ and /media/ URLs become local
+    paths (or in-memory data: URIs for remote storages), so rendering a PDF
+    never makes an HTTP request back to this server. Other http(s) URLs,
+    such as Cloudinary media, are downloaded once and kept in memory for
+    REMOTE_CACHE_SECONDS.
+    """
+    if not uri or uri.startswith('data:'):
+        return uri
+
+    parsed = urlparse(uri)
+    if parsed.scheme in ('http', 'https'):
+        if parsed.hostname not in _own_hosts():
+            # Storage URLs on a CDN: fetched once per worker rather than per render
+            return _url_data_uri(uri, _cache_period()) or uri
+    elif parsed.scheme:
+        return uri
+
+    path = unquote(parsed.path)
+    media_url = _url_prefix(settings.MEDIA_URL)
+    static_url = _url_prefix(settings.STATIC_URL)
+    if path.startswith(media_url):
+        resolved = resolve_media(path[len(media_url):])
+    elif path.startswith(static_url):
+        resolved = resolve_static(path[len(static_url):])
+    else:
+        resolved = None
+    return resolved or uri
@@ -0,0 +1,68 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# name: (size in pixels, format); card is 1in x 1.17in at 300 dpi, JPEG so
+# ReportLab can embed it without re-encoding
+RENDITIONS = {
+    'thumb': ((128, 128), 'WEBP'),
+    'verify': ((480, 640), 'WEBP'),
+    'card': ((300, 350), 'JPEG'),
+}
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+QUALITY = 85
+
+
+def rendition_name(photo_name, rendition):
+    """Storage path of a rendition, next to the original: staff_photos/ada.jpg -> staff_photos/ada_thumb.webp"""
+    fmt = RENDITIONS[rendition][1]
+    return f"{os.path.splitext(photo_name)[0]}_{rendition}.{EXTENSIONS[fmt]}"
+
+
+def _open_photo(photo_name):
+    largest = max(size for size, _ in RENDITIONS.values())
+    with default_storage.open(photo_name, 'rb') as fileobj:
+        image = Image.open(fileobj)
+        # Lets the JPEG decoder scale down by 2-8x instead of decoding full size
+        image.draft('RGB', largest)
+        image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_photo_renditions(photo_name):
+    """Write every rendition of a stored photo and return {rendition: path}"""
+    image = _open_photo(photo_name)
+    renditions = {}
+    for rendition, (size, fmt) in RENDITIONS.items():
+        # Crop to the target aspect ratio, biased upwards to keep faces in frame
+        fitted = ImageOps.fit(image, size, Image.Resampling.LANCZOS, centering=(0.5, 0.35))
+        options = {'optimize': True, 'progressive': True} if fmt == 'JPEG' else {'method': 4}
+        buffer = BytesIO()
+        fitted.save(buffer, fmt, quality=QUALITY, **options)
+
+        path = rendition_name(photo_name, rendition)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        renditions[rendition] = default_storage.save(path, ContentFile(buffer.getvalue()))
+    return renditions
+
+
+def try_build_photo_renditions(photo_name):
+    """build_photo_renditions for batch jobs: None when the photo is missing or unreadable"""
+    try:
+        return build_photo_renditions(photo_name)
+    except (OSError, ValueError):
+        return None
+
+
+def delete_photo_renditions(renditions):
+    for path in renditions.values():
+        default_storage.delete(path)
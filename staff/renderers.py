@@ -0,0 +1,121 @@
+"""
+PDF and QR engines, imported on first use.
+
+xhtml2pdf pulls in reportlab, pyHanko, svglib and lxml, which dominate a
+worker's start-up time and memory, yet most requests are list and verify
+pages that never render a PDF. Code that renders goes through the
+accessors below instead of importing the engines at module level, so a
+worker only pays for an engine once it needs one.
+
+warm_up() loads the engines ahead of time and primes what the first
+render would otherwise pay for (fonts, compiled card templates). Run it
+in workers that serve the PDF routes: the gunicorn.conf.py hook does so
+when PDF_WARM_UP is on, and the warm_up_renderers command reports what it
+costs.
+"""
+import logging
+import sys
+import time
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+
+def pisa():
+    """xhtml2pdf's HTML-to-PDF engine"""
+    from xhtml2pdf import pisa
+    return pisa
+
+
+def card_canvas():
+    """The ReportLab card renderer (pdf_canvas.render_card_canvas)"""
+    from .pdf_canvas import render_card_canvas
+    return render_card_canvas
+
+
+def pdf_reader():
+    """pypdf's PdfReader, for copying card pages into merged documents"""
+    from pypdf import PdfReader
+    return PdfReader
+
+
+def imposition():
+    """The N-up sheet imposition module"""
+    from . import imposition
+    return imposition
+
+
+def qrcode():
+    """The qrcode package, with its SVG image factory loaded"""
+    import qrcode
+    import qrcode.image.svg  # noqa: F401 (qrcode.image.svg.SvgPathImage)
+    return qrcode
+
+
+def rss_kb():
+    """Resident memory of this process in KB (Linux); None where /proc is unavailable"""
+    try:
+        with open('/proc/self/status') as fileobj:
+            for line in fileobj:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _prime_pdf():
+    from django.template.loader import get_template
+    from .pdf import CARD_TEMPLATE, STICKER_TEMPLATE
+
+    for template in (CARD_TEMPLATE, STICKER_TEMPLATE):
+        get_template(template)
+    # The first document loads xhtml2pdf's default fonts and CSS
+    pisa().pisaDocument(BytesIO(b'<p>warm-up</p>'), BytesIO())
+
+
+def _prime_canvas():
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    card_canvas()
+    stringWidth('warm-up', 'Helvetica-Bold', 10)
+
+
+def _prime_qr():
+    from .utils import make_qr
+    make_qr('warm-up').make_image()
+
+
+# name -> callable that loads the engine and primes its first-use caches
+ENGINES = {
+    'xhtml2pdf': _prime_pdf,
+    'reportlab': _prime_canvas,
+    'pypdf': lambda: (pdf_reader(), imposition()),
+    'qrcode': _prime_qr,
+}
+
+
+def loaded_engines():
+    """Which engines' top-level packages this process has already imported"""
+    packages = {'xhtml2pdf': 'xhtml2pdf', 'reportlab': 'reportlab', 'pypdf': 'pypdf', 'qrcode': 'qrcode'}
+    return [name for name, package in packages.items() if package in sys.modules]
+
+
+def warm_up(engines=None):
+    """
+    Load and prime engines (all by default) and return, per engine, the
+    seconds it took and the resident memory it added in KB.
+    """
+    results = {}
+    for name in engines or ENGINES:
+        rss = rss_kb()
+        started = time.perf_counter()
+        ENGINES[name]()
+        elapsed = time.perf_counter() - started
+        after = rss_kb()
+        results[name] = {
+            'seconds': elapsed,
+            'rss_kb': after - rss if rss is not None and after is not None else None,
+        }
+    logger.info("Warmed up %s", ', '.join(f"{name} in {result['seconds'] * 1000:.0f}ms"
+                                          for name, result in results.items()))
+    return results
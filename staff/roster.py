@@ -0,0 +1,152 @@
+"""
+Roster snapshots and delta sync for offline kiosks.
+
+A kiosk downloads a snapshot once: a SQLite file holding every active
+staff member (uuid hex, staff_id, name, status, date_expiry, thumb_hash)
+plus a meta table with the format version and a sync cursor. From then on
+it asks for changes since that cursor and gets back every staff row saved
+since (whatever its status, so suspensions and expiries arrive too), the
+uuids of deleted staff, and the next cursor.
+
+The cursor is "<updated_at in epoch microseconds>.<id>.<revocation version>".
+Rows are read in (updated_at, id) order. Rows saved within the last
+ROSTER_SYNC_LAG_SECONDS are held back until the next sync, so a write that
+committed late with an earlier updated_at is not skipped. Deleted staff are
+found through their RevocationEvent (see offline.record_deletions).
+"""
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import RevocationEvent, Staff
+from . import offline
+
+FORMAT_VERSION = 1
+FIELDS = ['uuid', 'staff_id', 'name', 'status', 'date_expiry', 'thumb_hash']
+_QUERY_FIELDS = ['id', 'uuid', 'staff_id', 'first_name', 'last_name', 'status', 'date_expiry', 'updated_at',
+                 'photo', 'photo_renditions']
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE staff (
+    uuid TEXT PRIMARY KEY,
+    staff_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    date_expiry TEXT,
+    thumb_hash TEXT
+) WITHOUT ROWID;
+CREATE INDEX staff_staff_id ON staff (staff_id);
+"""
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(updated_at, staff_pk, revocation_version):
+    micros = (updated_at - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)) // timedelta(microseconds=1)
+    return f"{micros}.{staff_pk}.{revocation_version}"
+
+
+def decode_cursor(cursor):
+    """(updated_at, staff pk, revocation version); raises InvalidCursor"""
+    try:
+        micros, staff_pk, revocation_version = (int(part) for part in cursor.split('.'))
+    except ValueError:
+        raise InvalidCursor(f"Invalid roster cursor {cursor!r}")
+    updated_at = datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=micros)
+    return updated_at, staff_pk, revocation_version
+
+
+def _horizon():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'ROSTER_SYNC_LAG_SECONDS', 5))
+
+
+def thumb_hash(photo_name, renditions):
+    """Short fingerprint of the current photo, so a kiosk only refetches thumbnails that changed"""
+    name = renditions.get('thumb') or photo_name
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:16] if name else None
+
+
+def _row(staff):
+    return [
+        staff['uuid'].hex,
+        staff['staff_id'],
+        f"{staff['first_name']} {staff['last_name']}",
+        staff['status'],
+        staff['date_expiry'].isoformat() if staff['date_expiry'] else None,
+        thumb_hash(staff['photo'], staff['photo_renditions'] or {}),
+    ]
+
+
+def build_snapshot():
+    """SQLite database bytes holding the active roster and the cursor to sync on from"""
+    # Read the versions first: anything saved while the roster is read comes again as a change
+    revocation_version = offline.revocation_version()
+    cursor = encode_cursor(_horizon(), 0, revocation_version)
+
+    db = sqlite3.connect(':memory:')
+    try:
+        db.executescript(SCHEMA)
+        staff = Staff.objects.filter(status='active').order_by().values(*_QUERY_FIELDS)
+        db.executemany("INSERT INTO staff VALUES (?, ?, ?, ?, ?, ?)",
+                       (_row(member) for member in staff.iterator(chunk_size=2000)))
+        count = db.execute("SELECT COUNT(*) FROM staff").fetchone()[0]
+        db.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ('format', str(FORMAT_VERSION)),
+            ('cursor', cursor),
+            ('generated_at', timezone.now().isoformat()),
+            ('count', str(count)),
+            ('site', getattr(settings, 'HOSPITAL_NAME', '')),
+        ])
+        db.commit()
+        db.execute("VACUUM")
+        return db.serialize()
+    finally:
+        db.close()
+
+
+def roster_changes(since, limit=None):
+    """
+    Staff rows and deletions after a cursor, at most limit rows per call.
+
+    Returns a dict with the next cursor; has_more means the kiosk should
+    call again straight away.
+    """
+    if limit is None:
+        limit = getattr(settings, 'ROSTER_DELTA_LIMIT', 5000)
+    updated_at, staff_pk, revocation_version = decode_cursor(since)
+
+    latest_revocation = offline.revocation_version()
+    rows = list(
+        # The redundant updated_at >= bound lets the (updated_at, id) index seek instead of filter
+        Staff.objects.filter(updated_at__gte=updated_at, updated_at__lte=_horizon())
+        .filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=staff_pk))
+        .order_by('updated_at', 'id')
+        .values(*_QUERY_FIELDS)[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        updated_at, staff_pk = rows[-1]['updated_at'], rows[-1]['id']
+
+    # Staff with revocation events but no row left have been deleted
+    touched = set(
+        RevocationEvent.objects.filter(id__gt=revocation_version, id__lte=latest_revocation)
+        .values_list('staff_uuid', flat=True)
+    )
+    removed = touched - set(Staff.objects.filter(uuid__in=touched).values_list('uuid', flat=True))
+
+    return {
+        'format': FORMAT_VERSION,
+        'cursor': encode_cursor(updated_at, staff_pk, latest_revocation),
+        'has_more': has_more,
+        'fields': FIELDS,
+        'changed': [_row(staff) for staff in rows],
+        'removed': sorted(uuid.hex for uuid in removed),
+    }
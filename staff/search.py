@@ -0,0 +1,61 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, models
+from django.db.models import Case, IntegerField, Value, When
+
+SEARCH_FIELDS = ('staff_id', 'first_name', 'last_name', 'email')
+SEARCH_CONFIG = 'simple'
+
+
+def staff_search_vector():
+    """
+    tsvector over the searchable Staff fields.
+
+    Must stay identical to the expression in the staff_search_idx GIN index
+    (migration 0005) or PostgreSQL will not use the index.
+    """
+    return SearchVector(*SEARCH_FIELDS, config=SEARCH_CONFIG)
+
+
+def _prefix_query(query):
+    """Match every word of the query as a prefix, e.g. 'ada lov' -> 'ada':* & 'lov':*"""
+    terms = ["'{}':*".format(term.replace("\\", "").replace("'", "''")) for term in query.split()]
+    return SearchQuery(' & '.join(terms), search_type='raw', config=SEARCH_CONFIG)
+
+
+def search_staff(queryset, query):
+    """
+    Filter a Staff queryset by a free-text query, best matches first.
+
+    On PostgreSQL this uses the full-text GIN index with prefix matching
+    plus the staff_id prefix index: an exact staff ID comes first, then
+    staff ID prefixes, then full-text rank. Other databases fall back to a
+    case-insensitive substring scan.
+    """
+    query = query.strip()
+    if not query:
+        return queryset
+
+    if connection.vendor != 'postgresql':
+        return queryset.filter(
+            models.Q(staff_id__icontains=query) |
+            models.Q(first_name__icontains=query) |
+            models.Q(last_name__icontains=query) |
+            models.Q(email__icontains=query)
+        )
+
+    search_query = _prefix_query(query)
+    return (
+        queryset
+        .annotate(search=staff_search_vector())
+        .filter(models.Q(search=search_query) | models.Q(staff_id__istartswith=query))
+        .annotate(
+            id_match=Case(
+                When(staff_id__iexact=query, then=Value(0)),
+                When(staff_id__istartswith=query, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            ),
+            rank=SearchRank(staff_search_vector(), search_query),
+        )
+        .order_by('id_match', '-rank', '-created_at')
+    )
@@ -0,0 +1,17 @@
+from django import template
+from django.conf import settings
+
+from staff.utils import qr_data_uri
+
+register = template.Library()
+
+
+@register.simple_tag
+def qr_src(staff):
+    """Image src for a staff QR code, following QR_CODE_EMBED; empty when there is none"""
+    mode = getattr(settings, 'QR_CODE_EMBED', 'file')
+    if mode in ('png', 'svg'):
+        return qr_data_uri(staff, mode)
+    if staff.qr_code:
+        return staff.qr_code.url
+    return ''
@@ -1,3 +1,1407 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import importlib
+import json
+import os
+import runpy
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import uuid
+import zipfile
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.staticfiles import finders
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.signing import BadSignature
+from django.db import connection
+from django.http import Http404
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from PIL import Image
+from pypdf import PdfReader
+from reportlab.pdfgen import canvas
+
+from benchmarks.harness import seed_staff, seeded_staff
+from staff_id import urls as root_urls
+
+from . import analytics, jobs, pdf_resources, renderers, urls, verify_cache, views
+from .admin import StaffAdmin
+from .expiry import expire_staff, expiring_staff
+from .analytics import rebuild_hourly_counts, refresh_hourly_counts, volume_alerts
+from .jobs import work
+from .importer import StaffImportError, import_staff
+from .imposition import SheetLayout, impose
+from .log_storage import (
+    apply_retention, convert_to_partitioned, ensure_partitions, is_partitioned, rebuild_daily_counts,
+)
+from .log_writer import VerificationLogWriter
+from .models import (
+    AggregateWatermark, Job, RevocationEvent, Staff, VerificationDailyCount, VerificationHourlyCount, VerificationLog,
+)
+from .pdf import render_card_pdf
+from .offline import generate_signing_key, public_key_b64, revocation_list, sign_staff_token, verify_staff_token
+from .pagination import KeysetPaginator
+from .pdf_cache import PDFCache, pdf_cache
+from .pdf_resources import link_callback
+from .photos import RENDITIONS
+from .search import search_staff
+from .timing import EndpointStats, RequestTimings
+from .utils import qr_content_hash, qr_data_uri
+from .verify_cache import get_verification_record
+
+
+def pdf_pages_text(pdf):
+    """Upper-cased, whitespace-collapsed text of each page"""
+    reader = PdfReader(BytesIO(pdf))
+    return [' '.join(page.extract_text().upper().split()) for page in reader.pages]
+
+
+class TempMediaMixin:
+    """
+    Point MEDIA_ROOT and PDF_CACHE_DIR at a fresh temporary directory for
+    each test, and write verification logs in the request: the shared
+    log_writer's thread would flush outside the test's transaction, and
+    again at exit after the test database is gone.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root, PDF_CACHE_DIR=os.path.join(self.media_root, 'pdf_cache'),
+                                  VERIFICATION_LOG_BUFFERED=False)
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+class CardEngineComparisonTest(TempMediaMixin, TestCase):
+    """The ReportLab card engine must show the same fields as the xhtml2pdf template"""
+
+    def setUp(self):
+        super().setUp()
+        self.staff = Staff.objects.create(
+            staff_id='NOH/2024/0042',
+            first_name='Amina',
+            last_name='Bello',
+            email='amina.bello@example.com',
+            phone='08030000000',
+            department='radiology',
+            position='Senior Radiographer',
+            date_joined=datetime.date(2024, 1, 15),
+            date_expiry=datetime.date(2027, 6, 30),
+        )
+
+    def render(self, engine):
+        with override_settings(CARD_PDF_ENGINE=engine):
+            pdf = render_card_pdf(self.staff)
+        self.assertIsNotNone(pdf, f"{engine} engine failed to render")
+        return pdf
+
+    def test_same_pages_and_size(self):
+        html, canvas = PdfReader(BytesIO(self.render('html'))), PdfReader(BytesIO(self.render('reportlab')))
+        self.assertEqual(len(html.pages), 2)
+        self.assertEqual(len(canvas.pages), 2)
+        for html_page, canvas_page in zip(html.pages, canvas.pages):
+            self.assertAlmostEqual(float(html_page.mediabox.width), float(canvas_page.mediabox.width), places=0)
+            self.assertAlmostEqual(float(html_page.mediabox.height), float(canvas_page.mediabox.height), places=0)
+
+    def test_same_fields(self):
+        front_fields = [
+            settings.HOSPITAL_NAME,
+            'STAFF IDENTIFICATION',
+            self.staff.get_full_name(),
+            self.staff.staff_id,
+            self.staff.get_department_display(),
+            self.staff.position,
+            'Valid Thru: 06/2027',
+        ]
+        back_fields = ['Verification Code', 'Scan to verify authenticity.', 'In case of emergency']
+
+        for engine in ('html', 'reportlab'):
+            front, back = pdf_pages_text(self.render(engine))
+            for field in front_fields:
+                self.assertIn(' '.join(field.upper().split()), front, f"{engine} front is missing {field!r}")
+            for field in back_fields:
+                self.assertIn(field.upper(), back, f"{engine} back is missing {field!r}")
+
+    def test_both_embed_qr(self):
+        for engine in ('html', 'reportlab'):
+            back = PdfReader(BytesIO(self.render(engine))).pages[1]
+            self.assertTrue(back.images, f"{engine} back has no QR image")
+
+
+class PDFResourceTest(TempMediaMixin, TestCase):
+    """xhtml2pdf reads our own media and static files from disk, and remote files once"""
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'qr_codes'))
+        self.qr_path = os.path.join(self.media_root, 'qr_codes', 'qr_1.png')
+        with open(self.qr_path, 'wb') as qr:
+            qr.write(b'png')
+        pdf_resources._url_data_uri.cache_clear()
+
+    def test_local_files(self):
+        self.assertEqual(link_callback('/media/qr_codes/qr_1.png'), self.qr_path)
+        self.assertEqual(link_callback('http://localhost/media/qr_codes/qr_1.png'), self.qr_path)
+        self.assertEqual(link_callback('/static/staff/images/logo.jpg'),
+                         finders.find('staff/images/logo.jpg'))
+        untouched = ('/media/../../etc/passwd', '/media/qr_codes/none.png', 'data:image/png;base64,AA',
+                     'file:///etc/passwd')
+        for uri in untouched:
+            self.assertEqual(link_callback(uri), uri)
+
+    def test_remote_files_fetched_once(self):
+        response = mock.MagicMock()
+        response.__enter__.return_value.read.return_value = b'jpeg'
+        response.__enter__.return_value.headers.get_content_type.return_value = 'image/jpeg'
+        with mock.patch.object(pdf_resources, 'urlopen', return_value=response) as urlopen:
+            for _ in range(2):
+                self.assertEqual(link_callback('https://res.cloudinary.com/demo/ada.jpg'),
+                                 'data:image/jpeg;base64,' + base64.b64encode(b'jpeg').decode())
+        self.assertEqual(urlopen.call_count, 1)
+
+        with mock.patch.object(pdf_resources, 'urlopen', side_effect=OSError):
+            self.assertEqual(link_callback('https://cdn.example.com/x.png'), 'https://cdn.example.com/x.png')
+
+
+class PDFCacheTest(TempMediaMixin, TestCase):
+    """Cached PDFs are kept per staff member and evicted least recently used first, without a scan per store"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache = PDFCache(os.path.join(self.media_root, 'cache'), max_size=2500)
+
+    def member(self):
+        return SimpleNamespace(uuid=uuid.uuid4(), updated_at=timezone.now())
+
+    def test_keyed_on_updated_at(self):
+        staff = self.member()
+        self.cache.put(staff, 'card', b'x' * 10)
+        with self.cache.get(staff, 'card') as cached:
+            self.assertEqual(cached.read(), b'x' * 10)
+        self.assertIsNone(self.cache.get(staff, 'sticker'))
+        staff.updated_at += datetime.timedelta(seconds=1)
+        self.assertIsNone(self.cache.get(staff, 'card'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_invalidate_and_evict(self):
+        members = [self.member() for _ in range(3)]
+        with mock.patch.object(self.cache, '_entries', wraps=self.cache._entries) as scans:
+            for age, staff in enumerate(members):
+                self.cache.put(staff, 'card', b'x' * 1000)
+                # Oldest first for LRU
+                os.utime(self.cache._path(staff, 'card'), (1000 + age, 1000 + age))
+            # The first store sizes the directory; the second fits the running total; the third overflows it
+            self.assertEqual(scans.call_count, 2)
+        self.assertFalse(self.cache.contains(members[0], 'card'))
+        self.assertTrue(self.cache.contains(members[1], 'card'))
+
+        self.cache.invalidate(members[1].uuid)
+        self.assertFalse(os.path.exists(self.cache._staff_dir(members[1].uuid)))
+        self.assertTrue(self.cache.contains(members[2], 'card'))
+        self.assertEqual(self.cache._size, 1000)
+
+    def test_follows_settings(self):
+        self.assertEqual(pdf_cache.directory, os.path.join(self.media_root, 'pdf_cache'))
+        with override_settings(PDF_CACHE_DIR=os.path.join(self.media_root, 'other')):
+            self.assertEqual(pdf_cache.directory, os.path.join(self.media_root, 'other'))
+
+
+@override_settings(BULK_PDF_WORKERS=1, CARD_PDF_ENGINE='reportlab')
+class BulkCardExportTest(TempMediaMixin, TestCase):
+    """The filtered staff list downloads as one merged PDF or a ZIP of per-staff cards"""
+
+    def setUp(self):
+        super().setUp()
+        for number, department in enumerate(('lab', 'lab', 'pharmacy')):
+            Staff.objects.create(staff_id=f'NOH/2024/03{number:02d}', first_name='Sadiq', last_name='Lawal',
+                                 department=department, position='Scientist', date_joined=datetime.date(2024, 2, 1))
+        self.client.force_login(User.objects.create_user('clerk', password='secret'))
+
+    def test_merged_pdf(self):
+        response = self.client.get(reverse('staff:bulk_card_pdf'), {'department': 'lab'})
+        pages = pdf_pages_text(b''.join(response.streaming_content))
+        self.assertEqual(len(pages), 4)
+        fronts = ' '.join(pages[::2])
+        self.assertIn('NOH/2024/0300', fronts)
+        self.assertIn('NOH/2024/0301', fronts)
+        self.assertNotIn('NOH/2024/0302', fronts)
+
+    def test_zip(self):
+        response = self.client.get(reverse('staff:bulk_card_pdf'), {'format': 'zip'})
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(len(archive.namelist()), 3)
+            self.assertEqual(len(PdfReader(BytesIO(archive.read(archive.namelist()[0]))).pages), 2)
+
+
+class ImpositionTest(TempMediaMixin, TestCase):
+    """Cards and stickers are tiled N-up on print sheets, backs mirrored for duplex"""
+
+    def document(self, label, size=(243, 153), pages=2):
+        buffer = BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=size)
+        for side in range(pages):
+            pdf.drawString(10, 10, f"{label}-{side}")
+            pdf.showPage()
+        pdf.save()
+        return buffer.getvalue()
+
+    def test_duplex_sheets(self):
+        documents = [self.document(f"card{number}") for number in range(10)] + [None]
+        reader = PdfReader(BytesIO(b''.join(impose(documents, 'A4', duplex=True))))
+        # Eight 243x153pt cards fit on A4, so ten take two fronts and two backs
+        self.assertEqual(len(reader.pages), 4)
+        self.assertEqual([round(float(value)) for value in reader.pages[0].mediabox], [0, 0, 595, 842])
+        xobjects = reader.pages[0]['/Resources']['/XObject']
+        self.assertEqual(len(xobjects), 8)
+        self.assertEqual(len(reader.pages[3]['/Resources']['/XObject']), 2)
+
+        layout = SheetLayout((243, 153), 'A4')
+        front, back = layout.position(0), layout.position(0, mirrored=True)
+        self.assertEqual(front[1], back[1])
+        self.assertEqual(back[0], layout.position(layout.columns - 1)[0])
+
+    def test_grid_capped(self):
+        self.assertEqual(SheetLayout((243, 153), 'A4', columns=5, rows=1).per_sheet, 2)
+
+    def test_oversize_item_fails_before_streaming(self):
+        with self.assertRaises(ValueError):
+            impose([self.document('poster', size=(700, 900))], 'A4')
+        # Nothing to tile still makes a valid, empty document
+        self.assertTrue(b''.join(impose([None])).startswith(b'%PDF-'))
+
+    @override_settings(CARD_PDF_ENGINE='reportlab', BULK_PDF_WORKERS=1)
+    def test_oversize_sheet_request(self):
+        Staff.objects.create(staff_id='NOH/2024/0500', first_name='Sadiq', last_name='Lawal',
+                             department='lab', position='Scientist', date_joined=datetime.date(2024, 2, 1))
+        self.client.force_login(User.objects.create_user('clerk', password='secret'))
+        with mock.patch('staff.imposition.SheetLayout', side_effect=ValueError("does not fit")):
+            response = self.client.get(reverse('staff:bulk_sticker_pdf'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.streaming)
+
+
+@override_settings(VERIFICATION_LOG_BUFFERED=False)
+class ConditionalGetTest(TempMediaMixin, TestCase):
+    """Cards, stickers, QR images and the detail page answer 304 while the staff row is unchanged"""
+
+    def setUp(self):
+        super().setUp()
+        self.staff = Staff.objects.create(
+            staff_id='NOH/2024/0007', first_name='Musa', last_name='Garba', department='pharmacy',
+            position='Pharmacist', date_joined=datetime.date(2024, 3, 1), date_expiry=datetime.date(2027, 3, 1),
+        )
+        self.user = User.objects.create_user('clerk', password='secret')
+        self.client.force_login(self.user)
+
+    def revalidate(self, name, cache_control):
+        url = reverse(f'staff:{name}', args=[self.staff.uuid])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], cache_control)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Cache-Control'], cache_control)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        return url, etag
+
+    def test_not_modified_until_edited(self):
+        for name, cache_control in (('print_card', 'public, no-cache'), ('download_card_pdf', 'public, no-cache'),
+                                    ('qr_code_png', 'public, no-cache'), ('download_qr_sticker', 'private, no-cache'),
+                                    ('staff_detail', 'private, no-cache')):
+            with self.subTest(name):
+                url, etag = self.revalidate(name, cache_control)
+                self.staff.position = f'{self.staff.position}.'
+                self.staff.save()
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_template_version_changes_etag(self):
+        url, etag = self.revalidate('print_card', 'public, no-cache')
+        with override_settings(PDF_TEMPLATE_VERSION='2'):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_logs_visit_on_304(self):
+        url, etag = self.revalidate('staff_detail', 'private, no-cache')
+        self.assertEqual(VerificationLog.objects.filter(staff=self.staff).count(), 3)
+        history = self.client.get(reverse('staff:staff_verifications', args=[self.staff.uuid]))
+        self.assertContains(history, 'Verified by: clerk', count=3)
+
+
+class VerificationLogWriterTest(TempMediaMixin, TestCase):
+    """Buffered verification logs are written in batches, and a full queue flushes or drops"""
+
+    def setUp(self):
+        super().setUp()
+        seed_staff(2, seed=9)
+        self.staff = list(seeded_staff())
+
+    def writer(self, **options):
+        writer = VerificationLogWriter(batch_size=100, flush_interval=3600, **options)
+        # Flushed by the test instead of the background thread
+        patcher = mock.patch.object(writer, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return writer
+
+    def log(self, writer, staff):
+        return writer.log(staff_id=staff.pk, ip_address='10.0.0.1', user_agent='kiosk')
+
+    def test_batches(self):
+        writer = self.writer()
+        entries = [self.log(writer, staff) for staff in self.staff + self.staff[:1]]
+        self.assertIsNotNone(entries[0].verified_at)
+        self.assertEqual(VerificationLog.objects.count(), 0)
+        with self.assertNumQueries(5):
+            self.assertEqual(writer.flush(), 3)
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(VerificationLog.objects.count(), 3)
+        counts = dict(VerificationDailyCount.objects.values_list('staff_id', 'count'))
+        self.assertEqual(counts, {self.staff[0].pk: 2, self.staff[1].pk: 1})
+        self.assertEqual(writer.stats()['written'], 3)
+        self.assertEqual(writer.stats()['flushes'], 1)
+
+    def test_overflow_flush(self):
+        writer = self.writer(max_queue=2, overflow='flush')
+        for staff in self.staff * 2 + self.staff[:1]:
+            self.log(writer, staff)
+        # Each full queue was written in the request before the new entry was queued
+        self.assertEqual(VerificationLog.objects.count(), 4)
+        self.assertEqual(writer.stats()['queue_depth'], 1)
+        self.assertEqual(writer.stats()['dropped'], 0)
+
+    def test_overflow_drop(self):
+        writer = self.writer(max_queue=2, overflow='drop')
+        for staff in self.staff * 2:
+            self.log(writer, staff)
+        self.assertEqual(VerificationLog.objects.count(), 0)
+        self.assertEqual(writer.stats()['dropped'], 2)
+        self.assertEqual(writer.flush(), 2)
+
+    @override_settings(VERIFICATION_LOG_BUFFERED=True)
+    def test_stats_on_timing_page(self):
+        writer = self.writer()
+        self.log(writer, self.staff[0])
+        writer.flush()
+        self.log(writer, self.staff[1])
+        self.client.force_login(User.objects.create_user('admin', password='secret', is_staff=True))
+        with mock.patch('staff.views.log_writer', writer):
+            response = self.client.get(reverse('staff:timing_stats'))
+        self.assertEqual(response.context['log_writer'], writer.stats())
+        self.assertContains(response, 'Verification log writer')
+        self.assertContains(response, '1 of 10000')
+
+    def test_reset_after_fork(self):
+        writer = VerificationLogWriter()
+        writer._queue.append(object())
+        writer._pid = -1
+        with mock.patch('threading.Thread'):
+            writer._ensure_thread()
+        self.assertEqual(writer.stats()['queue_depth'], 0)
+
+
+class StaffSearchTest(TempMediaMixin, TestCase):
+    """Staff search matches names, emails and staff ID prefixes, exact staff IDs first"""
+
+    def setUp(self):
+        super().setUp()
+        people = [
+            ('NOH/2024/0100', 'Ada', 'Lovelace', 'ada@example.com'),
+            ('NOH/2024/0010', 'Adamu', 'Musa', 'adamu.musa@example.com'),
+            ('NOH/2024/0101', "Ngozi", "O'Brien", 'ngozi@example.com'),
+        ]
+        for staff_id, first_name, last_name, email in people:
+            Staff.objects.create(
+                staff_id=staff_id, first_name=first_name, last_name=last_name, email=email,
+                phone='08030000000', department='nursing', position='Nurse',
+                date_joined=datetime.date(2024, 1, 1), date_expiry=datetime.date(2030, 1, 1),
+            )
+
+    def search(self, query):
+        return list(search_staff(Staff.objects.all(), query).values_list('staff_id', flat=True))
+
+    def test_names_and_emails(self):
+        if connection.vendor == 'postgresql':
+            # Every word as a prefix; the fallback matches the query as one substring
+            self.assertEqual(self.search('ada lovel'), ['NOH/2024/0100'])
+        self.assertEqual(set(self.search('ada')), {'NOH/2024/0100', 'NOH/2024/0010'})
+        self.assertEqual(self.search('musa'), ['NOH/2024/0010'])
+        self.assertEqual(self.search("o'brien"), ['NOH/2024/0101'])
+        self.assertEqual(self.search('nobody'), [])
+        self.assertEqual(len(self.search('  ')), 3)
+
+    def test_staff_id_prefix(self):
+        self.assertEqual(set(self.search('noh/2024/010')), {'NOH/2024/0100', 'NOH/2024/0101'})
+        # The exact staff ID ranks before IDs it is a prefix of
+        self.assertEqual(self.search('NOH/2024/0010')[0], 'NOH/2024/0010')
+
+    def test_list_view(self):
+        self.client.force_login(User.objects.create_user('admin', password='secret'))
+        response = self.client.get(reverse('staff:staff_list'), {'q': 'lovelace'})
+        self.assertContains(response, 'NOH/2024/0100')
+        self.assertNotContains(response, 'NOH/2024/0010')
+
+
+@override_settings(BULK_PDF_WORKERS=1)
+class StaffImportTest(TempMediaMixin, TestCase):
+    """HR exports are upserted on staff_id in chunks, touching only rows that changed"""
+
+    HEADER = 'Staff ID,First Name,Last Name,Email,Phone,Department,Position,Date Joined,Date Expiry,Status\n'
+    ROWS = [
+        'NOH/2024/0001,Ada,Lovelace,ada@example.com,0803,Laboratory,Scientist,15/01/2024,30/06/2027,\n',
+        'NOH/2024/0002,Adamu,Musa,adamu@example.com,0804,nursing,Nurse,2024-02-01,2027-06-30,active\n',
+        'NOH/2024/0003,Ngozi,Okafor,ngozi@example.com,0805,radiology,Radiographer,01-03-2024,30-06-2027,suspended\n',
+    ]
+
+    def run_import(self, rows, **options):
+        upload = BytesIO((self.HEADER + ''.join(rows)).encode('utf-8'))
+        return import_staff(upload, 'export.csv', **options)
+
+    def test_dry_run_writes_nothing(self):
+        result = self.run_import(self.ROWS, dry_run=True)
+        self.assertEqual((result.created, result.updated, result.errors), (3, 0, []))
+        self.assertFalse(Staff.objects.exists())
+
+    def test_upsert(self):
+        result = self.run_import(self.ROWS)
+        self.assertEqual((result.created, result.qr_generated), (3, 3))
+        ada = Staff.objects.get(staff_id='NOH/2024/0001')
+        self.assertEqual((ada.department, ada.status), ('lab', 'active'))
+        self.assertEqual(ada.date_joined, datetime.date(2024, 1, 15))
+        self.assertTrue(ada.qr_code)
+        stamps = dict(Staff.objects.values_list('staff_id', 'updated_at'))
+
+        rows = [self.ROWS[0].replace('Scientist', 'Senior Scientist')] + self.ROWS[1:] + ['NOH/2024/0004,,,,,,,,,\n']
+        with mock.patch.object(pdf_cache, 'invalidate_many') as invalidate:
+            result = self.run_import(rows, chunk_size=2)
+        self.assertEqual((result.created, result.updated, result.unchanged), (0, 1, 2))
+        self.assertEqual([number for number, message in result.errors], [5])
+        self.assertEqual(result.total, 4)
+        # One cache pass for the chunk holding the changed row
+        invalidate.assert_called_once_with([ada.uuid])
+
+        self.assertEqual(Staff.objects.get(staff_id='NOH/2024/0001').position, 'Senior Scientist')
+        updated = dict(Staff.objects.values_list('staff_id', 'updated_at'))
+        self.assertGreater(updated.pop('NOH/2024/0001'), stamps.pop('NOH/2024/0001'))
+        self.assertEqual(updated, stamps)
+
+    def test_unsupported_file(self):
+        with self.assertRaises(StaffImportError):
+            import_staff(BytesIO(b''), 'export.txt')
+
+
+@override_settings(QR_SIGNING_KEY=generate_signing_key(), ROSTER_SYNC_LAG_SECONDS=0)
+class OfflineVerificationTest(TempMediaMixin, TestCase):
+    """Signed QR tokens check out against the public key, and the revocation list tracks status changes"""
+
+    def setUp(self):
+        super().setUp()
+        seed_staff(2, seed=23)
+        self.staff = list(seeded_staff().order_by('pk'))
+        for staff in self.staff:
+            staff.status = 'active'
+            staff.save()
+        # Earlier history, so the scanner below starts from a real version
+        RevocationEvent.objects.create(staff_uuid=uuid.uuid4(), revoked=False)
+        self.version = revocation_list()['version']
+
+    def test_token_round_trip(self):
+        staff = self.staff[0]
+        claims = verify_staff_token(sign_staff_token(staff))
+        self.assertEqual(claims['uuid'], staff.uuid.hex)
+        self.assertEqual((claims['staff_id'], claims['status']), (staff.staff_id, 'active'))
+
+        response = self.client.get(reverse('staff:signing_key'))
+        self.assertEqual(response.json()['public_key'], public_key_b64())
+
+    def test_forged_tokens(self):
+        token = sign_staff_token(self.staff[0])
+        payload, signature = token.split('.')
+        forged = base64.urlsafe_b64encode(
+            base64.urlsafe_b64decode(payload + '==').replace(b'active', b'ACTIVE')
+        ).decode().rstrip('=')
+        other_key = Ed25519PrivateKey.generate().public_key().public_bytes(
+            serialization.Encoding.Raw, serialization.PublicFormat.Raw
+        )
+        for bad, key in ((f'{forged}.{signature}', None), ('garbage', None),
+                         (token, base64.urlsafe_b64encode(other_key).decode().rstrip('='))):
+            with self.assertRaises(BadSignature):
+                verify_staff_token(bad, key)
+
+    def test_revocation_list(self):
+        suspended, deleted = self.staff
+        suspended.status = 'suspended'
+        suspended.save()
+        with mock.patch.object(pdf_cache, 'invalidate_many') as invalidate:
+            StaffAdmin(Staff, admin.site).delete_queryset(None, Staff.objects.filter(pk=deleted.pk))
+        invalidate.assert_called_once_with([deleted.uuid])
+
+        changes = self.client.get(reverse('staff:revocations'), {'since': self.version}).json()
+        self.assertEqual(set(changes['revoked']), {suspended.uuid.hex, deleted.uuid.hex})
+        self.assertFalse(changes['full'])
+
+        suspended.status = 'active'
+        suspended.save()
+        latest = revocation_list(changes['version'])
+        self.assertEqual((latest['revoked'], latest['restored']), ([], [suspended.uuid.hex]))
+        # A fresh scanner only needs who is revoked now
+        self.assertEqual(revocation_list()['revoked'], [deleted.uuid.hex])
+
+    @override_settings(ROSTER_SYNC_LAG_SECONDS=5)
+    def test_event_committed_out_of_order(self):
+        first, second = self.staff
+        start = timezone.now() + datetime.timedelta(seconds=10)
+        # The higher id commits first; the lower one is still in an open transaction
+        RevocationEvent.objects.create(id=self.version + 2, staff_uuid=second.uuid, revoked=True,
+                                       created_at=start + datetime.timedelta(seconds=1))
+        with mock.patch('django.utils.timezone.now', return_value=start + datetime.timedelta(seconds=2)):
+            early = revocation_list(self.version)
+        self.assertEqual((early['version'], early['revoked']), (self.version, []))
+
+        RevocationEvent.objects.create(id=self.version + 1, staff_uuid=first.uuid, revoked=True, created_at=start)
+        with mock.patch('django.utils.timezone.now', return_value=start + datetime.timedelta(seconds=7)):
+            settled = revocation_list(early['version'])
+        self.assertEqual(settled['version'], self.version + 2)
+        self.assertEqual(settled['revoked'], [first.uuid.hex, second.uuid.hex])
+
+
+class PhotoRenditionTest(TempMediaMixin, TestCase):
+    """Staff photos get resized renditions, built on save or in batches by the command"""
+
+    def setUp(self):
+        super().setUp()
+        seed_staff(1, seed=29)
+        self.staff = seeded_staff().get()
+
+    def upload(self, name='ada.png', size=(900, 1200)):
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 30, 30, 255)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_built_on_save(self):
+        self.assertEqual(self.staff.photo_thumb_url, '')
+        self.staff.photo = self.upload()
+        self.staff.save()
+        self.assertEqual(set(self.staff.photo_renditions), set(RENDITIONS))
+        for rendition, (size, fmt) in RENDITIONS.items():
+            with Image.open(os.path.join(self.media_root, self.staff.photo_renditions[rendition])) as image:
+                self.assertEqual((image.size, image.format), (size, fmt))
+        self.assertTrue(self.staff.photo_card_url.endswith('_card.jpg'))
+
+    def test_command(self):
+        self.staff.photo = self.upload()
+        self.staff.save()
+        Staff.objects.filter(pk=self.staff.pk).update(photo_renditions={})
+        # Falls back to the original until the renditions exist
+        staff = Staff.objects.get(pk=self.staff.pk)
+        self.assertEqual(staff.photo_thumb_url, staff.photo.url)
+
+        other = Staff.objects.create(
+            staff_id='NOH/2024/0900', first_name='Ada', last_name='Lovelace', email='ada@example.com',
+            phone='0803', department='lab', position='Scientist', date_joined=datetime.date(2024, 1, 1),
+        )
+        Staff.objects.filter(pk=other.pk).update(photo='staff_photos/missing.jpg')
+
+        out, err = StringIO(), StringIO()
+        with mock.patch.object(pdf_cache, 'invalidate_many') as invalidate:
+            call_command('generate_photo_renditions', '--workers', '1', stdout=out, stderr=err)
+        self.assertIn("Built renditions for 1 photo(s), 1 failed", out.getvalue())
+        self.assertIn('missing.jpg', err.getvalue())
+        invalidate.assert_called_once_with([self.staff.uuid])
+        staff = Staff.objects.get(pk=self.staff.pk)
+        self.assertEqual(set(staff.photo_renditions), set(RENDITIONS))
+        self.assertGreater(staff.updated_at, self.staff.updated_at)
+
+
+class ExportTest(TempMediaMixin, TestCase):
+    """Staff and verification exports follow the list filters and stream CSV or XLSX"""
+
+    def setUp(self):
+        super().setUp()
+        seed_staff(4, seed=19)
+        self.staff = list(seeded_staff().order_by('pk'))
+        Staff.objects.filter(pk=self.staff[0].pk).update(department='lab')
+        Staff.objects.filter(pk__in=[staff.pk for staff in self.staff[1:]]).update(department='nursing')
+        self.client.force_login(User.objects.create_user('admin', password='secret'))
+
+    def csv_rows(self, response):
+        self.assertTrue(response.streaming)
+        text = b''.join(response.streaming_content).decode('utf-8')
+        return list(csv.reader(text.splitlines()))
+
+    def test_staff_csv(self):
+        response = self.client.get(reverse('staff:export_staff'), {'department': 'lab'})
+        self.assertIn('attachment; filename="staff_', response['Content-Disposition'])
+        header, *rows = self.csv_rows(response)
+        self.assertEqual(header[:2], ['Staff ID', 'First Name'])
+        self.assertEqual([row[0] for row in rows], [self.staff[0].staff_id])
+        self.assertEqual(rows[0][header.index('Department')], 'Laboratory')
+
+    def test_verifications_date_range(self):
+        day = datetime.date(2025, 3, 10)
+        for staff, offset in ((self.staff[0], 0), (self.staff[1], 1), (self.staff[1], 2)):
+            verified_at = timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=offset),
+                                                                        datetime.time(23, 30)))
+            VerificationLog.objects.create(staff=staff, ip_address='10.0.0.1', verified_at=verified_at)
+
+        url = reverse('staff:export_verifications')
+        rows = self.csv_rows(self.client.get(url, {'date_from': '2025-03-10', 'date_to': '2025-03-11'}))[1:]
+        # date_to is inclusive, to the end of the local day
+        self.assertEqual([row[0] for row in rows], ['2025-03-10 23:30:00', '2025-03-11 23:30:00'])
+        rows = self.csv_rows(self.client.get(url, {'department': 'nursing'}))[1:]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual({row[4] for row in rows}, {'Nursing'})
+
+    def test_xlsx(self):
+        from openpyxl import load_workbook
+
+        response = self.client.get(reverse('staff:export_staff'), {'format': 'xlsx'})
+        self.assertIn('.xlsx', response['Content-Disposition'])
+        sheet = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[0][0], 'Staff ID')
+        self.assertEqual(sorted(row[0] for row in rows[1:]), sorted(staff.staff_id for staff in self.staff))
+
+
+@override_settings(BULK_PDF_WORKERS=1)
+class QRCodeTest(TempMediaMixin, TestCase):
+    """Stale QR codes are redrawn in batches, and codes can be inlined instead of linked"""
+
+    def setUp(self):
+        super().setUp()
+        seed_staff(3, seed=17)
+        self.staff = list(seeded_staff().order_by('pk'))
+
+    def regenerate(self, *args):
+        out = StringIO()
+        with mock.patch.object(pdf_cache, 'invalidate_many') as invalidate:
+            call_command('regenerate_qr_codes', *args, '--batch-size', '2', stdout=out)
+        return out.getvalue(), invalidate
+
+    def test_regenerates_stale_codes(self):
+        # Seeded rows have no code yet
+        self.assertIn("Regenerated 3 of 3", self.regenerate()[0])
+        Staff.objects.filter(pk=self.staff[0].pk).update(qr_hash='outdated')
+        stamp = Staff.objects.get(pk=self.staff[0].pk).updated_at
+        output, invalidate = self.regenerate()
+        self.assertIn("Regenerated 1 of 3", output)
+        invalidate.assert_called_once_with([self.staff[0].uuid])
+        staff = Staff.objects.get(pk=self.staff[0].pk)
+        self.assertEqual(staff.qr_hash, qr_content_hash(staff))
+        self.assertGreater(staff.updated_at, stamp)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, staff.qr_code.name)))
+
+        output, invalidate = self.regenerate()
+        self.assertIn("Regenerated 0 of 3", output)
+        output, invalidate = self.regenerate('--force')
+        self.assertIn("Regenerated 3 of 3", output)
+        # One cache pass per batch of two
+        self.assertEqual(invalidate.call_count, 2)
+
+    def test_inline_codes(self):
+        staff = self.staff[0]
+        png = qr_data_uri(staff, 'png')
+        self.assertTrue(png.startswith('data:image/png;base64,'))
+        self.assertEqual(base64.b64decode(png.split(',', 1)[1])[:8], b'\x89PNG\r\n\x1a\n')
+        svg = base64.b64decode(qr_data_uri(staff, 'svg').split(',', 1)[1])
+        self.assertIn(b'<svg', svg)
+
+
+class KeysetPaginationTest(TempMediaMixin, TestCase):
+    """Cursor pages walk the whole list both ways, ties on the leading key included"""
+
+    def setUp(self):
+        super().setUp()
+        seed_staff(7, seed=13)
+        # Three rows share a created_at, so the id decides their order
+        now = timezone.now()
+        for age, pk in enumerate(Staff.objects.order_by('pk').values_list('pk', flat=True)):
+            Staff.objects.filter(pk=pk).update(created_at=now - datetime.timedelta(days=max(age, 2)))
+        self.expected = list(Staff.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.paginator = KeysetPaginator(Staff.objects.all(), 3)
+
+    def ids(self, page):
+        return [staff.pk for staff in page]
+
+    def test_next_and_previous(self):
+        pages = [self.paginator.page()]
+        self.assertFalse(pages[0].has_previous())
+        while pages[-1].has_next():
+            pages.append(self.paginator.page(pages[-1].next_cursor))
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        previous = self.paginator.page(pages[-1].previous_cursor)
+        self.assertEqual(self.ids(previous), self.ids(pages[1]))
+        first = self.paginator.page(previous.previous_cursor)
+        self.assertEqual(self.ids(first), self.ids(pages[0]))
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+    def test_seek_bounds_leading_key(self):
+        cursor = self.paginator.page().next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            self.paginator.page(cursor)
+        self.assertIn('"staff_staff"."created_at" <=', queries.captured_queries[0]['sql'])
+
+    def test_invalid_cursor_is_first_page(self):
+        first = self.ids(self.paginator.page())
+        wrong_length = self.paginator.encode_cursor('next', SimpleNamespace(created_at=1, id=2))[:-2]
+        for cursor in ('garbage', '', 'W10', wrong_length):
+            self.assertEqual(self.ids(self.paginator.page(cursor)), first)
+
+    def test_staff_list_cursor(self):
+        self.client.force_login(User.objects.create_user('admin', password='secret'))
+        page = self.client.get(reverse('staff:staff_list')).context['staff_list']
+        self.assertEqual(self.ids(page), self.expected)
+        self.assertEqual(page.next_cursor, '')
+        cursor = self.paginator.encode_cursor('next', Staff.objects.get(pk=self.expected[3]))
+        page = self.client.get(reverse('staff:staff_list'), {'cursor': cursor}).context['staff_list']
+        self.assertEqual(self.ids(page), self.expected[4:])
+        self.assertTrue(page.has_previous())
+
+
+class LogStorageTest(TempMediaMixin, TestCase):
+    """Monthly partitions and retention for the verification log"""
+
+    def setUp(self):
+        super().setUp()
+        seed_staff(1, seed=11)
+        self.staff = seeded_staff().get()
+
+    def log_at(self, verified_at):
+        return VerificationLog.objects.create(staff=self.staff, ip_address='10.0.0.1', verified_at=verified_at)
+
+    def test_retention_keeps_rollup(self):
+        now = timezone.now()
+        self.log_at(now - datetime.timedelta(days=40))
+        recent = self.log_at(now - datetime.timedelta(days=2))
+        rebuild_daily_counts()
+        self.assertEqual(apply_retention(30), 1)
+        self.assertEqual(list(VerificationLog.objects.all()), [recent])
+        self.assertEqual(VerificationDailyCount.objects.count(), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', "Partitioned log storage needs PostgreSQL")
+    def test_partition_takes_rows_from_default(self):
+        table = VerificationLog._meta.db_table
+        now = timezone.now()
+        self.log_at(now)
+        with connection.cursor() as cursor:
+            # Fire the foreign key checks TestCase's transaction has deferred; ALTER TABLE refuses to run past them
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        convert_to_partitioned(months_ahead=0)
+        self.assertTrue(is_partitioned())
+
+        # Past the last partition, so it lands in the default one
+        later = self.log_at(now + datetime.timedelta(days=70))
+        month = f"{later.verified_at.astimezone(datetime.timezone.utc):%Y%m}"
+        created = ensure_partitions(months_ahead=3)
+        self.assertIn(f"{table}_p{month}", created)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM "{table}_default"')
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute(f'SELECT id FROM "{table}_p{month}"')
+            self.assertEqual(cursor.fetchall(), [(later.pk,)])
+        self.assertEqual(VerificationLog.objects.count(), 2)
+        self.assertEqual(ensure_partitions(months_ahead=3), created)
+
+
+class VerificationCacheTest(TempMediaMixin, TestCase):
+    """The verify page reads a cached record that a save clears and midnight expires"""
+
+    def setUp(self):
+        super().setUp()
+        caches[settings.VERIFY_CACHE_ALIAS].clear()
+        seed_staff(1, seed=5)
+        self.staff = seeded_staff().get()
+        self.staff.status = 'active'
+        self.staff.date_expiry = timezone.localdate() + datetime.timedelta(days=30)
+        self.staff.save()
+
+    def test_read_through_and_invalidate(self):
+        record = get_verification_record(self.staff.uuid)
+        self.assertTrue(record.is_valid())
+        with self.assertNumQueries(0):
+            self.assertEqual(get_verification_record(self.staff.uuid).staff_id, self.staff.staff_id)
+
+        self.staff.status = 'suspended'
+        self.staff.save()
+        record = get_verification_record(self.staff.uuid)
+        self.assertEqual(record.get_status_display(), 'Suspended')
+        self.assertFalse(record.is_valid())
+
+        self.staff.delete()
+        with self.assertRaises(Http404):
+            get_verification_record(self.staff.uuid)
+
+    def test_save_seen_by_other_workers(self):
+        # Two workers, each with its own in-memory record cache
+        first = LocMemCache('verify-worker-1', {})
+        second = LocMemCache('verify-worker-2', {})
+        for worker in (first, second):
+            with mock.patch.object(verify_cache, '_cache', return_value=worker):
+                self.assertTrue(get_verification_record(self.staff.uuid).is_valid())
+
+        with mock.patch.object(verify_cache, '_cache', return_value=first):
+            self.staff.status = 'suspended'
+            self.staff.save()
+        self.assertIsNotNone(second.get(verify_cache._cache_key(self.staff.uuid)))
+        with mock.patch.object(verify_cache, '_cache', return_value=second):
+            self.assertFalse(get_verification_record(self.staff.uuid).is_valid())
+            with self.assertNumQueries(0):
+                self.assertEqual(get_verification_record(self.staff.uuid).status, 'suspended')
+
+    def test_timeout_stops_at_midnight(self):
+        late = timezone.make_aware(datetime.datetime(2025, 3, 1, 23, 59, 30))
+        with mock.patch('django.utils.timezone.now', return_value=late), override_settings(VERIFY_CACHE_TTL=300):
+            self.assertEqual(verify_cache._timeout(), 30)
+        with override_settings(VERIFY_CACHE_TTL=0):
+            self.assertEqual(verify_cache._timeout(), 1)
+
+
+class ServerTimingTest(TempMediaMixin, TestCase):
+    """Server-Timing goes to staff users only, and every worker's stats reach the stats page"""
+
+    def setUp(self):
+        super().setUp()
+        self.staff = Staff.objects.create(
+            staff_id='NOH/2024/0011', first_name='Bola', last_name='Ade', department='nursing',
+            position='Nurse', date_joined=datetime.date(2024, 3, 1), date_expiry=datetime.date(2027, 3, 1),
+        )
+        self.url = reverse('staff:verify', args=[self.staff.uuid])
+        caches['timing'].clear()
+
+    def test_header_for_staff_only(self):
+        self.assertNotIn('Server-Timing', self.client.get(self.url))
+        self.client.force_login(User.objects.create_user('clerk', password='secret'))
+        self.assertNotIn('Server-Timing', self.client.get(self.url))
+        self.client.force_login(User.objects.create_user('admin', password='secret', is_staff=True))
+        self.assertIn('total;dur=', self.client.get(self.url)['Server-Timing'])
+
+    @override_settings(DEBUG=True)
+    def test_header_for_everyone_in_debug(self):
+        self.assertIn('Server-Timing', self.client.get(self.url))
+
+    async def test_async_header_for_staff_only(self):
+        response = await self.async_client.get(self.url)
+        self.assertNotIn('Server-Timing', response)
+        user = await User.objects.acreate(username='admin', is_staff=True)
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get(self.url)
+        self.assertIn('Server-Timing', response)
+
+    def test_logs_at_debug(self):
+        with self.assertLogs('staff.timing', 'DEBUG') as logs:
+            self.client.get(self.url)
+        self.assertEqual([record.levelname for record in logs.records], ['DEBUG'])
+        self.assertEqual(logs.records[0].endpoint, 'staff:verify')
+
+    def test_record_does_not_publish(self):
+        stats = EndpointStats(cache_alias='timing')
+        with mock.patch.object(EndpointStats, '_run'), mock.patch.object(EndpointStats, 'publish') as publish:
+            stats.record('staff:verify', 12.0, RequestTimings())
+        publish.assert_not_called()
+        self.assertEqual(caches['timing'].get('server_timing:slot:0'), None)
+
+    def worker(self, name):
+        return mock.patch.object(EndpointStats, 'worker', new_callable=mock.PropertyMock, return_value=name)
+
+    def test_collect_merges_workers(self):
+        with mock.patch.object(EndpointStats, '_run'):
+            for name, total in (('web:1', 10.0), ('web:2', 30.0)):
+                stats = EndpointStats(cache_alias='timing')
+                stats.record('staff:verify', total, RequestTimings())
+                with self.worker(name):
+                    stats.publish()
+                    stats.publish()
+        with self.worker('web:3'):
+            rows = EndpointStats(cache_alias='timing').collect()
+        self.assertEqual([(row['endpoint'], row['requests'], row['total_ms']) for row in rows],
+                         [('staff:verify', 2, 40.0)])
+
+    def test_taken_key_moves_worker(self):
+        stats = EndpointStats(cache_alias='timing')
+        with self.worker('web:1'):
+            stats.publish()
+        self.assertEqual(stats._key, 'server_timing:slot:0')
+        caches['timing'].set('server_timing:slot:0', {'worker': 'web:2', 'slots': {}})
+        with self.worker('web:1'):
+            stats.publish()
+        self.assertEqual(stats._key, 'server_timing:slot:1')
+        self.assertEqual(caches['timing'].get('server_timing:slot:0')['worker'], 'web:2')
+
+
+@override_settings(VERIFICATION_LOG_BUFFERED=False)
+class ASGIRoutingTest(TempMediaMixin, TestCase):
+    """Only an ASGI deployment gets the async verify view and async download bodies"""
+
+    def setUp(self):
+        super().setUp()
+        self.staff = Staff.objects.create(
+            staff_id='NOH/2024/0012', first_name='Chidi', last_name='Eze', department='nursing',
+            position='Nurse', date_joined=datetime.date(2024, 3, 1), date_expiry=datetime.date(2027, 3, 1),
+        )
+        self.url = reverse('staff:verify', args=[self.staff.uuid])
+        self.user = User.objects.create_user('clerk', password='secret')
+
+    def serve_asgi(self):
+        # The URLconfs pick the verify view at import, so they are reloaded on the way in and out
+        self.addCleanup(clear_url_caches)
+        for module in (root_urls, urls):
+            self.addCleanup(importlib.reload, module)
+        asgi = override_settings(SERVER_INTERFACE='asgi')
+        asgi.enable()
+        self.addCleanup(asgi.disable)
+        for module in (urls, root_urls):
+            importlib.reload(module)
+        clear_url_caches()
+
+    def test_wsgi_keeps_sync_views(self):
+        self.assertIs(resolve(self.url).func, views.verify_staff)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('staff:export_staff'))
+        self.assertFalse(response.is_async)
+        self.assertIn(b'NOH/2024/0012', response.getvalue())
+
+    def test_asgi_verify_view(self):
+        self.serve_asgi()
+        self.assertIs(resolve(self.url).func, views.averify_staff)
+
+    async def test_asgi_verify_page(self):
+        self.serve_asgi()
+        response = await self.async_client.get(self.url)
+        self.assertContains(response, 'Chidi')
+        self.assertEqual(await VerificationLog.objects.filter(staff_id=self.staff.pk).acount(), 1)
+
+    async def test_asgi_streams_asynchronously(self):
+        self.serve_asgi()
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('staff:export_staff'))
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertIn(b'NOH/2024/0012', body)
+
+
+class ExpirySweepTest(TempMediaMixin, TestCase):
+    """The daily sweep expires only active staff past date_expiry and drops their cached state"""
+
+    def setUp(self):
+        super().setUp()
+        self.today = datetime.date(2026, 5, 10)
+
+        def make(staff_id, status, expiry):
+            return Staff.objects.create(
+                staff_id=staff_id, first_name='Ada', last_name='Obi', department='nursing', position='Nurse',
+                date_joined=datetime.date(2024, 1, 1), date_expiry=expiry, status=status,
+            )
+        self.lapsed = make('NOH/2024/0101', 'active', self.today - datetime.timedelta(days=1))
+        self.due = make('NOH/2024/0102', 'active', self.today)
+        self.soon = make('NOH/2024/0103', 'active', self.today + datetime.timedelta(days=5))
+        self.suspended = make('NOH/2024/0104', 'suspended', self.today - datetime.timedelta(days=3))
+
+    def test_expire_staff(self):
+        caches[settings.VERIFY_CACHE_ALIAS].clear()
+        get_verification_record(self.lapsed.uuid)
+        with mock.patch.object(Staff, 'bulk_invalidate_caches', wraps=Staff.bulk_invalidate_caches) as invalidate:
+            self.assertEqual(expire_staff(self.today), [self.lapsed.uuid])
+        invalidate.assert_called_once_with([self.lapsed.uuid])
+
+        statuses = dict(Staff.objects.values_list('staff_id', 'status'))
+        self.assertEqual(statuses, {'NOH/2024/0101': 'expired', 'NOH/2024/0102': 'active',
+                                    'NOH/2024/0103': 'active', 'NOH/2024/0104': 'suspended'})
+        self.assertEqual(get_verification_record(self.lapsed.uuid).status, 'expired')
+        self.assertTrue(RevocationEvent.objects.filter(staff_uuid=self.lapsed.uuid, revoked=True).exists())
+        self.assertEqual(expire_staff(self.today), [])
+
+    def test_expiring_staff(self):
+        self.assertEqual(list(expiring_staff(7, self.today)), [self.due, self.soon])
+        self.assertEqual(list(expiring_staff(1, self.today)), [self.due])
+
+    def test_shown_expired_before_sweep(self):
+        today = timezone.localdate()
+        Staff.objects.filter(pk=self.lapsed.pk).update(date_expiry=today - datetime.timedelta(days=1))
+        Staff.objects.filter(pk=self.soon.pk).update(date_expiry=today + datetime.timedelta(days=5))
+        self.lapsed.refresh_from_db()
+        self.soon.refresh_from_db()
+        self.assertEqual(self.lapsed.get_status_display_class(), 'danger')
+        self.assertEqual(self.soon.get_status_display_class(), 'success')
+
+        self.client.force_login(User.objects.create_user('admin', password='secret'))
+        response = self.client.get(reverse('staff:staff_detail', args=[self.lapsed.uuid]))
+        self.assertContains(response, 'bg-red-100 text-red-800')
+        self.assertNotContains(response, 'bg-green-100 text-green-800')
+
+    def test_command(self):
+        out = StringIO()
+        with mock.patch('django.utils.timezone.localdate', return_value=self.today):
+            call_command('expire_staff', '--report-days', '7', stdout=out)
+        output = out.getvalue()
+        self.assertIn('Marked 1 staff as expired', output)
+        self.assertIn('NOH/2024/0103', output)
+        self.assertIn('2 card(s) expire in the next 7 day(s)', output)
+
+
+@override_settings(VERIFICATION_LOG_BUFFERED=False)
+class BatchVerificationTest(TempMediaMixin, TestCase):
+    """The kiosk batch API resolves every id in one query and logs the scans in one insert"""
+
+    def setUp(self):
+        super().setUp()
+        seed_staff(5, seed=3)
+        self.staff = list(seeded_staff().order_by('staff_id'))
+        self.staff[1].status = 'suspended'
+        self.staff[1].save()
+        self.url = reverse('staff:verify_batch')
+
+    def post(self, ids):
+        return self.client.post(self.url, json.dumps({'ids': ids}), content_type='application/json')
+
+    def test_batch(self):
+        ids = [str(staff.uuid) for staff in self.staff[:3]] + [str(self.staff[0].uuid), 'not-a-staff-id']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(ids)
+        results = response.json()['results']
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(sum('FROM "staff_staff" WHERE "staff_staff"."uuid" IN' in sql for sql in statements), 1)
+        self.assertEqual(sum(sql.startswith('INSERT INTO "staff_verificationlog"') for sql in statements), 1)
+
+        self.assertEqual([result['id'] for result in results], ids)
+        self.assertEqual([result['found'] for result in results], [True, True, True, True, False])
+        self.assertEqual(results[0]['staff_id'], self.staff[0].staff_id)
+        self.assertFalse(results[1]['valid'])
+        self.assertEqual(results[1]['status'], 'suspended')
+        self.assertEqual(VerificationLog.objects.count(), 4)
+
+    @override_settings(VERIFICATION_LOG_BUFFERED=True)
+    def test_batch_written_in_request_when_buffered(self):
+        with mock.patch('staff.log_writer.log_writer') as writer, CaptureQueriesContext(connection) as queries:
+            self.post([str(staff.uuid) for staff in self.staff])
+        writer.log.assert_not_called()
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(sum(sql.startswith('INSERT INTO "staff_verificationlog"') for sql in statements), 1)
+        self.assertEqual(VerificationLog.objects.count(), 5)
+
+    @override_settings(VERIFY_KIOSK_KEYS=['kiosk=gate-key'])
+    def test_staff_ids_need_kiosk_key(self):
+        User.objects.create_user('kiosk', password='secret')
+        client = Client(enforce_csrf_checks=True)
+        staff_id = self.staff[0].staff_id
+        body = json.dumps({'ids': [staff_id]})
+        self.assertFalse(client.post(self.url, body, content_type='application/json').json()['results'][0]['found'])
+        self.assertEqual(client.post(self.url, body, content_type='application/json',
+                                     HTTP_AUTHORIZATION='Bearer wrong-key').status_code, 401)
+
+        result = client.post(self.url, body, content_type='application/json',
+                             HTTP_AUTHORIZATION='Bearer gate-key').json()['results'][0]
+        self.assertEqual(result['uuid'], str(self.staff[0].uuid))
+        self.assertEqual(VerificationLog.objects.get().verified_by.username, 'kiosk')
+
+    def test_session_needs_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(User.objects.create_user('clerk', password='secret'))
+        body = json.dumps({'ids': [self.staff[0].staff_id]})
+        self.assertEqual(client.post(self.url, body, content_type='application/json').status_code, 403)
+        self.assertFalse(VerificationLog.objects.exists())
+
+        token = 'a' * 32
+        client.cookies[settings.CSRF_COOKIE_NAME] = token
+        response = client.post(self.url, body, content_type='application/json', HTTP_X_CSRFTOKEN=token)
+        self.assertTrue(response.json()['results'][0]['found'])
+        self.assertEqual(VerificationLog.objects.get().verified_by.username, 'clerk')
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.post(self.url, 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post('abc').status_code, 400)
+        with override_settings(VERIFY_BATCH_MAX_IDS=2):
+            self.assertEqual(self.post(['a', 'b', 'c']).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+
+@override_settings(ROSTER_SYNC_LAG_SECONDS=0)
+class RosterSyncTest(TempMediaMixin, TestCase):
+    """A kiosk rebuilds the roster from a snapshot plus deltas"""
+
+    def setUp(self):
+        super().setUp()
+        seed_staff(6, seed=4)
+        self.staff = list(seeded_staff().order_by('staff_id'))
+        self.staff[0].status = 'suspended'
+        self.staff[0].save()
+        self.client.force_login(User.objects.create_user('kiosk', password='secret'))
+
+    def snapshot(self):
+        path = os.path.join(tempfile.mkdtemp(), 'roster.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        response = self.client.get(reverse('staff:roster_snapshot'))
+        with open(path, 'wb') as fileobj:
+            fileobj.write(response.content)
+        db = sqlite3.connect(path)
+        self.addCleanup(db.close)
+        return db
+
+    def sync(self, cursor, limit=None):
+        changed, removed = {}, set()
+        while True:
+            with override_settings(ROSTER_DELTA_LIMIT=limit or 5000):
+                delta = self.client.get(reverse('staff:roster_delta'), {'since': cursor}).json()
+            changed.update((row[0], dict(zip(delta['fields'], row))) for row in delta['changed'])
+            removed.update(delta['removed'])
+            cursor = delta['cursor']
+            if not delta['has_more']:
+                return changed, removed, cursor
+
+    def test_snapshot_then_deltas(self):
+        db = self.snapshot()
+        meta = dict(db.execute("SELECT key, value FROM meta"))
+        active = {staff.uuid.hex for staff in self.staff if staff.status == 'active'}
+        self.assertEqual(meta['count'], str(len(active)))
+        self.assertEqual({row[0] for row in db.execute("SELECT uuid FROM staff")}, active)
+
+        self.staff[1].status = 'revoked'
+        self.staff[1].save()
+        self.staff[2].position = 'Matron'
+        self.staff[2].save()
+        deleted = self.staff[3].uuid.hex
+        self.staff[3].delete()
+
+        changed, removed, cursor = self.sync(meta['cursor'], limit=1)
+        self.assertEqual(changed[self.staff[1].uuid.hex]['status'], 'revoked')
+        self.assertIn(self.staff[2].uuid.hex, changed)
+        self.assertEqual(removed, {deleted})
+
+        self.assertEqual(self.sync(cursor), ({}, set(), cursor))
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.client.get(reverse('staff:roster_delta'), {'since': 'x'}).status_code, 400)
+
+
+class RendererLoadingTest(TestCase):
+    """Workers boot without the PDF and QR engines, and warm-up loads them all"""
+
+    SCRIPT = (
+        "import json, django; django.setup();"
+        "from django.conf import settings; from django.urls import get_resolver;"
+        "get_resolver(settings.ROOT_URLCONF).url_patterns;"
+        "from staff.renderers import loaded_engines, warm_up;"
+        "booted = loaded_engines(); warm_up(['qrcode']);"
+        "print(json.dumps([booted, loaded_engines()]))"
+    )
+
+    def test_engines_load_on_first_use(self):
+        # A fresh interpreter: this test module imports pypdf and reportlab itself
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)}
+        output = subprocess.run([sys.executable, '-c', self.SCRIPT], env=env, cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout
+        booted, warmed = json.loads(output.splitlines()[-1])
+        self.assertEqual(booted, [])
+        self.assertEqual(warmed, ['qrcode'])
+
+    def test_warm_up_command(self):
+        out = StringIO()
+        call_command('warm_up_renderers', stdout=out)
+        for name in renderers.ENGINES:
+            self.assertIn(name, out.getvalue())
+        self.assertEqual(renderers.loaded_engines(), list(renderers.ENGINES))
+
+    def test_gunicorn_hook(self):
+        hooks = runpy.run_path(os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'))
+        with mock.patch('staff.renderers.warm_up') as warm_up:
+            with override_settings(PDF_WARM_UP=False):
+                hooks['post_worker_init'](None)
+            warm_up.assert_not_called()
+            with override_settings(PDF_WARM_UP=True):
+                hooks['post_worker_init'](None)
+            warm_up.assert_called_once_with()
+
+
+@override_settings(BACKGROUND_JOBS=True, JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=30)
+class JobQueueTest(TempMediaMixin, TestCase):
+    """QR codes and PDFs are produced by the run_jobs worker, with retries, and polled for over HTMX or JSON"""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.staff = Staff.objects.create(
+                staff_id='NOH/2024/0100', first_name='Ngozi', last_name='Eze', department='lab',
+                position='Scientist', date_joined=datetime.date(2024, 5, 1),
+            )
+        self.client.force_login(User.objects.create_user('clerk', password='secret'))
+
+    def test_qr_code_generated_by_worker(self):
+        self.assertFalse(self.staff.qr_code)
+        saved_at = self.staff.updated_at
+        job = Job.objects.get(kind='qr_code')
+        self.assertEqual(work(once=True), 1)
+
+        job.refresh_from_db()
+        self.staff.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertTrue(self.staff.qr_code)
+        # ETags and the kiosk roster cursor follow updated_at
+        self.assertGreater(self.staff.updated_at, saved_at)
+        self.assertEqual(work(once=True), 0)
+
+    def test_renditions_bump_updated_at(self):
+        saved_at = self.staff.updated_at
+        self.staff.refresh_photo_renditions()
+        self.staff.refresh_from_db()
+        self.assertGreater(self.staff.updated_at, saved_at)
+
+    def test_running_job_reused_until_staff_changes(self):
+        work(once=True)
+        job = jobs.enqueue('card_pdf', self.staff)
+        self.assertEqual(jobs.claim(), [job])
+        self.staff.refresh_from_db()
+        self.assertEqual(jobs.enqueue('card_pdf', self.staff), job)
+
+        self.staff.position = 'Senior Scientist'
+        self.staff.save()
+        self.assertNotEqual(jobs.enqueue('card_pdf', self.staff), job)
+
+    def test_retry_with_backoff_then_fail(self):
+        work(once=True)
+
+        def broken(staff):
+            raise RuntimeError("renderer crashed")
+
+        with mock.patch.dict(jobs.HANDLERS, {'card_pdf': broken}):
+            job = jobs.enqueue('card_pdf', self.staff)
+            self.assertEqual(jobs.enqueue('card_pdf', self.staff), job)
+            work(once=True)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('queued', 1))
+            self.assertGreater(job.run_after, timezone.now() + datetime.timedelta(seconds=25))
+            self.assertEqual(work(once=True), 0)
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            work(once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIn('renderer crashed', job.last_error)
+
+    def test_prepare_then_fetch(self):
+        work(once=True)
+        prepare = reverse('staff:prepare_pdf', args=[self.staff.uuid, 'sticker_pdf'])
+        status = self.client.post(prepare).json()
+        self.assertEqual((status['status'], status['download_url']), ('queued', None))
+
+        polling = self.client.get(reverse('staff:job_status', args=[status['job']]), HTTP_HX_REQUEST='true')
+        self.assertContains(polling, 'every 2s')
+
+        work(once=True)
+        status = self.client.get(reverse('staff:job_status', args=[status['job']])).json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(self.client.get(status['download_url']).status_code, 200)
+        # Already rendered, so nothing new is queued
+        self.assertIsNone(self.client.post(prepare).json()['job'])
+
+    def test_polling_requeues_stale_render_once(self):
+        work(once=True)
+        job = jobs.enqueue('sticker_pdf', self.staff)
+        work(once=True)
+        self.staff.position = 'Senior Scientist'
+        self.staff.save()
+
+        url = reverse('staff:job_status', args=[job.pk])
+        status = self.client.get(url).json()
+        self.assertEqual((status['status'], status['download_url']), ('queued', None))
+        self.assertNotEqual(status['job'], job.pk)
+        self.assertEqual(self.client.get(url).json()['job'], status['job'])
+        self.assertEqual(Job.objects.filter(kind='sticker_pdf', status='queued').count(), 1)
+
+        work(once=True)
+        self.assertEqual(self.client.get(url).json()['status'], 'done')
+        self.assertEqual(Job.objects.filter(kind='sticker_pdf').count(), 2)
+
+
+@override_settings(VERIFICATION_GATES=['Main gate=10.0.1.0/24'], ANALYTICS_LAG_SECONDS=60, ANALYTICS_ALERT_WEEKS=4,
+                   ANALYTICS_ALERT_RATIO=3.0, ANALYTICS_ALERT_MIN_COUNT=20)
+class VerificationAnalyticsTest(TempMediaMixin, TestCase):
+    """Hourly counts are added past a watermark, and the dashboard reads only the aggregates"""
+
+    def setUp(self):
+        super().setUp()
+        self.nurse, self.scientist = (
+            Staff.objects.create(staff_id=staff_id, first_name='Kemi', last_name='Bello', department=department,
+                                 position='Officer', date_joined=datetime.date(2024, 1, 1))
+            for staff_id, department in (('NOH/2024/0201', 'nursing'), ('NOH/2024/0202', 'lab'))
+        )
+        self.hour = timezone.localtime().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=2)
+
+    def log(self, staff, ip_address, verified_at, count=1):
+        VerificationLog.objects.bulk_create(
+            [VerificationLog(staff=staff, ip_address=ip_address, verified_at=verified_at) for _ in range(count)]
+        )
+
+    def counts(self):
+        return {(row.department, row.gate): row.count for row in VerificationHourlyCount.objects.all()}
+
+    def total(self):
+        return sum(VerificationHourlyCount.objects.values_list('count', flat=True))
+
+    def test_incremental_refresh_and_dashboard(self):
+        scanned = self.hour + datetime.timedelta(minutes=10)
+        self.log(self.nurse, '10.0.1.5', scanned, count=3)
+        self.log(self.scientist, '192.168.0.9', scanned, count=2)
+        self.log(self.nurse, '10.0.1.6', timezone.now() - datetime.timedelta(seconds=5))
+        refresh_hourly_counts()
+        self.assertEqual(self.counts(), {('nursing', 'Main gate'): 3, ('lab', ''): 2})
+
+        # Only rows past the watermark are read again: nothing is counted twice
+        self.log(self.nurse, '10.0.1.5', timezone.now() - datetime.timedelta(seconds=30))
+        refresh_hourly_counts(until=timezone.now() + datetime.timedelta(seconds=1))
+        self.assertEqual(self.total(), 7)
+
+        with override_settings(ANALYTICS_LAG_SECONDS=0):
+            rebuild_hourly_counts()
+            self.assertEqual(self.total(), 7)
+            with override_settings(VERIFICATION_GATES=[]):
+                rebuild_hourly_counts()
+            self.assertEqual(set(VerificationHourlyCount.objects.values_list('gate', flat=True)), {''})
+            rebuild_hourly_counts()
+
+        rebuild_daily_counts()
+        self.client.force_login(User.objects.create_user('security', password='secret'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('staff:verification_dashboard'), {'days': 7})
+        self.assertContains(response, 'Main gate')
+        self.assertContains(response, self.nurse.staff_id)
+        self.assertEqual(response.context['total'], 7)
+        self.assertFalse([query for query in queries if VerificationLog._meta.db_table in query['sql']])
+
+    def test_volume_alerts(self):
+        for weeks in range(1, 5):
+            hour = self.hour - datetime.timedelta(weeks=weeks)
+            VerificationHourlyCount.objects.create(hour=hour, department='nursing', gate='Main gate', count=10)
+            VerificationHourlyCount.objects.create(hour=hour, department='lab', gate='', count=30)
+        VerificationHourlyCount.objects.create(hour=self.hour, department='nursing', gate='Main gate', count=60)
+        VerificationHourlyCount.objects.create(hour=self.hour, department='lab', gate='', count=2)
+        AggregateWatermark.objects.create(name=analytics.WATERMARK, verified_at=timezone.now())
+
+        alerts = volume_alerts(hours=2)
+        self.assertEqual(
+            {(alert['dimension'], alert['name'], alert['direction']) for alert in alerts},
+            {('Gate', 'Main gate', 'spike'), ('Department', 'Nursing', 'spike'),
+             ('Gate', 'Other', 'drop'), ('Department', 'Laboratory', 'drop')},
+        )
+        self.assertEqual((alerts[0]['count'], alerts[0]['expected']), (60, 10.0))
@@ -0,0 +1,291 @@
+"""
+Per-request timing spans and rolling per-endpoint latency histograms.
+
+ServerTimingMiddleware (staff.middleware) starts a RequestTimings for each
+request; code wraps expensive work in `with timed('pdf'):` (or uses it as a
+decorator) and the time is added to that span. Outside a request timed()
+costs one context variable lookup. Spans may nest, e.g. qr inside pdf.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.functional import SimpleLazyObject
+
+logger = logging.getLogger(__name__)
+
+SPANS = ('db', 'template', 'pdf', 'qr')
+# Upper bounds (ms) of the histogram buckets; the last bucket is open-ended
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+PUBLISH_INTERVAL = 10
+# Cache keys server_timing:slot:0 .. WORKER_SLOTS - 1, one per worker process
+WORKER_SLOTS = 64
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Span durations (ms) and database query count for one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = dict.fromkeys(SPANS, 0.0)
+        self.queries = 0
+
+    def add(self, name, elapsed):
+        self.spans[name] = self.spans.get(name, 0.0) + elapsed * 1000
+
+    def total(self):
+        return (time.perf_counter() - self.start) * 1000
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """
+    Execute wrapper on every connection, counting queries and their time.
+
+    Installed once per connection (see install_db_wrapper) rather than per
+    request: async views query from sync_to_async threads, which have their
+    own connections but inherit the request's context variables.
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.add('db', time.perf_counter() - start)
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created receiver adding db_wrapper to each new database connection"""
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_wrapper)
+
+
+def start_request():
+    """Begin timing a request; returns a token for end_request()"""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to span `name` of the current request, if any"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend that adds top-level template renders to the 'template' span"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def _bucket(total):
+    for index, bound in enumerate(BUCKETS):
+        if total <= bound:
+            return index
+    return len(BUCKETS)
+
+
+class EndpointStats:
+    """
+    Rolling per-endpoint histograms for this process, in one-minute slots.
+
+    Each slot maps endpoint -> [requests, total ms, queries, bucket counts,
+    span totals]. Slots older than window_minutes are dropped. A background
+    thread copies the process's slots into the shared cache every
+    PUBLISH_INTERVAL seconds, so requests never wait on the cache.
+
+    Each worker writes only its own key, one of WORKER_SLOTS numbered keys it
+    claims with cache.add(); the stats page reads them all. A worker that
+    finds another one's snapshot in its key (two claimed it at once) moves
+    to a free key on its next publish.
+    """
+
+    def __init__(self, window_minutes=60, cache_alias='default'):
+        self.window_minutes = window_minutes
+        self.cache_alias = cache_alias
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._slots = {}
+        self._key = None
+        self._thread = None
+
+    @property
+    def worker(self):
+        # Computed each time: a forked worker must not publish under its parent's pid
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _minute(self):
+        return int(time.time() // 60)
+
+    def _ensure_thread(self):
+        # Stats inherited through fork belong to the parent, which publishes them itself
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='server-timing-publisher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(PUBLISH_INTERVAL)
+            self.publish()
+
+    def record(self, endpoint, total, timings):
+        minute = self._minute()
+        with self._lock:
+            self._ensure_thread()
+            slot = self._slots.setdefault(minute, {})
+            entry = slot.get(endpoint)
+            if entry is None:
+                entry = slot[endpoint] = [0, 0.0, 0, [0] * (len(BUCKETS) + 1), dict.fromkeys(SPANS, 0.0)]
+            entry[0] += 1
+            entry[1] += total
+            entry[2] += timings.queries
+            entry[3][_bucket(total)] += 1
+            for name, elapsed in timings.spans.items():
+                entry[4][name] = entry[4].get(name, 0.0) + elapsed
+            if len(self._slots) > self.window_minutes:
+                for old in [key for key in self._slots if key <= minute - self.window_minutes]:
+                    del self._slots[old]
+
+    def snapshot(self):
+        oldest = self._minute() - self.window_minutes
+        with self._lock:
+            return {
+                minute: {endpoint: [entry[0], entry[1], entry[2], list(entry[3]), dict(entry[4])]
+                         for endpoint, entry in slot.items()}
+                for minute, slot in self._slots.items() if minute > oldest
+            }
+
+    def _claim_key(self, cache, value, timeout):
+        """Store value under a free worker key and return that key, or None when all are taken"""
+        for index in range(WORKER_SLOTS):
+            key = f"server_timing:slot:{index}"
+            if cache.add(key, value, timeout):
+                return key
+        return None
+
+    def publish(self):
+        """Share this process's slots through the cache; failures only cost the stats page freshness"""
+        value = {'worker': self.worker, 'slots': self.snapshot()}
+        timeout = self.window_minutes * 60
+        try:
+            cache = caches[self.cache_alias]
+            if self._key is not None:
+                current = cache.get(self._key)
+                if current is not None and current['worker'] != value['worker']:
+                    self._key = None
+            if self._key is None:
+                self._key = self._claim_key(cache, value, timeout)
+                if self._key is None:
+                    logger.warning("All %d server timing worker keys are taken", WORKER_SLOTS)
+            else:
+                cache.set(self._key, value, timeout)
+        except Exception:
+            logger.warning("Could not publish request timings", exc_info=True)
+
+    def collect(self):
+        """Merged stats of every worker that published within the window, per endpoint"""
+        self.publish()
+        cache = caches[self.cache_alias]
+        published = cache.get_many([f"server_timing:slot:{index}" for index in range(WORKER_SLOTS)]).values()
+
+        oldest = self._minute() - self.window_minutes
+        merged = {}
+        for value in published:
+            for minute, slot in value['slots'].items():
+                if minute <= oldest:
+                    continue
+                for endpoint, (requests, total, queries, buckets, spans) in slot.items():
+                    entry = merged.setdefault(endpoint, [0, 0.0, 0, [0] * (len(BUCKETS) + 1), {}])
+                    entry[0] += requests
+                    entry[1] += total
+                    entry[2] += queries
+                    entry[3] = [a + b for a, b in zip(entry[3], buckets)]
+                    for name, elapsed in spans.items():
+                        entry[4][name] = entry[4].get(name, 0.0) + elapsed
+
+        return sorted(
+            (_summarise(endpoint, *entry) for endpoint, entry in merged.items()),
+            key=lambda row: row['total_ms'], reverse=True,
+        )
+
+
+def _bucket_label(index):
+    return f"≤{BUCKETS[index]}" if index < len(BUCKETS) else f">{BUCKETS[-1]}"
+
+
+def _bucket_percentile(buckets, requests, percent):
+    """Label of the histogram bucket holding the percentile, e.g. '≤50'"""
+    threshold = requests * percent / 100
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= threshold:
+            return _bucket_label(index)
+    return _bucket_label(len(BUCKETS))
+
+
+def _summarise(endpoint, requests, total, queries, buckets, spans):
+    peak = max(buckets) or 1
+    return {
+        'endpoint': endpoint,
+        'requests': requests,
+        'total_ms': total,
+        'mean_ms': total / requests,
+        'p50': _bucket_percentile(buckets, requests, 50),
+        'p95': _bucket_percentile(buckets, requests, 95),
+        'p99': _bucket_percentile(buckets, requests, 99),
+        'mean_queries': queries / requests,
+        'spans': {name: spans.get(name, 0.0) / requests for name in SPANS},
+        'histogram': [
+            {'label': _bucket_label(index), 'count': count, 'width': 100 * count // peak}
+            for index, count in enumerate(buckets)
+        ],
+    }
+
+
+def _build_stats():
+    return EndpointStats(
+        window_minutes=getattr(settings, 'SERVER_TIMING_WINDOW_MINUTES', 60),
+        cache_alias=getattr(settings, 'SERVER_TIMING_CACHE_ALIAS', 'default'),
+    )
+
+
+endpoint_stats = SimpleLazyObject(_build_stats)
@@ -1,16 +1,37 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'staff'
 
+# WSGI workers keep the sync verify view; under ASGI it runs on the event loop
+verify_view = views.averify_staff if getattr(settings, 'SERVER_INTERFACE', 'wsgi') == 'asgi' else views.verify_staff
+
 urlpatterns = [
     path('', views.home, name='home'),
     path('staff/', views.staff_list, name='staff_list'),
     path('staff/create/', views.staff_create, name='staff_create'),
+    path('staff/import/', views.staff_import, name='staff_import'),
+    path('staff/expiring/', views.staff_expiring, name='staff_expiring'),
+    path('staff/export/', views.export_staff, name='export_staff'),
+    path('staff/cards/', views.bulk_card_pdf, name='bulk_card_pdf'),
+    path('staff/stickers/', views.bulk_sticker_pdf, name='bulk_sticker_pdf'),
     path('staff/<uuid:uuid>/', views.staff_detail, name='staff_detail'),
     path('staff/<uuid:uuid>/edit/', views.staff_edit, name='staff_edit'),
+    path('staff/<uuid:uuid>/verifications/', views.staff_verifications, name='staff_verifications'),
     path('staff/<uuid:uuid>/qr-sticker/', views.download_qr_sticker, name='download_qr_sticker'),
-    path('verify/<uuid:uuid>/', views.verify_staff, name='verify'),
+    path('staff/<uuid:uuid>/qr.png', views.qr_code_png, name='qr_code_png'),
+    path('staff/<uuid:uuid>/prepare/<str:kind>/', views.prepare_pdf, name='prepare_pdf'),
+    path('jobs/<int:pk>/', views.job_status, name='job_status'),
+    path('stats/timing/', views.timing_stats, name='timing_stats'),
+    path('stats/verifications/', views.verification_dashboard, name='verification_dashboard'),
+    path('verifications/export/', views.export_verifications, name='export_verifications'),
+    path('verify/revocations/', views.revocations, name='revocations'),
+    path('verify/key/', views.signing_key, name='signing_key'),
+    path('verify/batch/', views.verify_staff_batch, name='verify_batch'),
+    path('verify/roster/', views.roster_snapshot, name='roster_snapshot'),
+    path('verify/roster/changes/', views.roster_delta, name='roster_delta'),
+    path('verify/<uuid:uuid>/', verify_view, name='verify'),
     path('print/<uuid:uuid>/', views.print_card, name='print_card'),
     path('staff/<uuid:uuid>/download-pdf/', views.download_card_pdf, name='download_card_pdf'),
 ]
\ No newline at end of file
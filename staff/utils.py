@@ -1,27 +1,72 @@
-import qrcode
+import base64
+import hashlib
+from functools import lru_cache
 from io import BytesIO
 from django.core.files import File
 from django.conf import settings
+from django.utils import timezone
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
+from . import renderers
+from .timing import timed
 
-def generate_qr_code(staff, save_to_file=True):
-    """Generate QR code for staff verification URL"""
+def get_site_url():
+    """Scheme and host that public links such as QR codes point at"""
+    site_domain = settings.SITE_DOMAIN if hasattr(settings, 'SITE_DOMAIN') else settings.ALLOWED_HOSTS[0]
+    protocol = "https" if not settings.DEBUG else "http"
+    return f"{protocol}://{site_domain}"
+
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+
+def get_verification_link(staff):
+    """Absolute verification URL encoded in a staff member's QR code"""
+    link = f"{get_site_url()}{staff.get_verification_url()}"
+    if getattr(settings, 'QR_PAYLOAD_MODE', 'url') == 'signed':
+        # Imported here: spawned workers load this module before django.setup()
+        from .offline import sign_staff_token
+        link = f"{link}?t={sign_staff_token(staff)}"
+    return link
+
+def qr_content_hash(staff):
+    """Fingerprint of what a staff QR code encodes, stored as Staff.qr_hash to spot stale codes"""
+    raw = f"{get_verification_link(staff)}|{QR_BOX_SIZE}|{QR_BORDER}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def make_qr(data):
+    qrcode = renderers.qrcode()
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        box_size=QR_BOX_SIZE,
+        border=QR_BORDER,
     )
-    
-    # Full URL for QR code
-    site_domain = settings.SITE_DOMAIN if hasattr(settings, 'SITE_DOMAIN') else settings.ALLOWED_HOSTS[0]
-    protocol = "https" if not settings.DEBUG else "http"
-    verification_url = f"{protocol}://{site_domain}{staff.get_verification_url()}"
-    
-    qr.add_data(verification_url)
+    qr.add_data(data)
     qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
+    return qr
+
+@lru_cache(maxsize=2048)
+def qr_image_bytes(data, kind='png'):
+    """Render data as PNG or compact single-path SVG bytes, memoised per process"""
+    with timed('qr'):
+        qr = make_qr(data)
+        if kind == 'svg':
+            return qr.make_image(image_factory=renderers.qrcode().image.svg.SvgPathImage).to_string()
+        buffer = BytesIO()
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+        return buffer.getvalue()
+
+def qr_data_uri(staff, kind='png'):
+    """QR code as a data: URI that templates and PDFs can embed without touching MEDIA_ROOT"""
+    mime = 'image/svg+xml' if kind == 'svg' else 'image/png'
+    encoded = base64.b64encode(qr_image_bytes(get_verification_link(staff), kind)).decode('ascii')
+    return f"data:{mime};base64,{encoded}"
+
+def generate_qr_code(staff, save_to_file=True):
+    """Generate QR code for staff verification URL"""
+    with timed('qr'):
+        img = make_qr(get_verification_link(staff)).make_image(fill_color="black", back_color="white")
     
     if save_to_file:
         # Save to media directory
@@ -37,6 +82,62 @@ def generate_qr_code(staff, save_to_file=True):
         buffer.seek(0)
         return buffer
 
+def init_django_worker():
+    """Set up Django in a freshly spawned worker process"""
+    import django
+    django.setup()
+
+def bulk_workers(workers=None):
+    """Process count for bulk rendering: explicit, else BULK_PDF_WORKERS, else one per CPU"""
+    return workers or getattr(settings, 'BULK_PDF_WORKERS', None) or os.cpu_count() or 1
+
+def process_map(func, items, workers=None, chunksize=64):
+    """Map a module-level function over items in a spawn process pool (in-process for one worker)"""
+    items = list(items)
+    workers = min(bulk_workers(workers), len(items))
+    
+    if workers <= 1:
+        return [func(item) for item in items]
+    
+    # Spawned workers never share the parent's database connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=init_django_worker) as executor:
+        return list(executor.map(func, items, chunksize=chunksize))
+
+def generate_qr_codes(staff_members, workers=None):
+    """Generate QR code files for many staff members across a process pool; returns {pk: path}"""
+    staff_members = list(staff_members)
+    paths = process_map(generate_qr_code, staff_members, workers)
+    return {staff.pk: path for staff, path in zip(staff_members, paths)}
+
+def regenerate_qr_codes(staff_members, workers=None, force=False):
+    """
+    Redraw missing or stale QR code files and store their paths and hashes.
+
+    A code is stale when its stored qr_hash no longer matches what it should
+    encode, e.g. after SITE_DOMAIN changes. updated_at is bumped with the
+    code so ETags and roster cursors see the change. Returns the staff
+    members that were updated.
+    """
+    from .models import Staff
+
+    stale = []
+    for staff in staff_members:
+        qr_hash = qr_content_hash(staff)
+        if force or not staff.qr_code or staff.qr_hash != qr_hash:
+            staff.qr_hash = qr_hash
+            stale.append(staff)
+
+    if stale:
+        paths = generate_qr_codes(stale, workers)
+        now = timezone.now()
+        for staff in stale:
+            staff.qr_code = paths[staff.pk]
+            staff.updated_at = now
+        Staff.objects.bulk_update(stale, ['qr_code', 'qr_hash', 'updated_at'], batch_size=1000)
+    return stale
+
 def get_client_ip(request):
     """Get client IP address from request"""
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -0,0 +1,114 @@
+"""
+Batch verification for turnstiles and gate kiosks.
+
+A kiosk posts its queued scans as a list of staff UUIDs (what the QR codes
+carry) or staff IDs (typed or read off a badge). They are resolved with
+one query and logged with one bulk write, and each comes back as a small
+status record instead of the verify page's HTML.
+
+Kiosks authenticate with an "Authorization: Bearer <key>" header, each key
+in VERIFY_KIOSK_KEYS standing for the user its scans are logged under.
+"""
+import hmac
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.utils import timezone
+
+from .log_writer import log_verifications
+from .models import Staff
+
+RECORD_FIELDS = ['id', 'uuid', 'staff_id', 'first_name', 'last_name', 'department', 'status', 'date_expiry']
+
+
+class InvalidKioskKey(Exception):
+    pass
+
+
+@lru_cache(maxsize=4)
+def _kiosk_keys(entries):
+    keys = []
+    for entry in entries:
+        username, _, key = entry.partition('=')
+        if not username.strip() or not key.strip():
+            raise ImproperlyConfigured(f"VERIFY_KIOSK_KEYS entries must be username=key, not {entry!r}")
+        keys.append((key.strip().encode(), username.strip()))
+    return keys
+
+
+def kiosk_user(request):
+    """
+    The user whose VERIFY_KIOSK_KEYS key the request's bearer token is, or
+    None when it sends no token. Raises InvalidKioskKey for any other key.
+    """
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    token = token.strip().encode()
+    # Every key is compared, in constant time, so timing does not tell which one was close
+    matches = [username for key, username in _kiosk_keys(tuple(getattr(settings, 'VERIFY_KIOSK_KEYS', ())))
+               if hmac.compare_digest(key, token)]
+    if not matches:
+        raise InvalidKioskKey
+    try:
+        return get_user_model().objects.get(username=matches[0], is_active=True)
+    except get_user_model().DoesNotExist:
+        raise InvalidKioskKey
+
+
+def _parse(identifier):
+    """('uuid', UUID) for a UUID string, otherwise ('staff_id', stripped text)"""
+    try:
+        return 'uuid', uuid.UUID(identifier)
+    except ValueError:
+        return 'staff_id', identifier.strip()
+
+
+def status_record(staff, today):
+    expired = staff.date_expiry is not None and today > staff.date_expiry
+    return {
+        'found': True,
+        'uuid': str(staff.uuid),
+        'staff_id': staff.staff_id,
+        'name': staff.get_full_name(),
+        'department': staff.get_department_display(),
+        'status': staff.status,
+        'valid': staff.status == 'active' and not expired,
+        'expires': staff.date_expiry.isoformat() if staff.date_expiry else None,
+    }
+
+
+def verify_batch(request, identifiers, user=None):
+    """
+    Status records for identifiers, in order, logging a verification by
+    `user` for every one that resolves. Staff IDs are sequential and
+    guessable, so they are only looked up for an authenticated user;
+    otherwise they come back as not found.
+    """
+    parsed = [_parse(identifier) for identifier in identifiers]
+    uuids = {value for kind, value in parsed if kind == 'uuid'}
+    allow_staff_ids = user is not None and user.is_authenticated
+    staff_ids = {value for kind, value in parsed if kind == 'staff_id'} if allow_staff_ids else set()
+
+    by_uuid, by_staff_id = {}, {}
+    if uuids or staff_ids:
+        matches = Staff.objects.filter(Q(uuid__in=uuids) | Q(staff_id__in=staff_ids)).order_by()
+        for staff in matches.only(*RECORD_FIELDS):
+            by_uuid[staff.uuid] = by_staff_id[staff.staff_id] = staff
+
+    today = timezone.now().date()
+    results, verified = [], []
+    for identifier, (kind, value) in zip(identifiers, parsed):
+        staff = by_uuid.get(value) if kind == 'uuid' else by_staff_id.get(value)
+        if staff is None:
+            results.append({'id': identifier, 'found': False})
+            continue
+        results.append({'id': identifier, **status_record(staff, today)})
+        verified.append(staff.pk)
+
+    log_verifications(request, verified, user)
+    return results
@@ -0,0 +1,173 @@
+from datetime import datetime, time, timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.http import Http404
+from django.utils import timezone
+
+
+class VerificationRecord:
+    """
+    Compact, cacheable snapshot of a Staff row holding only what the
+    verify page shows. Expiry is still evaluated on every read, so a
+    cached record turns invalid at midnight without a database query.
+    """
+
+    FIELDS = [
+        'id', 'uuid', 'staff_id', 'first_name', 'last_name', 'email', 'phone',
+        'department', 'department_display', 'position', 'status', 'status_display',
+        'date_joined', 'date_expiry', 'photo_url',
+    ]
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_staff(cls, staff):
+        return cls(
+            id=staff.pk,
+            uuid=staff.uuid,
+            staff_id=staff.staff_id,
+            first_name=staff.first_name,
+            last_name=staff.last_name,
+            email=staff.email,
+            phone=staff.phone,
+            department=staff.department,
+            department_display=staff.get_department_display(),
+            position=staff.position,
+            status=staff.status,
+            status_display=staff.get_status_display(),
+            date_joined=staff.date_joined,
+            date_expiry=staff.date_expiry,
+            photo_url=staff.photo_verify_url,
+        )
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def get_full_name(self):
+        return f"{self.first_name} {self.last_name}"
+
+    def get_department_display(self):
+        return self.department_display
+
+    def get_status_display(self):
+        return self.status_display
+
+    def is_expired(self):
+        if self.date_expiry:
+            return timezone.now().date() > self.date_expiry
+        return False
+
+    def is_valid(self):
+        return self.status == 'active' and not self.is_expired()
+
+
+def _cache():
+    return caches[getattr(settings, 'VERIFY_CACHE_ALIAS', 'default')]
+
+
+def _cache_key(uuid):
+    return f'staff:verify:{uuid}'
+
+
+GENERATION_KEY = 'staff:verify:generation'
+
+
+def _generations():
+    return caches[getattr(settings, 'VERIFY_GENERATION_CACHE_ALIAS', 'default')]
+
+
+def _generation():
+    """
+    Token shared by all workers that every cached record must carry to be
+    used; an invalidation in any worker replaces it, so records cached in
+    other workers' memory stop matching straight away.
+    """
+    generations = _generations()
+    generation = generations.get(GENERATION_KEY)
+    if generation is None:
+        # First use, or the key was lost: a new token retires every cached record
+        generations.add(GENERATION_KEY, uuid4().hex, None)
+        generation = generations.get(GENERATION_KEY)
+    return generation
+
+
+async def _ageneration():
+    generations = _generations()
+    generation = await generations.aget(GENERATION_KEY)
+    if generation is None:
+        await generations.aadd(GENERATION_KEY, uuid4().hex, None)
+        generation = await generations.aget(GENERATION_KEY)
+    return generation
+
+
+def _bump_generation():
+    _generations().set(GENERATION_KEY, uuid4().hex, None)
+
+
+def _timeout():
+    """Configured TTL, cut short at the next local midnight when expiry dates roll over"""
+    ttl = getattr(settings, 'VERIFY_CACHE_TTL', 300)
+    now = timezone.localtime()
+    midnight = timezone.make_aware(datetime.combine(now.date() + timedelta(days=1), time.min))
+    return max(1, min(ttl, int((midnight - now).total_seconds())))
+
+
+def get_verification_record(uuid):
+    """Return the VerificationRecord for a uuid, reading through the cache; raise Http404 if unknown"""
+    from .models import Staff
+
+    cache = _cache()
+    key = _cache_key(uuid)
+    generation = _generation()
+    cached = cache.get(key)
+    if cached is not None and cached.get('generation') == generation:
+        return VerificationRecord(**cached)
+
+    try:
+        staff = Staff.objects.get(uuid=uuid)
+    except Staff.DoesNotExist:
+        raise Http404("No Staff matches the given query.")
+
+    record = VerificationRecord.from_staff(staff)
+    cache.set(key, {**record.to_dict(), 'generation': generation}, _timeout())
+    return record
+
+
+async def aget_verification_record(uuid):
+    """get_verification_record() for async views, using the async cache and ORM APIs"""
+    from .models import Staff
+
+    cache = _cache()
+    key = _cache_key(uuid)
+    generation = await _ageneration()
+    cached = await cache.aget(key)
+    if cached is not None and cached.get('generation') == generation:
+        return VerificationRecord(**cached)
+
+    try:
+        staff = await Staff.objects.aget(uuid=uuid)
+    except Staff.DoesNotExist:
+        raise Http404("No Staff matches the given query.")
+
+    record = VerificationRecord.from_staff(staff)
+    await cache.aset(key, {**record.to_dict(), 'generation': generation}, _timeout())
+    return record
+
+
+def invalidate_verification(uuid):
+    invalidate_verifications([uuid])
+
+
+def invalidate_verifications(uuids):
+    """Drop the records here and retire the ones other workers hold"""
+    _cache().delete_many([_cache_key(uuid) for uuid in uuids])
+    _bump_generation()
+    # A worker reading the row before this transaction commits would cache the
+    # old values under the new token, so replace it again once committed
+    if connection.in_atomic_block:
+        transaction.on_commit(_bump_generation)
@@ -1,20 +1,41 @@
+import json
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.views.decorators.http import require_http_methods
-from django.views.decorators.cache import never_cache
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db import models
-from django.http import HttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.http import Http404, HttpResponse, FileResponse, JsonResponse, StreamingHttpResponse
 from django.template.loader import render_to_string
-from xhtml2pdf import pisa
-from .models import Staff, VerificationLog
-from .utils import get_client_ip
-from .forms import StaffForm
-from django.template.loader import get_template
-from io import BytesIO
-from xhtml2pdf import pisa 
+from .models import Job, Staff, VerificationLog
+from .utils import get_client_ip, get_verification_link, qr_image_bytes
+from .forms import StaffForm, StaffUploadForm
+from .importer import StaffImportError, import_staff
+from .export import STAFF_COLUMNS, VERIFICATION_COLUMNS, build_xlsx, filter_verifications, stream_csv
+from .verify_cache import aget_verification_record, get_verification_record
+from .log_writer import alog_verification, log_verification, log_writer
+from .offline import public_key_b64, revocation_list
+from .search import search_staff
+from .pagination import KeysetPaginator
+from .pdf import (
+    render_pdf_bytes, cached_card_pdf, cached_sticker_pdf, stream_cards_zip, merge_cards_pdf, card_sheets,
+    sticker_sheets, card_cache_key, pdf_ready, STICKER_TEMPLATE,
+)
+from .timing import SPANS, endpoint_stats
+from .expiry import expiring_staff
+from .verify_batch import InvalidKioskKey, kiosk_user, verify_batch
+from .jobs import enqueue, jobs_enabled
+from .roster import InvalidCursor, build_snapshot, roster_changes
+from .analytics import WINDOWS, dashboard, refresh_if_stale
+from .conditional import not_modified, set_validators, staff_conditional, staff_validators
 from django.conf import settings
+from django.utils import timezone
 
 @login_required
 @require_http_methods(["GET"])
@@ -22,23 +43,16 @@ def home(request):
     """Landing page"""
     return render(request, 'staff/home.html')
 
-@login_required
-@require_http_methods(["GET"])
-def staff_list(request):
-    """List all staff with search"""
-    query = request.GET.get('q', '')
-    department = request.GET.get('department', '')
-    status = request.GET.get('status', '')
+def filter_staff(params):
+    """Apply the staff_list search and filter parameters to the Staff table"""
+    query = params.get('q', '')
+    department = params.get('department', '')
+    status = params.get('status', '')
     
     staff_queryset = Staff.objects.all()
     
     if query:
-        staff_queryset = staff_queryset.filter(
-            models.Q(staff_id__icontains=query) |
-            models.Q(first_name__icontains=query) |
-            models.Q(last_name__icontains=query) |
-            models.Q(email__icontains=query)
-        )
+        staff_queryset = search_staff(staff_queryset, query)
     
     if department:
         staff_queryset = staff_queryset.filter(department=department)
@@ -46,12 +60,30 @@ def staff_list(request):
     if status:
         staff_queryset = staff_queryset.filter(status=status)
     
-    paginator = Paginator(staff_queryset, 20)
-    page_number = request.GET.get('page')
-    staff_page = paginator.get_page(page_number)
+    return staff_queryset
+
+@login_required
+@require_http_methods(["GET"])
+def staff_list(request):
+    """List all staff with search"""
+    query = request.GET.get('q', '')
+    department = request.GET.get('department', '')
+    status = request.GET.get('status', '')
+    
+    staff_queryset = filter_staff(request.GET)
+    
+    # Ranked search results keep page numbers; browsing seeks on (created_at, id)
+    keyset = not query
+    if keyset:
+        staff_page = KeysetPaginator(staff_queryset, 20).page(request.GET.get('cursor'))
+    else:
+        paginator = Paginator(staff_queryset, 20)
+        page_number = request.GET.get('page')
+        staff_page = paginator.get_page(page_number)
     
     context = {
         'staff_list': staff_page,
+        'keyset': keyset,
         'query': query,
         'department': department,
         'status': status,
@@ -59,6 +91,8 @@ def staff_list(request):
         'statuses': Staff.STATUS_CHOICES,
     }
     
+    if request.htmx and keyset:
+        return render(request, 'staff/staff_cards.html', context)
     return render(request, 'staff/staff_list.html', context)
 
 @login_required
@@ -76,6 +110,31 @@ def staff_create(request):
     
     return render(request, 'staff/staff_form.html', {'form': form, 'action': 'Create'})
 
+@login_required
+@require_http_methods(["GET", "POST"])
+def staff_import(request):
+    """Create or update staff in bulk from an uploaded HR export"""
+    result = None
+    if request.method == 'POST':
+        form = StaffUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                result = import_staff(upload, upload.name)
+            except StaffImportError as exc:
+                form.add_error('file', str(exc))
+            else:
+                form = StaffUploadForm()
+    else:
+        form = StaffUploadForm()
+
+    context = {
+        'form': form,
+        'result': result,
+        'errors': result.errors[:50] if result else [],
+    }
+    return render(request, 'staff/staff_import.html', context)
+
 @login_required
 @require_http_methods(["GET", "POST"])
 def staff_edit(request, uuid):
@@ -95,50 +154,177 @@ def staff_edit(request, uuid):
 
 @login_required
 @require_http_methods(["GET"])
+def staff_expiring(request):
+    """Active staff whose cards expire within ?days= days, soonest first"""
+    try:
+        days = max(int(request.GET.get('days', '')), 0)
+    except ValueError:
+        days = getattr(settings, 'EXPIRY_WARNING_DAYS', 30)
+
+    paginator = Paginator(expiring_staff(days), 50)
+    context = {
+        'staff_list': paginator.get_page(request.GET.get('page')),
+        'days': days,
+    }
+    return render(request, 'staff/staff_expiring.html', context)
+
+def qr_embed_mode(request):
+    # Pages and PDFs embedding the QR code differ between QR_CODE_EMBED modes
+    return getattr(settings, 'QR_CODE_EMBED', 'file')
+
+def card_variant(request):
+    return card_cache_key()
+
+@login_required
+@require_http_methods(["GET"])
+@cache_control(private=True, no_cache=True)
+@ensure_csrf_cookie
 def staff_detail(request, uuid):
-    """View staff details"""
+    """View staff details (verification history loads separately, so the page revalidates on updated_at)"""
     staff = get_object_or_404(Staff, uuid=uuid)
-    recent_verifications = staff.verification_logs.all()[:10]
-        # Log verification attempt
-    verification_log = VerificationLog.objects.create(
-        staff=staff,
-        verified_by=request.user if request.user.is_authenticated else None,
-        ip_address=get_client_ip(request),
-        user_agent=request.META.get('HTTP_USER_AGENT', '')[:500]
-    )
+    # Log verification attempt, also when the browser's copy is still current
+    verification_log = log_verification(request, staff.pk)
+
+    variant = ('staff_detail', request.user.pk, qr_embed_mode(request))
+    response = not_modified(request, staff, *variant)
+    if response is not None:
+        return response
 
     context = {
         'staff': staff,
-        'recent_verifications': recent_verifications,
         'verification_log': verification_log,
+        'background_jobs': jobs_enabled(),
 
     }
     
-    return render(request, 'staff/staff_detail.html', context)
+    response = render(request, 'staff/staff_detail.html', context)
+    return set_validators(response, *staff_validators(staff, *variant))
+
+def verification_history(staff):
+    return KeysetPaginator(staff.verification_logs.select_related('verified_by'), 10, keys=('verified_at', 'id'))
+
+@login_required
+@require_http_methods(["GET"])
+@never_cache
+def staff_verifications(request, uuid):
+    """A page of a staff member's verification history (the first when there is no cursor)"""
+    staff = get_object_or_404(Staff, uuid=uuid)
+    context = {
+        'staff': staff,
+        'recent_verifications': verification_history(staff).page(request.GET.get('cursor')),
+    }
+    return render(request, 'staff/verification_rows.html', context)
 
 @never_cache
 @require_http_methods(["GET"])
 def verify_staff(request, uuid):
     """Verify staff by UUID from QR code"""
-    staff = get_object_or_404(Staff, uuid=uuid)
+    staff = get_verification_record(uuid)
     
     # Log verification attempt
-    verification_log = VerificationLog.objects.create(
-        staff=staff,
-        verified_by=request.user if request.user.is_authenticated else None,
-        ip_address=get_client_ip(request),
-        user_agent=request.META.get('HTTP_USER_AGENT', '')[:500]
-    )
+    verification_log = log_verification(request, staff.id)
     
     context = {
         'staff': staff,
-        'is_valid': staff.status == 'active' and not staff.is_expired(),
+        'is_valid': staff.is_valid(),
         'verification_log': verification_log,
     }
     
     return render(request, 'staff/verify.html', context)
 
+@never_cache
+@require_http_methods(["GET"])
+async def averify_staff(request, uuid):
+    """
+    verify_staff() for ASGI deployments (see SERVER_INTERFACE): a gate scan
+    burst waits on the event loop, not worker threads
+    """
+    staff = await aget_verification_record(uuid)
+    verification_log = await alog_verification(request, staff.id)
+    context = {
+        'staff': staff,
+        'is_valid': staff.is_valid(),
+        'verification_log': verification_log,
+    }
+    return render(request, 'staff/verify.html', context)
+
+def csrf_rejection(request):
+    """The response CsrfViewMiddleware rejects the request with, or None, for csrf_exempt views that check some requests"""
+    return CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {})
+
+@csrf_exempt
+@never_cache
+@require_http_methods(["POST"])
+def verify_staff_batch(request):
+    """
+    JSON batch verification for gate kiosks. POST {"ids": [...]} with staff
+    UUIDs (or staff IDs, when authenticated); returns {"results": [...]}
+    in the same order. Kiosks authenticate with a VERIFY_KIOSK_KEYS bearer
+    token and send no CSRF token; a logged-in browser session needs one.
+    """
+    try:
+        user = kiosk_user(request)
+    except InvalidKioskKey:
+        return JsonResponse({'error': 'Unknown kiosk key'}, status=401)
+    if user is None and request.user.is_authenticated:
+        rejection = csrf_rejection(request)
+        if rejection is not None:
+            return rejection
+        user = request.user
+
+    try:
+        identifiers = json.loads(request.body)['ids']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with an "ids" list'}, status=400)
+    if not isinstance(identifiers, list) or not all(isinstance(identifier, str) for identifier in identifiers):
+        return JsonResponse({'error': '"ids" must be a list of strings'}, status=400)
+    limit = getattr(settings, 'VERIFY_BATCH_MAX_IDS', 500)
+    if len(identifiers) > limit:
+        return JsonResponse({'error': f'At most {limit} ids per request'}, status=400)
+
+    results = verify_batch(request, identifiers, user)
+    return JsonResponse({'results': results})
+
+@login_required
+@never_cache
+@require_http_methods(["GET"])
+def roster_snapshot(request):
+    """Active roster as a SQLite file for offline kiosks; its meta table holds the cursor for roster_delta"""
+    response = HttpResponse(build_snapshot(), content_type='application/vnd.sqlite3')
+    response['Content-Disposition'] = 'attachment; filename="roster.sqlite3"'
+    return response
+
+@login_required
+@never_cache
+@require_http_methods(["GET"])
+def roster_delta(request):
+    """Roster changes since ?since=<cursor>; keep calling with the returned cursor while has_more"""
+    try:
+        return JsonResponse(roster_changes(request.GET.get('since', '')))
+    except InvalidCursor as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+@cache_control(public=True, max_age=60)
 @require_http_methods(["GET"])
+def revocations(request):
+    """Revocation list for offline scanners; pass back the returned version as ?since="""
+    try:
+        since = max(int(request.GET.get('since', 0)), 0)
+    except ValueError:
+        since = 0
+    return JsonResponse(revocation_list(since))
+
+@cache_control(public=True, max_age=3600)
+@require_http_methods(["GET"])
+def signing_key(request):
+    """Public key that offline scanners check QR tokens against"""
+    if not getattr(settings, 'QR_SIGNING_KEY', ''):
+        raise Http404("Offline verification is not configured")
+    return JsonResponse({'algorithm': 'Ed25519', 'public_key': public_key_b64()})
+
+@require_http_methods(["GET"])
+@cache_control(public=True, no_cache=True)
+@staff_conditional('print_card', qr_embed_mode)
 def print_card(request, uuid):
     """Generate printable ID card with QR code"""
     staff = get_object_or_404(Staff, uuid=uuid)
@@ -151,52 +337,224 @@ def print_card(request, uuid):
 
 @login_required
 @require_http_methods(["GET"])
+@cache_control(private=True, no_cache=True)
+@staff_conditional(STICKER_TEMPLATE, qr_embed_mode)
 def download_qr_sticker(request, uuid):
     """Download QR code sticker as PDF"""
     staff = get_object_or_404(Staff, uuid=uuid)
     
-    html = render_to_string('staff/qr_sticker_pdf.html', {
-        'staff': staff,
-        'request': request,
-    })
+    pdf_file = cached_sticker_pdf(staff)
     
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="qr_sticker_{staff.staff_id}.pdf"'
-    
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    
-    if pisa_status.err:
+    if pdf_file is None:
         return HttpResponse('PDF generation error', status=500)
     
+    response = FileResponse(pdf_file, content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="qr_sticker_{staff.staff_id}.pdf"'
+    return response
+
+@require_http_methods(["GET"])
+@cache_control(public=True, no_cache=True)
+@staff_conditional('qr_png')
+def qr_code_png(request, uuid):
+    """QR code image for print stations and badge software, rendered in memory"""
+    staff = get_object_or_404(Staff, uuid=uuid)
+    response = HttpResponse(qr_image_bytes(get_verification_link(staff)), content_type='image/png')
+    response['Content-Disposition'] = f'inline; filename="qr_{staff.staff_id}.png"'
     return response
 
 
+# Job kind -> (download view, label) for "generate, then fetch when ready" PDFs
+PDF_JOBS = {
+    'card_pdf': ('staff:download_card_pdf', 'ID Card'),
+    'sticker_pdf': ('staff:download_qr_sticker', 'QR Sticker'),
+}
+
+@login_required
+@require_http_methods(["POST"])
+def prepare_pdf(request, uuid, kind):
+    """Queue a card or sticker PDF for the run_jobs worker and return its status (ready at once if cached)"""
+    if kind not in PDF_JOBS:
+        raise Http404("Unknown PDF")
+    staff = get_object_or_404(Staff, uuid=uuid)
+    job = None if pdf_ready(staff, kind) else enqueue(kind, staff)
+    return job_status_response(request, staff, kind, job)
+
+@login_required
+@never_cache
+@require_http_methods(["GET"])
+def job_status(request, pk):
+    """Status of a background PDF job: an HTMX fragment that keeps polling until it is done, or JSON"""
+    job = get_object_or_404(Job.objects.select_related('staff'), pk=pk)
+    if job.kind not in PDF_JOBS:
+        raise Http404("Not a PDF job")
+    if job.status == 'done' and job.started_at < job.staff.updated_at and not pdf_ready(job.staff, job.kind):
+        # The staff member changed after this render began, so poll a fresh one instead
+        job = enqueue(job.kind, job.staff)
+    return job_status_response(request, job.staff, job.kind, job)
+
+def job_status_response(request, staff, kind, job):
+    status = job.status if job else 'done'
+    download_view, label = PDF_JOBS[kind]
+    download_url = reverse(download_view, args=[staff.uuid]) if status == 'done' else None
+    if request.htmx:
+        context = {'staff': staff, 'kind': kind, 'label': label, 'job': job, 'status': status,
+                   'download_url': download_url}
+        return render(request, 'staff/job_status.html', context)
+    return JsonResponse({
+        'job': job.pk if job else None,
+        'kind': kind,
+        'status': status,
+        'attempts': job.attempts if job else 0,
+        'error': job.last_error if job and status == 'failed' else '',
+        'download_url': download_url,
+    })
+
 def render_to_pdf(template_src, context_dict={}):
     """Converts HTML template to PDF object."""
-    template = get_template(template_src)
-    html  = template.render(context_dict)
-    result = BytesIO()
-    
-    pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result)
+    pdf = render_pdf_bytes(template_src, context_dict)
     
-    if not pdf.err:
-        return HttpResponse(result.getvalue(), content_type='application/pdf')
+    if pdf is not None:
+        return HttpResponse(pdf, content_type='application/pdf')
     return None
 
+@cache_control(public=True, no_cache=True)
+@staff_conditional(card_variant)
 def download_card_pdf(request, uuid):
     """Generates the ID card PDF (Front and Back) and forces a download."""
     staff = get_object_or_404(Staff, uuid=uuid)
     
-    context = {
-        'staff': staff,
-        'settings': settings, 
-    }
-    
-    pdf_content = render_to_pdf('staff/card_pdf_output.html', context)
+    pdf_file = cached_card_pdf(staff)
     
-    if pdf_content:
-        response = pdf_content
+    if pdf_file is not None:
+        response = FileResponse(pdf_file, content_type='application/pdf')
         response['Content-Disposition'] = f'inline; filename="ID_Card_{staff.staff_id}.pdf"'
         return response
     
-    return HttpResponse("Error generating PDF.", status=500)
\ No newline at end of file
+    return HttpResponse("Error generating PDF.", status=500)
+
+@login_required
+@require_http_methods(["GET"])
+def bulk_card_pdf(request):
+    """Download ID cards for every staff member matching the staff_list filters"""
+    staff_queryset = filter_staff(request.GET)
+    
+    if request.GET.get('format') == 'zip':
+        response = StreamingHttpResponse(streaming_body(stream_cards_zip(staff_queryset)), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="ID_Cards.zip"'
+        return response
+    
+    if request.GET.get('format') == 'sheets':
+        try:
+            sheets = card_sheets(staff_queryset, **sheet_options(request.GET))
+        except ValueError as exc:
+            return HttpResponse(str(exc), status=400)
+        response = StreamingHttpResponse(streaming_body(sheets), content_type='application/pdf')
+        response['Content-Disposition'] = 'attachment; filename="ID_Card_Sheets.pdf"'
+        return response
+    
+    return FileResponse(merge_cards_pdf(staff_queryset), as_attachment=True,
+                        filename='ID_Cards.pdf', content_type='application/pdf')
+
+@login_required
+@require_http_methods(["GET"])
+def bulk_sticker_pdf(request):
+    """Download QR stickers for the staff_list filters, tiled on print sheets"""
+    staff_queryset = filter_staff(request.GET)
+    try:
+        sheets = sticker_sheets(staff_queryset, **sheet_options(request.GET))
+    except ValueError as exc:
+        return HttpResponse(str(exc), status=400)
+    response = StreamingHttpResponse(streaming_body(sheets), content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename="QR_Sticker_Sheets.pdf"'
+    return response
+
+def streaming_body(chunks):
+    """
+    The body for a StreamingHttpResponse of generated chunks. Under ASGI
+    Django reads a sync iterator to the end before sending anything, so
+    there each chunk is generated in a thread by an async iterator instead.
+    """
+    if getattr(settings, 'SERVER_INTERFACE', 'wsgi') != 'asgi':
+        return chunks
+    return _astream(iter(chunks))
+
+async def _astream(chunks):
+    # One thread for the whole body: the generators hold database cursors
+    pull = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    try:
+        while (chunk := await pull(chunks, done)) is not done:
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            await sync_to_async(chunks.close, thread_sensitive=True)()
+
+def sheet_options(params):
+    """paper, columns and rows for a print sheet from the query string; bad values fall back to defaults"""
+    # Only the sheet routes need the imposition engine (and pypdf), so it is loaded here
+    from .imposition import PAPER_SIZES
+    paper = params.get('paper', '').upper()
+    options = {'paper': paper if paper in PAPER_SIZES else None}
+    for name in ('columns', 'rows'):
+        value = params.get(name, '')
+        options[name] = int(value) if value.isdigit() and int(value) > 0 else None
+    return options
+
+def export_response(request, queryset, columns, name):
+    """Stream queryset as CSV, or as XLSX when ?format=xlsx"""
+    filename = f"{name}_{timezone.localdate():%Y%m%d}"
+    if request.GET.get('format') == 'xlsx':
+        return FileResponse(
+            build_xlsx(queryset, columns, name), as_attachment=True, filename=f'{filename}.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    response = StreamingHttpResponse(streaming_body(stream_csv(queryset, columns)), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+@login_required
+@require_http_methods(["GET"])
+def export_staff(request):
+    """Export the staff matching the staff_list filters"""
+    return export_response(request, filter_staff(request.GET), STAFF_COLUMNS, 'staff')
+
+@login_required
+@require_http_methods(["GET"])
+def export_verifications(request):
+    """Export verification logs, optionally for the staff_list filters and a date range"""
+    staff_filtered = any(request.GET.get(param) for param in ('q', 'department', 'status'))
+    logs = filter_verifications(request.GET, filter_staff(request.GET) if staff_filtered else None)
+    return export_response(request, logs, VERIFICATION_COLUMNS, 'verifications')
+
+@login_required
+@require_http_methods(["GET"])
+def verification_dashboard(request):
+    """Scans per hour, department and gate, top staff and unusual-volume alerts, read from the aggregate tables"""
+    days = request.GET.get('days', '7')
+    days = int(days) if days.isdigit() and int(days) in WINDOWS else 7
+    department = request.GET.get('department', '')
+    if department not in dict(Staff.DEPARTMENT_CHOICES):
+        department = ''
+
+    # Adds at most a day of new log rows; the page itself only reads aggregates
+    refresh_if_stale()
+    context = dashboard(days, department or None)
+    context.update({
+        'windows': WINDOWS,
+        'department': department,
+        'departments': Staff.DEPARTMENT_CHOICES,
+    })
+    return render(request, 'staff/verification_dashboard.html', context)
+
+@staff_member_required
+@require_http_methods(["GET"])
+def timing_stats(request):
+    """Rolling per-endpoint latency histograms and span breakdowns from every worker, plus this worker's log writer"""
+    context = {
+        'endpoints': endpoint_stats.collect(),
+        'spans': SPANS,
+        'window_minutes': endpoint_stats.window_minutes,
+        'log_buffered': getattr(settings, 'VERIFICATION_LOG_BUFFERED', True),
+        'log_writer': log_writer.stats(),
+    }
+    return render(request, 'staff/timing_stats.html', context)
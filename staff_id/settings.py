@@ -1,5 +1,5 @@
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import os
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -13,33 +13,39 @@ ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost').split(',')
 
 INSTALLED_APPS = [
     'staff.apps.StaffConfig',
+    'benchmarks.apps.BenchmarksConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_htmx'
 ]
 
 SITE_DOMAIN = config('SITE_DOMAIN', default='localhost:8000')
 
 MIDDLEWARE = [
+    'staff.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise, async-capable so ASGI deployments keep async views on the event loop
+    'staff.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'django_htmx.middleware.HtmxMiddleware',
 ]
 
 ROOT_URLCONF = 'staff_id.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to ServerTimingMiddleware
+        'BACKEND': 'staff.timing.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -56,6 +62,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'staff_id.wsgi.application'
 
+# 'asgi' when served through staff_id/asgi.py, which sets it: the verify page
+# then uses its async view and streamed downloads use async iterators
+SERVER_INTERFACE = config('SERVER_INTERFACE', default='wsgi')
+
 
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
@@ -129,3 +139,148 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Custom settings
 HOSPITAL_NAME = config('HOSPITAL_NAME', default='National Orthopaedic Hospital, Dala')
+
+# Process pool size for bulk ID card PDFs, and for the other bulk jobs (QR codes,
+# photo renditions, imports) that share the pool (0 = one per CPU)
+BULK_PDF_WORKERS = config('BULK_PDF_WORKERS', default=0, cast=int)
+
+# Rendered card/sticker PDF cache (bump PDF_TEMPLATE_VERSION when the card templates change;
+# it also feeds the ETags of the card, sticker, QR and staff detail responses)
+PDF_CACHE_DIR = config('PDF_CACHE_DIR', default=str(BASE_DIR / 'pdf_cache'))
+PDF_CACHE_MAX_SIZE = config('PDF_CACHE_MAX_SIZE', default=512 * 1024 * 1024, cast=int)
+PDF_TEMPLATE_VERSION = config('PDF_TEMPLATE_VERSION', default='1')
+
+# Verification record cache. The default keeps records in each worker's memory,
+# where culling is cheap. Each record carries a generation token kept in the
+# shared 'verification_generation' cache and any save replaces it, so other
+# workers drop their copies on the next read; VERIFY_CACHE_TTL only bounds how
+# long a record lives. On several hosts point VERIFY_GENERATION_CACHE_BACKEND
+# (and VERIFY_CACHE_BACKEND, to share the records too) at
+# django.core.cache.backends.redis.RedisCache with the LOCATION set to its URL.
+# The 'timing' and 'verification_generation' caches only hold a few keys, so
+# the file backend's cull (a listing of the directory on every set) stays cheap.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'verification': {
+        'BACKEND': config('VERIFY_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('VERIFY_CACHE_LOCATION', default='verification'),
+        # Comfortably more than the staff roster
+        'OPTIONS': {'MAX_ENTRIES': config('VERIFY_CACHE_MAX_ENTRIES', default=20000, cast=int)},
+    },
+    'verification_generation': {
+        'BACKEND': config('VERIFY_GENERATION_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('VERIFY_GENERATION_CACHE_LOCATION', default=str(BASE_DIR / 'cache' / 'verification')),
+    },
+    'timing': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('SERVER_TIMING_CACHE_LOCATION', default=str(BASE_DIR / 'cache' / 'timing')),
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+VERIFY_CACHE_ALIAS = 'verification'
+VERIFY_GENERATION_CACHE_ALIAS = 'verification_generation'
+VERIFY_CACHE_TTL = config('VERIFY_CACHE_TTL', default=60, cast=int)
+
+# Buffered VerificationLog writes (overflow: 'flush' in the request or 'drop');
+# kiosk batch requests are always written in the request as one insert
+VERIFICATION_LOG_BUFFERED = config('VERIFICATION_LOG_BUFFERED', default=True, cast=bool)
+VERIFICATION_LOG_BATCH_SIZE = config('VERIFICATION_LOG_BATCH_SIZE', default=200, cast=int)
+VERIFICATION_LOG_FLUSH_INTERVAL = config('VERIFICATION_LOG_FLUSH_INTERVAL', default=2.0, cast=float)
+VERIFICATION_LOG_MAX_QUEUE = config('VERIFICATION_LOG_MAX_QUEUE', default=10000, cast=int)
+VERIFICATION_LOG_OVERFLOW = config('VERIFICATION_LOG_OVERFLOW', default='flush')
+
+# Most UUIDs/staff IDs a kiosk may send to the batch verification API (/verify/batch/)
+VERIFY_BATCH_MAX_IDS = config('VERIFY_BATCH_MAX_IDS', default=500, cast=int)
+# Gate kiosk API keys for the batch endpoint, as comma-separated username=key
+# pairs; a kiosk sends "Authorization: Bearer <key>" and its scans are logged
+# as that (active) user
+VERIFY_KIOSK_KEYS = config('VERIFY_KIOSK_KEYS', default='', cast=Csv())
+
+# Offline kiosk roster sync (/verify/roster/ snapshot, /verify/roster/changes/ deltas):
+# rows saved in the last ROSTER_SYNC_LAG_SECONDS wait for the next sync so late
+# commits are never skipped (the same goes for revocation events, here and in
+# /verify/revocations/); ROSTER_DELTA_LIMIT caps the rows per delta response
+ROSTER_SYNC_LAG_SECONDS = config('ROSTER_SYNC_LAG_SECONDS', default=5, cast=int)
+ROSTER_DELTA_LIMIT = config('ROSTER_DELTA_LIMIT', default=5000, cast=int)
+
+# VerificationLog storage (see the verification_log_maintenance command)
+VERIFICATION_LOG_RETENTION_DAYS = config('VERIFICATION_LOG_RETENTION_DAYS', default=0, cast=int)
+VERIFICATION_LOG_PARTITION_MONTHS_AHEAD = config('VERIFICATION_LOG_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+
+# How templates and PDFs embed QR codes: 'file' links the stored PNG, 'png' or
+# 'svg' inline a data: URI rendered in memory (no media round-trip)
+QR_CODE_EMBED = config('QR_CODE_EMBED', default='file')
+
+# Offline verification: 'signed' adds an Ed25519-signed token to every QR code
+# (generate a key with manage.py generate_qr_signing_key)
+QR_PAYLOAD_MODE = config('QR_PAYLOAD_MODE', default='url')
+QR_SIGNING_KEY = config('QR_SIGNING_KEY', default='')
+
+# ID card PDF engine: 'html' renders card_pdf_output.html with xhtml2pdf,
+# 'reportlab' draws the same layout directly (much faster)
+CARD_PDF_ENGINE = config('CARD_PDF_ENGINE', default='html')
+
+# Load the PDF/QR engines when a gunicorn worker starts instead of on its first
+# PDF request (gunicorn.conf.py); turn on only for workers serving PDF routes
+PDF_WARM_UP = config('PDF_WARM_UP', default=False, cast=bool)
+
+# Background jobs in the database (run `manage.py run_jobs`): with BACKGROUND_JOBS
+# on, saves queue QR codes and photo renditions instead of drawing them inline and
+# the detail page prepares card/sticker PDFs as jobs. Failures retry after
+# JOB_RETRY_DELAY * 2**(attempt - 1) seconds; jobs running longer than JOB_TIMEOUT
+# are assumed to have lost their worker. PDF jobs leave their result in the
+# worker's PDF_CACHE_DIR: run workers on the web hosts, or put PDF_CACHE_DIR on
+# shared disk, or downloads render the PDF again
+BACKGROUND_JOBS = config('BACKGROUND_JOBS', default=False, cast=bool)
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=5, cast=int)
+JOB_RETRY_DELAY = config('JOB_RETRY_DELAY', default=10, cast=int)
+JOB_TIMEOUT = config('JOB_TIMEOUT', default=600, cast=int)
+JOB_POLL_INTERVAL = config('JOB_POLL_INTERVAL', default=1.0, cast=float)
+
+# Paper size for N-up card and sticker print sheets: A4, A3 or LETTER
+IMPOSITION_PAPER = config('IMPOSITION_PAPER', default='A4')
+
+# Request timing: Server-Timing headers (staff users only, unless DEBUG),
+# 'staff.timing' log lines at DEBUG level and the per-endpoint histograms on
+# the timing stats page, kept for the last SERVER_TIMING_WINDOW_MINUTES in a
+# cache shared by the host's workers. Set SERVER_TIMING_LOG_LEVEL=DEBUG to
+# log every request
+SERVER_TIMING = config('SERVER_TIMING', default=True, cast=bool)
+SERVER_TIMING_WINDOW_MINUTES = config('SERVER_TIMING_WINDOW_MINUTES', default=60, cast=int)
+SERVER_TIMING_CACHE_ALIAS = config('SERVER_TIMING_CACHE_ALIAS', default='timing')
+SERVER_TIMING_LOG_LEVEL = config('SERVER_TIMING_LOG_LEVEL', default='INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'staff.timing': {'handlers': ['console'], 'level': SERVER_TIMING_LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# Cards expiring within this many days are listed on the expiring report
+# (the expire_staff command flips passed ones to 'expired'; run it daily)
+EXPIRY_WARNING_DAYS = config('EXPIRY_WARNING_DAYS', default=30, cast=int)
+
+# Verification analytics (staff.analytics): hourly counts per department and gate
+# are added from the log past a verified_at watermark, skipping the last
+# ANALYTICS_LAG_SECONDS so buffered log writes land first. The dashboard catches
+# up when they are more than ANALYTICS_REFRESH_SECONDS behind (0: only
+# `manage.py refresh_verification_stats` refreshes them).
+ANALYTICS_LAG_SECONDS = config('ANALYTICS_LAG_SECONDS', default=60, cast=int)
+ANALYTICS_REFRESH_SECONDS = config('ANALYTICS_REFRESH_SECONDS', default=60, cast=int)
+# Gates are kiosk addresses or networks, as comma-separated name=address pairs
+# (e.g. "Main gate=10.0.1.0/24,Staff entrance=10.0.2.15"); scans from anywhere
+# else, such as phones on the public verify page, are counted as "Other"
+VERIFICATION_GATES = config('VERIFICATION_GATES', default='', cast=Csv())
+# An hour is unusual when its count is ANALYTICS_ALERT_RATIO times above or below
+# the mean for the same weekday and hour over the previous ANALYTICS_ALERT_WEEKS
+# weeks; hours where both are under ANALYTICS_ALERT_MIN_COUNT are ignored
+ANALYTICS_ALERT_RATIO = config('ANALYTICS_ALERT_RATIO', default=3.0, cast=float)
+ANALYTICS_ALERT_MIN_COUNT = config('ANALYTICS_ALERT_MIN_COUNT', default=20, cast=int)
+ANALYTICS_ALERT_WEEKS = config('ANALYTICS_ALERT_WEEKS', default=4, cast=int)